@@ -6,9 +6,18 @@ import yaml
 from yaml.loader import SafeLoader
 import streamlit_authenticator as stauth
 import json
+import os
+import time
+import tempfile
+import importlib.util
 
 # Importar nuestro módulo de base de datos mejorado
 import database_enhanced as db
+import statement_import
+import data_export
+import settlements
+import forecast
+import profiler
 
 # --- CONFIGURACIÓN DE PÁGINA RESPONSIVE ---
 st.set_page_config(
@@ -82,7 +91,19 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# --- PERFILADO DE RERUNS ---
+# Con FINFAM_PROFILE=1 o ?profile=1 se mide cada sección de cada rerun. Los
+# contadores de SQL son del proceso: con varias sesiones activas a la vez
+# incluyen consultas de las demás.
+rerun_profiler = st.session_state.setdefault('rerun_profiler', profiler.RerunProfiler(counters={
+    'db_ms': lambda: db.query_stats.total_ms,
+    'queries': lambda: db.query_stats.calls,
+}))
+rerun_profiler.enabled = os.environ.get("FINFAM_PROFILE") == "1" or st.query_params.get("profile") == "1"
+rerun_profiler.start_rerun()
+
 # --- LÓGICA DE AUTENTICACIÓN ---
+rerun_profiler.step("auth: config.yaml")
 try:
     with open('config.yaml') as file:
         config = yaml.load(file, Loader=SafeLoader)
@@ -106,6 +127,7 @@ authenticator = stauth.Authenticate(
 )
 
 # --- PANTALLA DE LOGIN ---
+rerun_profiler.step("auth: login")
 authenticator.login()
 
 if not st.session_state.get("authentication_status"):
@@ -116,17 +138,83 @@ if not st.session_state.get("authentication_status"):
     st.stop()
 
 # --- INICIALIZACIÓN DE USUARIO ---
+rerun_profiler.step("usuario")
 current_username = st.session_state["username"]
 current_name = st.session_state["name"]
 
 # Asegurar que el usuario existe en la base de datos
 db.add_user_if_not_exists(current_username, current_name)
 
+# --- CACHÉ DE DATOS POR USUARIO ---
+# Cada dataset se cachea por (dataset, usuario, versión). Una escritura sólo
+# incrementa la versión de los datasets y usuarios que tocó, así el resto de
+# las sesiones del servidor sigue usando su caché.
+DATASET_LOADERS = {
+    'transactions': lambda username: db.get_transactions_with_details(username),
+    'categories': lambda username: db.get_data_as_dataframe('categories', username),
+    'payment_methods': lambda username: db.get_data_as_dataframe('payment_methods', username),
+    'budgets': lambda username: db.get_budgets_with_details(username),
+    'pending_splits': lambda username: db.get_pending_splits_for_user(username),
+    'savings_goals': lambda username: db.get_savings_goals(username),
+}
+
+# Datasets derivados de otros: su versión incluye la de sus dependencias
+DATASET_DEPENDENCIES = {
+    'budgets': ['transactions'],
+    'savings_goals': ['transactions'],
+}
+
+@st.cache_resource
+def get_dataset_versions():
+    """Versiones de cada (usuario, dataset), compartidas por todo el servidor."""
+    return {}
+
+@st.cache_data(ttl=600, max_entries=1000, show_spinner=False)
+def load_dataset(dataset, username, version):
+    return DATASET_LOADERS[dataset](username)
+
+def dataset_version(dataset, username=None):
+    """Versión de un dataset del usuario, incluyendo la de sus dependencias."""
+    username = username or current_username
+    versions = get_dataset_versions()
+    return tuple(versions.get((username, name), 0)
+                 for name in [dataset] + DATASET_DEPENDENCIES.get(dataset, []))
+
+def get_dataset(dataset, username=None):
+    """Obtiene un dataset del usuario desde la caché, cargándolo si cambió."""
+    username = username or current_username
+    return load_dataset(dataset, username, dataset_version(dataset, username))
+
+@st.cache_data(ttl=600, max_entries=1000, show_spinner=False)
+def run_cached_query(query_name, username, version, **params):
+    return getattr(db, query_name)(username, **params)
+
+def get_user_query(query_name, depends_on, **params):
+    """Ejecuta una consulta de db cacheada con la versión del dataset del que depende."""
+    version = get_dataset_versions().get((current_username, depends_on), 0)
+    return run_cached_query(query_name, current_username, version, **params)
+
+@st.cache_data(ttl=600, max_entries=1000, show_spinner=False)
+def load_forecast(username, version, horizon_months):
+    return forecast.get_cash_flow_forecast(username, horizon_months)
+
+def get_forecast(horizon_months):
+    """Proyección de flujo de caja cacheada hasta que cambien transacciones o presupuestos."""
+    return load_forecast(current_username, dataset_version('budgets'), horizon_months)
+
+def invalidate_datasets(usernames, *datasets):
+    """Invalida sólo los datasets indicados de los usuarios indicados."""
+    versions = get_dataset_versions()
+    for username in set(usernames):
+        for dataset in datasets:
+            versions[(username, dataset)] = time.time_ns()
+
 # Verificar si es la primera vez del usuario
 tutorial_progress = db.get_tutorial_progress(current_username)
 is_first_time = len(tutorial_progress) == 0
 
 # --- APLICACIÓN PRINCIPAL ---
+rerun_profiler.step("sidebar")
 with st.sidebar:
     st.title(f"Bienvenido, {current_name} 👋")
     
@@ -139,7 +227,7 @@ with st.sidebar:
         st.caption(f"Tutorial: {completed_steps}/{total_steps} pasos completados")
     
     # Mostrar pagos pendientes
-    pending_splits = db.get_pending_splits_for_user(current_username)
+    pending_splits = get_dataset('pending_splits')
     if not pending_splits.empty:
         st.warning(f"💰 Tienes {len(pending_splits)} pagos pendientes")
     
@@ -148,6 +236,7 @@ with st.sidebar:
 st.title("💰 FinFam: Tu Centro de Control Financiero")
 
 # --- TUTORIAL INTERACTIVO ---
+rerun_profiler.step("tutorial")
 if is_first_time or not tutorial_progress.get('tutorial_completed', False):
     st.markdown("""
     <div class="tutorial-card">
@@ -157,29 +246,33 @@ if is_first_time or not tutorial_progress.get('tutorial_completed', False):
     """, unsafe_allow_html=True)
     
     with st.expander("📚 Tutorial de Configuración Inicial", expanded=True):
-        tutorial_tabs = st.tabs([
+        # Sólo se ejecuta el paso seleccionado
+        tutorial_steps = [
             "1️⃣ Datos Básicos",
             "2️⃣ Categorías",
             "3️⃣ Métodos de Pago", 
             "4️⃣ Primera Transacción",
             "5️⃣ Presupuesto"
-        ])
+        ]
+        tutorial_step = st.radio("Paso", tutorial_steps, horizontal=True, key="tutorial_step",
+                                 label_visibility="collapsed")
         
-        with tutorial_tabs[0]:
+        if tutorial_step == tutorial_steps[0]:
             st.subheader("Paso 1: Configuración Inicial")
             st.write("Vamos a crear tus categorías y métodos de pago por defecto.")
             
             if st.button("✅ Crear configuración por defecto"):
                 db.create_default_categories_and_methods(current_username)
                 db.update_tutorial_step(current_username, 'basic_setup', True)
+                invalidate_datasets([current_username], 'categories', 'payment_methods')
                 st.success("¡Configuración básica completada!")
                 st.rerun()
         
-        with tutorial_tabs[1]:
+        if tutorial_step == tutorial_steps[1]:
             st.subheader("Paso 2: Revisar Categorías")
             st.write("Estas son tus categorías por defecto. Puedes modificarlas en la pestaña Configuración.")
             
-            categories = db.get_data_as_dataframe('categories', current_username)
+            categories = get_dataset('categories')
             if not categories.empty:
                 for _, cat in categories.iterrows():
                     st.write(f"{cat.get('icon', '📁')} {cat['name']} ({cat['type']})")
@@ -188,11 +281,11 @@ if is_first_time or not tutorial_progress.get('tutorial_completed', False):
                     db.update_tutorial_step(current_username, 'categories_review', True)
                     st.success("¡Paso completado!")
         
-        with tutorial_tabs[2]:
+        if tutorial_step == tutorial_steps[2]:
             st.subheader("Paso 3: Métodos de Pago")
             st.write("Revisa tus métodos de pago disponibles.")
             
-            methods = db.get_data_as_dataframe('payment_methods', current_username)
+            methods = get_dataset('payment_methods')
             if not methods.empty:
                 for _, method in methods.iterrows():
                     st.write(f"💳 {method['name']} ({method.get('type', 'N/A')})")
@@ -201,7 +294,7 @@ if is_first_time or not tutorial_progress.get('tutorial_completed', False):
                     db.update_tutorial_step(current_username, 'payment_methods_review', True)
                     st.success("¡Paso completado!")
         
-        with tutorial_tabs[3]:
+        if tutorial_step == tutorial_steps[3]:
             st.subheader("Paso 4: Tu Primera Transacción")
             st.write("¡Registra tu primera transacción para familiarizarte con el sistema!")
             
@@ -210,7 +303,7 @@ if is_first_time or not tutorial_progress.get('tutorial_completed', False):
             else:
                 st.info("Ve a la pestaña 'Registrar Transacción' para completar este paso.")
         
-        with tutorial_tabs[4]:
+        if tutorial_step == tutorial_steps[4]:
             st.subheader("Paso 5: Define tu Primer Presupuesto")
             st.write("Establece un presupuesto mensual para comenzar a controlar tus gastos.")
             
@@ -220,30 +313,18 @@ if is_first_time or not tutorial_progress.get('tutorial_completed', False):
                 st.info("Ve a la pestaña 'Gestionar Presupuestos' para completar este paso.")
 
 # --- CARGA DE DATOS ---
-@st.cache_data(ttl=60)
-def load_data():
-    data = {
-        'transactions': db.get_transactions_with_details(current_username),
-        'categories': db.get_data_as_dataframe('categories', current_username),
-        'payment_methods': db.get_data_as_dataframe('payment_methods', current_username),
-        'budgets': db.get_budgets_with_details(),
-        'pending_splits': db.get_pending_splits_for_user(current_username)
-    }
-    return data
+HISTORY_PAGE_SIZE = 100
+SEARCH_RESULTS_LIMIT = 200
 
-app_data = load_data()
-
-# --- PESTAÑAS PRINCIPALES ---
-main_tabs = st.tabs([
-    "📊 Dashboard",
-    "💸 Registrar",
-    "👥 Gastos Compartidos",
-    "🎯 Presupuestos",
-    "⚙️ Configuración"
-])
+def load_data(datasets):
+    """Carga desde la caché sólo los datasets que declara la sección activa."""
+    return {dataset: get_dataset(dataset) for dataset in datasets}
 
 # --- PESTAÑA 1: DASHBOARD ---
-with main_tabs[0]:
+TREND_GRANULARITIES = {'day': 'Día', 'week': 'Semana'}
+
+def render_dashboard(app_data):
+    """Indicadores y gráficos del mes (desde el resumen mensual)."""
     st.header("📊 Análisis Financiero")
     
     # Filtros responsive
@@ -251,8 +332,8 @@ with main_tabs[0]:
     today = datetime.today()
     
     with col_filt1:
-        years_with_data = app_data['transactions']['date'].dt.year.unique() if not app_data['transactions'].empty else []
-        available_years = sorted(list(set(years_with_data) | {today.year}), reverse=True)
+        years_with_data = get_user_query('get_years_with_data', 'transactions')
+        available_years = sorted(set(years_with_data) | {today.year}, reverse=True)
         selected_year = st.selectbox("📅 Año", available_years)
     
     with col_filt2:
@@ -264,30 +345,17 @@ with main_tabs[0]:
     with col_filt3:
         view_mode = st.selectbox("👁️ Vista", ["Solo mis transacciones", "Incluir gastos compartidos"])
 
-    # Filtrar transacciones
-    transactions_df = app_data['transactions']
-    if not transactions_df.empty:
-        trans_mes = transactions_df[
-            (transactions_df['date'].dt.year == selected_year) &
-            (transactions_df['date'].dt.month == selected_month_num)
-        ]
-        
-        if view_mode == "Solo mis transacciones":
-            trans_mes = trans_mes[trans_mes['is_shared'] == False]
-    else:
-        trans_mes = pd.DataFrame()
-
-    # Calcular métricas
-    if not trans_mes.empty:
-        ingresos_mes = trans_mes[trans_mes['type'] == 'Ingreso']
-        gastos_mes = trans_mes[trans_mes['type'] == 'Gasto']
-        
-        total_ingresos = ingresos_mes['amount'].sum()
-        total_gastos = gastos_mes['amount'].sum()
-        balance = total_ingresos - total_gastos
-        tasa_ahorro = (balance / total_ingresos) if total_ingresos > 0 else 0
-    else:
-        total_ingresos = total_gastos = balance = tasa_ahorro = 0
+    # Métricas desde el resumen mensual materializado
+    summary_params = {
+        'year': selected_year,
+        'month': selected_month_num,
+        'include_shared': view_mode == "Incluir gastos compartidos",
+    }
+    totals_mes = get_user_query('get_monthly_totals', 'transactions', **summary_params)
+    total_ingresos = totals_mes['Ingreso']
+    total_gastos = totals_mes['Gasto']
+    balance = total_ingresos - total_gastos
+    tasa_ahorro = (balance / total_ingresos) if total_ingresos > 0 else 0
 
     # KPIs responsive
     st.subheader("💡 Indicadores del Mes")
@@ -303,41 +371,171 @@ with main_tabs[0]:
     st.markdown("---")
 
     # Visualizaciones responsive
-    if not trans_mes.empty and not gastos_mes.empty:
+    gastos_por_cat = get_user_query('get_category_totals', 'transactions', **summary_params)
+    if not gastos_por_cat.empty:
         viz_cols = st.columns([1, 1])
         
         with viz_cols[0]:
             st.subheader("🥧 Gastos por Categoría")
-            gastos_por_cat = gastos_mes.groupby('category')['amount'].sum().reset_index()
             
-            chart = alt.Chart(gastos_por_cat).mark_arc(innerRadius=50, outerRadius=100).encode(
-                theta=alt.Theta(field="amount", type="quantitative"),
-                color=alt.Color(field="category", type="nominal", 
-                              scale=alt.Scale(scheme='category20')),
-                tooltip=['category:N', alt.Tooltip('amount:Q', format=',.0f')]
-            ).properties(height=300)
-            
-            st.altair_chart(chart, use_container_width=True)
+            with rerun_profiler.section("gráfico: categorías"):
+                chart = alt.Chart(gastos_por_cat).mark_arc(innerRadius=50, outerRadius=100).encode(
+                    theta=alt.Theta(field="amount", type="quantitative"),
+                    color=alt.Color(field="category", type="nominal", 
+                                  scale=alt.Scale(scheme='category20')),
+                    tooltip=['category:N', alt.Tooltip('amount:Q', format=',.0f')]
+                ).properties(height=300)
+                
+                st.altair_chart(chart, use_container_width=True)
         
         with viz_cols[1]:
-            st.subheader("📈 Tendencia Semanal")
-            trans_mes_copy = trans_mes.copy()
-            trans_mes_copy['week'] = trans_mes_copy['date'].dt.isocalendar().week
-            weekly_data = trans_mes_copy.groupby(['week', 'type'])['amount'].sum().reset_index()
-            
-            line_chart = alt.Chart(weekly_data).mark_line(point=True).encode(
-                x=alt.X('week:O', title='Semana'),
-                y=alt.Y('amount:Q', title='Monto ($)'),
-                color=alt.Color('type:N', title='Tipo'),
-                tooltip=['week:O', 'type:N', alt.Tooltip('amount:Q', format=',.0f')]
-            ).properties(height=300)
-            
-            st.altair_chart(line_chart, use_container_width=True)
+            st.subheader("📈 Tendencia del Mes")
+            trend_granularity = st.radio("Agrupar por", list(TREND_GRANULARITIES), index=1, horizontal=True,
+                                         format_func=TREND_GRANULARITIES.get, key="month_trend_granularity")
+            with rerun_profiler.section("gráfico: tendencia del mes"):
+                month_start = datetime(selected_year, selected_month_num, 1)
+                month_end = month_start + pd.offsets.MonthEnd(0)
+                trend_data = get_user_query('get_trend_series', 'transactions', date_from=month_start,
+                                            date_to=month_end, granularity=trend_granularity,
+                                            include_shared=summary_params['include_shared'])
+
+                line_chart = alt.Chart(trend_data[['period', 'type', 'amount']]).mark_line(point=True).encode(
+                    x=alt.X('period:T', title=TREND_GRANULARITIES[trend_granularity],
+                            axis=alt.Axis(format='%d/%m')),
+                    y=alt.Y('amount:Q', title='Monto ($)'),
+                    color=alt.Color('type:N', title='Tipo'),
+                    tooltip=[alt.Tooltip('period:T', title='Desde', format='%d/%m/%Y'), 'type:N',
+                             alt.Tooltip('amount:Q', format=',.0f')]
+                ).properties(height=300)
+                
+                st.altair_chart(line_chart, use_container_width=True)
     else:
         st.info("📝 Registra algunas transacciones para ver tus análisis aquí.")
 
+    st.markdown("---")
+    with rerun_profiler.section("tendencia plurianual"):
+        render_multi_year_trend(available_years, summary_params['include_shared'])
+
+    st.markdown("---")
+    with rerun_profiler.section("proyección de flujo de caja"):
+        render_forecast()
+
+def render_multi_year_trend(available_years, include_shared):
+    """Evolución mensual o anual de varios años y comparación interanual.
+
+    Los datos llegan agregados desde SQL (a lo sumo db.CHART_MAX_POINTS
+    períodos por serie) y a cada gráfico sólo se le pasan las columnas que
+    usa, para que la especificación enviada al navegador sea chica.
+    """
+    st.subheader("📆 Tendencia Plurianual")
+    years = sorted(available_years)
+    trend_cols = st.columns([2, 1])
+    with trend_cols[0]:
+        year_from, year_to = st.select_slider("Años", options=years, value=(years[max(0, len(years) - 3)], years[-1]),
+                                              key="multi_year_range")
+    with trend_cols[1]:
+        trend_view = st.radio("Vista", ["Mensual", "Anual", "Interanual"], horizontal=True, key="multi_year_view")
+
+    if trend_view == "Anual":
+        yearly = get_user_query('get_trend_series', 'transactions', date_from=datetime(year_from, 1, 1),
+                                date_to=datetime(year_to, 12, 31), granularity='year',
+                                include_shared=include_shared)
+        yearly['year'] = yearly['period'].dt.year
+        chart = alt.Chart(yearly[['year', 'type', 'amount']]).mark_bar().encode(
+            x=alt.X('year:O', title='Año'),
+            xOffset='type:N',
+            y=alt.Y('amount:Q', title='Monto ($)'),
+            color=alt.Color('type:N', title='Tipo'),
+            tooltip=['year:O', 'type:N', alt.Tooltip('amount:Q', format=',.0f')]
+        ).properties(height=320)
+        st.altair_chart(chart, use_container_width=True)
+        return
+
+    monthly = get_user_query('get_monthly_trend', 'transactions', year_from=year_from, year_to=year_to,
+                             include_shared=include_shared)
+    if trend_view == "Mensual":
+        base = alt.Chart(monthly[['period', 'type', 'amount', 'rolling_12m']]).encode(
+            x=alt.X('period:T', title='Mes', axis=alt.Axis(format='%m/%Y')),
+            color=alt.Color('type:N', title='Tipo'),
+        )
+        lines = base.mark_line(point=True, opacity=0.6).encode(
+            y=alt.Y('amount:Q', title='Monto ($)'),
+            tooltip=[alt.Tooltip('period:T', title='Mes', format='%m/%Y'), 'type:N',
+                     alt.Tooltip('amount:Q', format=',.0f'),
+                     alt.Tooltip('rolling_12m:Q', format=',.0f', title='Promedio 12 meses')]
+        )
+        rolling = base.mark_line(strokeDash=[6, 3]).encode(y='rolling_12m:Q')
+        st.altair_chart((lines + rolling).properties(height=320), use_container_width=True)
+        st.caption("La línea punteada es el promedio móvil de los últimos 12 meses.")
+        return
+
+    trans_type = st.radio("Tipo", list(db.CHART_TYPES), index=1, horizontal=True, key="multi_year_type")
+    comparison = monthly.loc[monthly['type'] == trans_type,
+                             ['year', 'month', 'amount', 'previous_year_amount', 'yoy_change']]
+    chart = alt.Chart(comparison).mark_line(point=True).encode(
+        x=alt.X('month:O', title='Mes'),
+        y=alt.Y('amount:Q', title='Monto ($)'),
+        color=alt.Color('year:O', title='Año', scale=alt.Scale(scheme='viridis')),
+        tooltip=['year:O', 'month:O', alt.Tooltip('amount:Q', format=',.0f'),
+                 alt.Tooltip('previous_year_amount:Q', format=',.0f', title='Año anterior'),
+                 alt.Tooltip('yoy_change:Q', format='+.1%', title='Variación interanual')]
+    ).properties(height=320)
+    st.altair_chart(chart, use_container_width=True)
+
+def render_forecast():
+    """Proyección de flujo de caja y simulación de compras en cuotas."""
+    st.subheader("🔮 Proyección de Flujo de Caja")
+    horizon_months = st.radio("Horizonte", [6, 12, 24], index=1, horizontal=True,
+                              format_func=lambda x: f"{x} meses", key="forecast_horizon")
+    cash_flow = get_forecast(horizon_months)
+    projection = cash_flow['projection']
+
+    if cash_flow['recurring'].empty:
+        st.info("📝 Aún no hay movimientos recurrentes (mínimo "
+                f"{forecast.MIN_RECURRING_MONTHS} de los últimos {forecast.LOOKBACK_MONTHS} meses) "
+                "para proyectar ingresos y gastos fijos.")
+
+    forecast_cols = st.columns(3)
+    with forecast_cols[0]:
+        st.metric("💼 Saldo actual", f"${cash_flow['starting_balance']:,.0f}")
+    with forecast_cols[1]:
+        st.metric("📆 Saldo proyectado", f"${projection['balance'].iloc[-1]:,.0f}")
+    with forecast_cols[2]:
+        st.metric("💳 Cuotas comprometidas", f"${projection['installments'].sum():,.0f}")
+
+    with st.expander("🛒 ¿Puedo pagarlo en cuotas?"):
+        sim_cols = st.columns(2)
+        with sim_cols[0]:
+            purchase_amount = st.number_input("Monto de la compra", min_value=0.0, step=1000.0,
+                                              key="forecast_purchase_amount")
+        with sim_cols[1]:
+            purchase_installments = st.number_input("Cuotas", min_value=1, max_value=48, value=6,
+                                                    key="forecast_purchase_installments")
+        if purchase_amount > 0:
+            projection, min_balance, affordable = forecast.simulate_purchase(
+                projection, purchase_amount, int(purchase_installments))
+            if affordable:
+                st.success(f"✅ Es pagable: el saldo mínimo proyectado sería ${min_balance:,.0f}.")
+            else:
+                st.error(f"⚠️ El saldo quedaría negativo (mínimo ${min_balance:,.0f}).")
+
+    balance_chart = alt.Chart(projection).mark_area(opacity=0.4, line=True).encode(
+        x=alt.X('yearmonth(month):T', title='Mes'),
+        y=alt.Y('balance:Q', title='Saldo proyectado ($)'),
+        tooltip=[alt.Tooltip('yearmonth(month):T', title='Mes'),
+                 alt.Tooltip('net:Q', format=',.0f', title='Neto'),
+                 alt.Tooltip('installments:Q', format=',.0f', title='Cuotas'),
+                 alt.Tooltip('balance:Q', format=',.0f', title='Saldo')]
+    ).properties(height=300)
+    st.altair_chart(balance_chart, use_container_width=True)
+
+    if not cash_flow['recurring'].empty:
+        with st.expander("🔁 Movimientos recurrentes detectados"):
+            st.dataframe(cash_flow['recurring'], hide_index=True, use_container_width=True)
+
 # --- PESTAÑA 2: REGISTRAR TRANSACCIÓN ---
-with main_tabs[1]:
+def render_register(app_data):
+    """Formulario de transacciones, cuotas pendientes e importación de extractos."""
     st.header("💸 Registrar Nueva Transacción")
     
     trans_type = st.radio("Tipo de Transacción", ["Gasto", "Ingreso"], horizontal=True)
@@ -395,7 +593,10 @@ with main_tabs[1]:
                     total_amount=monto_total
                 )
                 
-                st.success("✅ ¡Transacción registrada exitosamente!")
+                if cuotas > 1:
+                    st.success(f"✅ ¡Compra registrada en {cuotas} cuotas!")
+                else:
+                    st.success("✅ ¡Transacción registrada exitosamente!")
                 
                 # Marcar paso del tutorial como completado
                 if not tutorial_progress.get('first_transaction', False):
@@ -403,35 +604,192 @@ with main_tabs[1]:
                     st.balloons()
                     st.info("🎉 ¡Completaste el paso 4 del tutorial!")
                 
-                st.cache_data.clear()
+                invalidate_datasets([current_username], 'transactions')
                 
             except Exception as e:
                 st.error(f"❌ Error al registrar la transacción: {e}")
+    
+    with st.expander("💳 Cuotas pendientes por tarjeta"):
+        pending_installments = get_user_query('get_outstanding_installments', 'transactions')
+        if pending_installments.empty:
+            st.info("No tienes compras en cuotas pendientes.")
+        else:
+            st.dataframe(
+                pending_installments,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "purchase_id": None,
+                    "payment_method": "Método",
+                    "category": "Categoría",
+                    "details": "Detalle",
+                    "original_amount": st.column_config.NumberColumn("Total compra", format="$ %.0f"),
+                    "installments_total": "Cuotas",
+                    "installments_remaining": "Restantes",
+                    "amount_remaining": st.column_config.NumberColumn("Monto restante", format="$ %.0f"),
+                    "next_date": "Próxima cuota",
+                    "last_date": "Última cuota"
+                }
+            )
+    
+    with st.expander("📥 Importar extracto bancario o de tarjeta (CSV/OFX)"):
+        statement_file = st.file_uploader("Archivo del extracto", type=["csv", "ofx", "qfx"], key="statement_file")
+        import_cols = st.columns(2)
+        with import_cols[0]:
+            import_method = st.selectbox("💳 Método de pago del extracto", app_data['payment_methods']['name'].unique(),
+                                         key="import_method")
+            is_card_statement = st.checkbox("Es un resumen de tarjeta (montos positivos = gastos)", key="import_is_card")
+        with import_cols[1]:
+            expense_names = app_data['categories'][app_data['categories']['type'] == 'Gasto']['name'].unique()
+            income_names = app_data['categories'][app_data['categories']['type'] == 'Ingreso']['name'].unique()
+            import_expense_cat = st.selectbox("🏷️ Categoría de gasto por defecto", expense_names, key="import_expense_cat")
+            import_income_cat = st.selectbox("🏷️ Categoría de ingreso por defecto", income_names, key="import_income_cat")
+        import_rules_text = st.text_area(
+            "Reglas de categorización (una por línea: palabra clave = categoría)",
+            placeholder="supermercado = Alimentación\nuber = Transporte",
+            key="import_rules"
+        )
+        
+        if statement_file is not None and st.button("📥 Importar", use_container_width=True):
+            category_rules = {}
+            for rule in import_rules_text.splitlines():
+                if '=' in rule:
+                    keyword, category = rule.split('=', 1)
+                    category_rules[keyword.strip()] = category.strip()
+            
+            import_progress = st.progress(0.0, text="Importando...")
+            try:
+                result = statement_import.import_statement(
+                    statement_file,
+                    statement_file.name,
+                    current_username,
+                    payment_method_name=import_method,
+                    default_expense_category=import_expense_cat,
+                    default_income_category=import_income_cat,
+                    category_rules=category_rules,
+                    negative_is_expense=not is_card_statement,
+                    progress_callback=lambda fraction, rows: import_progress.progress(
+                        fraction, text=f"Importando... {rows:,} filas leídas"
+                    )
+                )
+                invalidate_datasets([current_username], 'transactions')
+                st.success(f"✅ {result['inserted']:,} transacciones importadas, "
+                           f"{result['duplicates']:,} duplicadas omitidas.")
+                if result['errors']:
+                    st.warning(f"⚠️ {len(result['errors'])} filas con errores:")
+                    st.dataframe(pd.DataFrame(result['errors'], columns=["Línea", "Error"]), hide_index=True)
+            except Exception as e:
+                st.error(f"❌ Error al importar el extracto: {e}")
 
 # --- PESTAÑA 3: GASTOS COMPARTIDOS ---
-with main_tabs[2]:
+def render_shared_expenses(app_data):
+    """Pagos pendientes y registro de gastos compartidos."""
     st.header("👥 Gestión de Gastos Compartidos")
     
+    # Balance del hogar: deudas netas y transferencias mínimas para saldarlas
+    household = list(config['credentials']['usernames'].keys())
+    user_names = {username: details.get('name', username)
+                  for username, details in config['credentials']['usernames'].items()}
+    with rerun_profiler.section("plan de saldos"):
+        plan = settlements.get_settlement_plan(usernames=household)
+    
+    if not plan['transfers'].empty:
+        st.subheader("⚖️ Balance del Hogar")
+        my_balance = plan['net'].loc[plan['net']['username'] == current_username, 'balance'].sum()
+        if my_balance > 0:
+            st.metric("Te deben en total", f"${my_balance:,.0f}")
+        elif my_balance < 0:
+            st.metric("Debes en total", f"${-my_balance:,.0f}")
+        
+        st.caption(f"Con {len(plan['transfers'])} transferencias se saldan todas las deudas pendientes:")
+        for transfer in plan['transfers'].itertuples():
+            st.write(f"💸 {user_names.get(transfer.payer, transfer.payer)} → "
+                     f"{user_names.get(transfer.receiver, transfer.receiver)}: ${transfer.amount:,.2f}")
+        
+        # Sólo quien paga o recibe alguna transferencia del plan puede confirmarlo
+        in_plan = current_username in set(plan['transfers']['payer']) | set(plan['transfers']['receiver'])
+        confirm_settle = st.checkbox("Confirmo que se realizaron estas transferencias", key="confirm_settle_all",
+                                     disabled=not in_plan)
+        # Se saldan las divisiones del plan que estaba a la vista al confirmar, no las agregadas después
+        if not confirm_settle:
+            st.session_state['settle_max_split_id'] = plan['max_split_id']
+        confirmed_max_split_id = st.session_state.get('settle_max_split_id', 0)
+        plan_changed = confirm_settle and confirmed_max_split_id != plan['max_split_id']
+        if plan_changed:
+            st.warning("Las deudas pendientes cambiaron desde que confirmaste. Revisa el plan y vuelve a confirmar.")
+        if st.button("✅ Saldar todo", disabled=not confirm_settle or plan_changed):
+            affected_users = db.settle_all_splits(usernames=household, max_split_id=confirmed_max_split_id)
+            invalidate_datasets(affected_users, 'pending_splits')
+            del st.session_state['confirm_settle_all']
+            st.success("¡Todas las deudas pendientes fueron saldadas!")
+            st.rerun()
+        
+        st.markdown("---")
+    
     # Mostrar pagos pendientes
-    if not app_data['pending_splits'].empty:
+    pending = app_data['pending_splits']
+    if not pending.empty:
         st.subheader("💰 Pagos Pendientes")
         
-        for _, split in app_data['pending_splits'].iterrows():
-            with st.container():
-                st.markdown(f"""
-                <div class="pending-payment">
-                    <strong>{split['payer_name']}</strong> pagó <strong>${split['amount']:,.0f}</strong><br>
-                    <small>{split['category']} • {split['date']} • {split.get('group_name', 'Sin grupo')}</small><br>
-                    <em>{split['details']}</em>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                col1, col2 = st.columns([3, 1])
-                with col2:
-                    if st.button(f"✅ Marcar como pagado", key=f"pay_{split['id']}"):
-                        db.mark_split_as_paid(split['id'])
-                        st.success("¡Pago registrado!")
-                        st.rerun()
+        st.dataframe(
+            pending,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "id": None,
+                "group_id": None,
+                "payer_username": None,
+                "percentage": None,
+                "payer_name": "Pagó",
+                "amount": st.column_config.NumberColumn("Monto", format="$ %.2f"),
+                "paid_amount": st.column_config.NumberColumn("Pagado", format="$ %.2f"),
+                "outstanding": st.column_config.NumberColumn("Pendiente", format="$ %.2f"),
+                "details": "Detalle",
+                "date": "Fecha",
+                "category": "Categoría",
+                "group_name": "Grupo"
+            }
+        )
+        
+        # Saldar varios pagos en una sola escritura
+        split_labels = {
+            split.id: f"{split.payer_name} • ${split.outstanding:,.2f} • {split.date} • {split.details or split.category}"
+            for split in pending.itertuples()
+        }
+        selected_splits = st.multiselect("Seleccionar pagos", list(split_labels), format_func=split_labels.get,
+                                         key="selected_splits")
+        action_cols = st.columns(2)
+        with action_cols[0]:
+            if st.button("✅ Marcar seleccionados como pagados", disabled=not selected_splits, use_container_width=True):
+                updated, _ = db.update_splits_status('paid', split_ids=selected_splits, username=current_username)
+                invalidate_datasets([current_username], 'pending_splits')
+                st.success(f"¡{updated} pagos registrados!")
+                st.rerun()
+        with action_cols[1]:
+            if st.button("🚫 Cancelar seleccionados", disabled=not selected_splits, use_container_width=True):
+                updated, _ = db.update_splits_status('cancelled', split_ids=selected_splits, username=current_username)
+                invalidate_datasets([current_username], 'pending_splits')
+                st.success(f"{updated} pagos cancelados.")
+                st.rerun()
+        
+        # Pago (total o parcial) a una persona
+        payers = pending.drop_duplicates('payer_username').set_index('payer_username')['payer_name'].to_dict()
+        counterparty_cols = st.columns([2, 2, 1])
+        with counterparty_cols[0]:
+            counterparty = st.selectbox("Pagar a", list(payers), format_func=payers.get, key="settle_counterparty")
+        owed = pending.loc[pending['payer_username'] == counterparty, 'outstanding'].sum()
+        with counterparty_cols[1]:
+            payment_amount = st.number_input(f"Monto (adeudado: ${owed:,.2f})", min_value=0.0, max_value=float(owed),
+                                             value=float(owed), format="%.2f", key="settle_amount")
+        with counterparty_cols[2]:
+            st.write("")
+            if st.button("💸 Registrar pago", use_container_width=True, disabled=payment_amount <= 0):
+                action = 'paid' if payment_amount >= owed - 0.005 else 'partial'
+                updated, _ = db.update_splits_status(action, username=current_username, counterparty=counterparty,
+                                                     partial_amount=payment_amount)
+                invalidate_datasets([current_username], 'pending_splits')
+                st.success(f"¡Pago registrado en {updated} divisiones!")
+                st.rerun()
     
     st.markdown("---")
     
@@ -504,18 +862,36 @@ with main_tabs[2]:
                 )
                 
                 st.success("✅ ¡Gasto compartido registrado exitosamente!")
-                st.cache_data.clear()
+                invalidate_datasets([current_username], 'transactions')
+                invalidate_datasets([u for u in selected_users if u != current_username], 'pending_splits')
                 
             except Exception as e:
                 st.error(f"❌ Error al registrar el gasto compartido: {e}")
 
 # --- PESTAÑA 4: PRESUPUESTOS ---
-with main_tabs[3]:
+def render_budgets(app_data):
+    """Avance de presupuestos del período y editor de presupuestos."""
     st.header("🎯 Gestión de Presupuestos")
     
-    # Obtener presupuestos del usuario
+    # Obtener presupuestos del usuario (con gasto real del período vigente)
     budgets_df = app_data['budgets']
     
+    if not budgets_df.empty:
+        st.subheader("📈 Avance del Período")
+        period_names = {'weekly': 'semana', 'monthly': 'mes', 'yearly': 'año'}
+        for budget in budgets_df.itertuples():
+            used = budget.used_ratio or 0
+            st.progress(
+                min(used, 1.0),
+                text=f"**{budget.category}** ({period_names[budget.period]}): "
+                     f"${budget.spent:,.0f} de ${budget.amount:,.0f} ({used:.0%}) • restan ${budget.remaining:,.0f}"
+            )
+            if budget.spent > budget.amount:
+                st.error(f"🚨 Te pasaste del presupuesto de {budget.category} por ${-budget.remaining:,.0f}.")
+            elif budget.projected > budget.amount:
+                st.warning(f"⚠️ A este ritmo {budget.category} cerrará el período en ${budget.projected:,.0f}.")
+        st.markdown("---")
+    
     st.subheader("📊 Presupuestos Actuales")
     
     # Editor de presupuestos
@@ -536,19 +912,31 @@ with main_tabs[3]:
                     required=True
                 ),
                 "amount": st.column_config.NumberColumn(
-                    "Presupuesto Mensual ($)", 
+                    "Presupuesto ($)", 
                     min_value=0, 
                     format="$ %.0f", 
                     required=True
-                )
+                ),
+                "period": st.column_config.SelectboxColumn(
+                    "Período",
+                    options=["weekly", "monthly", "yearly"],
+                    default="monthly",
+                    required=True
+                ),
+                "start_date": None,
+                "end_date": None,
+                "spent": None,
+                "remaining": None,
+                "used_ratio": None,
+                "projected": None
             },
             key="budget_editor"
         )
         
         if st.button("💾 Guardar Presupuestos", use_container_width=True):
             try:
-                db.sync_budgets_from_dataframe(edited_budgets)
-                st.success("✅ ¡Presupuestos guardados exitosamente!")
+                changes = db.sync_budgets_from_dataframe(edited_budgets, budgets_df, current_username)
+                st.success(f"✅ ¡Presupuestos guardados exitosamente! {format_sync_changes(changes)}")
                 
                 # Marcar paso del tutorial como completado
                 if not tutorial_progress.get('first_budget', False):
@@ -557,21 +945,115 @@ with main_tabs[3]:
                     st.balloons()
                     st.success("🎉 ¡Felicitaciones! Completaste el tutorial completo.")
                 
-                st.cache_data.clear()
+                invalidate_datasets([current_username], 'budgets')
                 
             except Exception as e:
                 st.error(f"❌ Error al guardar presupuestos: {e}")
 
+    st.markdown("---")
+    with rerun_profiler.section("metas de ahorro"):
+        render_savings_goals(app_data)
+
+def render_savings_goals(app_data):
+    """Avance de metas de ahorro, aportes y alta de metas nuevas."""
+    st.subheader("🐷 Metas de Ahorro")
+    goals_df = app_data['savings_goals']
+
+    for goal in goals_df.itertuples():
+        progress = goal.progress if pd.notna(goal.progress) else 0
+        target_text = f" para el {goal.target_date:%d/%m/%Y}" if pd.notna(goal.target_date) else ""
+        st.progress(
+            progress,
+            text=f"**{goal.name}**: ${goal.current_amount:,.0f} de ${goal.target_amount:,.0f}{target_text} ({progress:.0%})"
+        )
+        if goal.remaining <= 0:
+            st.success(f"🎉 ¡Meta {goal.name} cumplida!")
+        elif pd.isna(goal.projected_date):
+            st.caption("Sin aportes recientes para estimar cuándo se cumple.")
+        else:
+            caption = f"A ${goal.monthly_rate:,.0f}/mes se cumpliría el {goal.projected_date:%d/%m/%Y}."
+            if pd.notna(goal.target_date) and not goal.on_track and pd.notna(goal.required_monthly):
+                caption += f" ⚠️ Para llegar a tiempo necesitas ${goal.required_monthly:,.0f}/mes."
+            st.caption(caption)
+
+    if not goals_df.empty:
+        with st.expander("➕ Registrar aporte"):
+            with st.form("goal_contribution_form", clear_on_submit=True):
+                goal_names = dict(zip(goals_df['id'], goals_df['name']))
+                contrib_cols = st.columns(3)
+                with contrib_cols[0]:
+                    goal_id = st.selectbox("Meta", list(goal_names), format_func=goal_names.get)
+                with contrib_cols[1]:
+                    contribution = st.number_input("Monto (negativo para retirar)", step=100.0, format="%.2f")
+                with contrib_cols[2]:
+                    contribution_date = st.date_input("Fecha", datetime.today())
+
+                gasto_categories = app_data['categories'][app_data['categories']['type'] == 'Gasto']
+                register_as_expense = st.checkbox("Registrar también como gasto")
+                expense_cols = st.columns(2)
+                with expense_cols[0]:
+                    expense_category = st.selectbox("Categoría del gasto", gasto_categories['name'].unique())
+                with expense_cols[1]:
+                    expense_method = st.selectbox("Método de pago", app_data['payment_methods']['name'].unique())
+
+                if st.form_submit_button("💾 Guardar aporte", use_container_width=True):
+                    try:
+                        db.add_goal_contribution(
+                            goal_id, current_username, contribution, contribution_date,
+                            category_name=expense_category if register_as_expense and contribution > 0 else None,
+                            payment_method_name=expense_method,
+                        )
+                        st.success("✅ Aporte registrado.")
+                        changed = ['savings_goals', 'transactions'] if register_as_expense else ['savings_goals']
+                        invalidate_datasets([current_username], *changed)
+                        st.rerun()
+                    except ValueError as e:
+                        st.error(f"❌ {e}")
+
+    with st.expander("🆕 Nueva meta de ahorro", expanded=goals_df.empty):
+        with st.form("new_goal_form", clear_on_submit=True):
+            goal_cols = st.columns(3)
+            with goal_cols[0]:
+                goal_name = st.text_input("Nombre", placeholder="Ej: Vacaciones")
+            with goal_cols[1]:
+                goal_target = st.number_input("Objetivo ($)", min_value=0.0, step=1000.0)
+            with goal_cols[2]:
+                goal_date = st.date_input("Fecha objetivo", value=None)
+            goal_description = st.text_input("Descripción (opcional)")
+
+            if st.form_submit_button("🎯 Crear meta", use_container_width=True):
+                if not goal_name or goal_target <= 0:
+                    st.error("❌ Ingresa un nombre y un objetivo mayor a cero.")
+                else:
+                    db.create_savings_goal(current_username, goal_name, goal_target, goal_date, goal_description or None)
+                    st.success(f"✅ Meta '{goal_name}' creada.")
+                    invalidate_datasets([current_username], 'savings_goals')
+                    st.rerun()
+
 # --- PESTAÑA 5: CONFIGURACIÓN ---
-with main_tabs[4]:
+# st.download_button guarda en memoria el archivo que ofrece: las exportaciones
+# más grandes que esto se rechazan para acotar la memoria del proceso
+EXPORT_MAX_BYTES = int(os.environ.get("FINFAM_EXPORT_MAX_MB", "100")) * 1024 * 1024
+EXPORT_FORMATS = ["CSV", "Parquet"] if importlib.util.find_spec("pyarrow") else ["CSV"]
+
+def format_sync_changes(changes):
+    """Resumen de los cambios aplicados por db.sync_from_dataframe."""
+    return f"({changes['inserted']} nuevos, {changes['updated']} modificados, {changes['deleted']} eliminados)"
+
+def render_settings(app_data):
+    """Categorías, métodos de pago, historial y opciones avanzadas."""
     st.header("⚙️ Configuración")
     
-    config_tabs = st.tabs(["📂 Categorías", "💳 Métodos de Pago", "📊 Historial", "🔧 Avanzado"])
+    config_sections = ["📂 Categorías", "💳 Métodos de Pago", "📊 Historial", "🔧 Avanzado"]
+    config_section = st.radio("Sección", config_sections, horizontal=True, key="config_section",
+                              label_visibility="collapsed")
     
-    with config_tabs[0]:
+    if config_section == config_sections[0]:
         st.subheader("Administrar Categorías")
+        # Sólo las categorías propias: las por defecto de otros usuarios no se editan desde acá
+        user_categories = app_data['categories'][app_data['categories']['user_username'] == current_username]
         edited_cats = st.data_editor(
-            app_data['categories'], 
+            user_categories, 
             num_rows="dynamic", 
             use_container_width=True,
             column_config={
@@ -589,16 +1071,17 @@ with main_tabs[4]:
         
         if st.button("💾 Guardar Categorías"):
             try:
-                db.sync_from_dataframe(edited_cats, 'categories')
-                st.success("✅ Categorías actualizadas.")
-                st.cache_data.clear()
+                changes = db.sync_from_dataframe(edited_cats, 'categories', user_categories, current_username)
+                st.success(f"✅ Categorías actualizadas. {format_sync_changes(changes)}")
+                invalidate_datasets([current_username], 'categories', 'transactions', 'budgets', 'pending_splits')
             except Exception as e:
                 st.error(f"❌ Error: {e}")
     
-    with config_tabs[1]:
+    if config_section == config_sections[1]:
         st.subheader("Administrar Métodos de Pago")
+        user_methods = app_data['payment_methods'][app_data['payment_methods']['user_username'] == current_username]
         edited_methods = st.data_editor(
-            app_data['payment_methods'], 
+            user_methods, 
             num_rows="dynamic", 
             use_container_width=True,
             column_config={
@@ -617,13 +1100,13 @@ with main_tabs[4]:
         
         if st.button("💾 Guardar Métodos de Pago"):
             try:
-                db.sync_from_dataframe(edited_methods, 'payment_methods')
-                st.success("✅ Métodos de pago actualizados.")
-                st.cache_data.clear()
+                changes = db.sync_from_dataframe(edited_methods, 'payment_methods', user_methods, current_username)
+                st.success(f"✅ Métodos de pago actualizados. {format_sync_changes(changes)}")
+                invalidate_datasets([current_username], 'payment_methods', 'transactions')
             except Exception as e:
                 st.error(f"❌ Error: {e}")
     
-    with config_tabs[2]:
+    if config_section == config_sections[2]:
         st.subheader("📊 Historial Completo de Transacciones")
         
         # Filtros para el historial
@@ -636,58 +1119,277 @@ with main_tabs[4]:
         with hist_col3:
             transaction_type_filter = st.selectbox("Tipo", ["Todos", "Ingreso", "Gasto"])
         
-        # Filtrar historial
-        filtered_transactions = app_data['transactions'].copy()
-        if not filtered_transactions.empty:
-            filtered_transactions = filtered_transactions[
-                (filtered_transactions['date'].dt.date >= date_from) &
-                (filtered_transactions['date'].dt.date <= date_to)
-            ]
-            
-            if transaction_type_filter != "Todos":
-                filtered_transactions = filtered_transactions[
-                    filtered_transactions['type'] == transaction_type_filter
-                ]
-        
-        st.dataframe(
-            filtered_transactions.sort_values("date", ascending=False),
-            use_container_width=True,
-            column_config={
-                "id": None,
-                "date": st.column_config.DateColumn("Fecha"),
-                "amount": st.column_config.NumberColumn("Monto", format="$ %.0f"),
-                "type": "Tipo",
-                "category": "Categoría",
-                "payment_method": "Método",
-                "details": "Detalles",
-                "is_shared": st.column_config.CheckboxColumn("Compartido")
-            }
+        search_text = st.text_input(
+            "🔎 Buscar", placeholder='Ej: super, farmacia, "pago tarjeta"',
+            help="Busca en detalle, categoría, método de pago y grupo. Las palabras sueltas "
+                 "buscan por prefijo y el texto entre comillas como frase exacta."
         )
+        trans_type = None if transaction_type_filter == "Todos" else transaction_type_filter
+        history_columns = {
+            "id": None,
+            "date": st.column_config.DateColumn("Fecha"),
+            "amount": st.column_config.NumberColumn("Monto", format="$ %.0f"),
+            "amount_cents": None,
+            "type": "Tipo",
+            "category": "Categoría",
+            "payment_method": "Método",
+            "details": "Detalles",
+            "is_shared": st.column_config.CheckboxColumn("Compartido"),
+            "rank": None
+        }
+        
+        if search_text.strip():
+            # Resultados ordenados por relevancia, sin paginar
+            search_results = get_user_query(
+                'search_transactions', 'transactions',
+                text=search_text,
+                date_from=date_from,
+                date_to=date_to,
+                trans_type=trans_type,
+                limit=SEARCH_RESULTS_LIMIT
+            )
+            st.caption(f"{len(search_results)} resultados" +
+                       (f" (se muestran los {SEARCH_RESULTS_LIMIT} más relevantes)"
+                        if len(search_results) == SEARCH_RESULTS_LIMIT else ""))
+            st.dataframe(search_results, use_container_width=True, column_config=history_columns)
+        else:
+            # Paginación por cursor: la pila guarda el cursor de inicio de cada página
+            history_filters = (date_from, date_to, transaction_type_filter)
+            if st.session_state.get('history_filters') != history_filters:
+                st.session_state['history_filters'] = history_filters
+                st.session_state['history_cursors'] = [None]
+            history_cursors = st.session_state['history_cursors']
+        
+            page_transactions = get_user_query(
+                'get_transactions_with_details', 'transactions',
+                date_from=date_from,
+                date_to=date_to,
+                trans_type=trans_type,
+                limit=HISTORY_PAGE_SIZE,
+                cursor=history_cursors[-1]
+            )
+        
+            st.dataframe(page_transactions, use_container_width=True, column_config=history_columns)
+        
+            page_cols = st.columns([1, 2, 1])
+            with page_cols[0]:
+                if st.button("⬅️ Anterior", disabled=len(history_cursors) == 1, use_container_width=True):
+                    history_cursors.pop()
+                    st.rerun()
+            with page_cols[1]:
+                st.caption(f"Página {len(history_cursors)}")
+            with page_cols[2]:
+                if st.button("Siguiente ➡️", disabled=len(page_transactions) < HISTORY_PAGE_SIZE, use_container_width=True):
+                    history_cursors.append(db.next_transactions_cursor(page_transactions))
+                    st.rerun()
     
-    with config_tabs[3]:
+    if config_section == config_sections[3]:
         st.subheader("🔧 Configuración Avanzada")
         
         # Reiniciar tutorial
         if st.button("🔄 Reiniciar Tutorial"):
             # Limpiar progreso del tutorial
-            conn = db.get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM tutorial_progress WHERE user_username = ?", (current_username,))
-            conn.commit()
-            conn.close()
+            db.reset_tutorial_progress(current_username)
             st.success("✅ Tutorial reiniciado. Recarga la página para comenzar.")
         
         # Exportar datos
-        if st.button("📥 Exportar Datos"):
-            # Crear un archivo CSV con todas las transacciones del usuario
-            export_data = app_data['transactions']
-            if not export_data.empty:
-                csv = export_data.to_csv(index=False)
-                st.download_button(
-                    label="⬇️ Descargar CSV",
-                    data=csv,
-                    file_name=f"finfam_export_{current_username}_{datetime.now().strftime('%Y%m%d')}.csv",
-                    mime="text/csv"
-                )
-            else:
-                st.info("No hay datos para exportar.")
\ No newline at end of file
+        st.markdown("#### 📥 Exportar Datos")
+        export_cols = st.columns(2)
+        with export_cols[0]:
+            export_scope = st.radio("Alcance", ["Rango de fechas", "Todo el historial", "Todas las tablas (ZIP)"])
+        with export_cols[1]:
+            export_format = st.radio("Formato", EXPORT_FORMATS, horizontal=True)
+            if export_scope == "Rango de fechas":
+                export_from = st.date_input("Desde", value=datetime.today() - timedelta(days=365), key="export_from")
+                export_to = st.date_input("Hasta", value=datetime.today(), key="export_to")
+        
+        if st.button("📥 Preparar exportación"):
+            file_format = export_format.lower()
+            # La exportación se escribe por bloques en un archivo temporal en disco
+            with tempfile.TemporaryFile() as export_file:
+                try:
+                    if export_scope == "Todas las tablas (ZIP)":
+                        counts = data_export.export_all_tables(export_file, current_username, file_format)
+                        exported_rows = sum(counts.values())
+                        file_name = f"finfam_export_{current_username}_{datetime.now().strftime('%Y%m%d')}.zip"
+                        mime = "application/zip"
+                    else:
+                        date_range = (export_from, export_to) if export_scope == "Rango de fechas" else (None, None)
+                        exported_rows = data_export.export_transactions(
+                            export_file, current_username, file_format, *date_range
+                        )
+                        file_name = f"finfam_export_{current_username}_{datetime.now().strftime('%Y%m%d')}.{file_format}"
+                        mime = "text/csv" if file_format == "csv" else "application/octet-stream"
+                    
+                    export_size = export_file.tell()
+                    if not exported_rows:
+                        st.info("No hay datos para exportar.")
+                    elif export_size > EXPORT_MAX_BYTES:
+                        st.warning(
+                            f"La exportación ocupa {export_size / 1024 ** 2:,.0f} MB y el máximo es "
+                            f"{EXPORT_MAX_BYTES / 1024 ** 2:,.0f} MB. Elige un rango de fechas más corto."
+                        )
+                    else:
+                        export_file.seek(0)
+                        st.download_button(
+                            label=f"⬇️ Descargar {file_format.upper()} ({exported_rows:,} filas)",
+                            data=export_file.read(),
+                            file_name=file_name,
+                            mime=mime
+                        )
+                except Exception as e:
+                    st.error(f"❌ Error al exportar: {e}")
+        
+        # Panel oculto: se muestra abriendo la app con ?diagnostics=1
+        if st.query_params.get("diagnostics") == "1":
+            render_diagnostics()
+
+def render_diagnostics():
+    """Estadísticas de consultas SQL del proceso y registro de consultas lentas."""
+    st.markdown("#### 🩺 Diagnóstico de Consultas")
+    if not db.QUERY_STATS_ENABLED:
+        st.info("La instrumentación está desactivada (FINFAM_QUERY_STATS=0).")
+        return
+    
+    query_stats_df = db.get_query_stats()
+    diag_cols = st.columns(3)
+    with diag_cols[0]:
+        st.metric("Consultas", f"{query_stats_df['calls'].sum():,}")
+    with diag_cols[1]:
+        st.metric("Tiempo total", f"{query_stats_df['total_ms'].sum():,.0f} ms")
+    with diag_cols[2]:
+        st.metric("Lentas (≥ {:.0f} ms)".format(db.SLOW_QUERY_MS), len(db.query_stats.slow))
+    
+    if db.WRITE_QUEUE_ENABLED:
+        write_stats = db.get_write_queue_stats()
+        st.caption(
+            f"Escritor único: {write_stats['writes']:,} escrituras en {write_stats['batches']:,} commits "
+            f"(lote máx. {write_stats['max_batch']}), {write_stats['retries']} reintentos, "
+            f"{write_stats['errors']} errores, {write_stats['pending']} en cola."
+        )
+    if db.READ_SNAPSHOT_ENABLED:
+        snapshot_stats = db.get_read_snapshot_stats()
+        refreshed_at = snapshot_stats['refreshed_at']
+        st.caption(
+            f"Copia en memoria para lecturas: {snapshot_stats['refreshes']:,} refrescos, "
+            f"último en {snapshot_stats['last_refresh_ms']:.0f} ms"
+            + (f" a las {refreshed_at:%H:%M:%S}." if refreshed_at else ".")
+        )
+    
+    st.dataframe(
+        query_stats_df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "sql": st.column_config.TextColumn("SQL", width="large"),
+            "total_ms": st.column_config.NumberColumn("Total (ms)", format="%.1f"),
+            "mean_ms": st.column_config.NumberColumn("Media (ms)", format="%.2f"),
+            "p50_ms": st.column_config.NumberColumn("p50 (ms)", format="%.2f"),
+            "p95_ms": st.column_config.NumberColumn("p95 (ms)", format="%.2f"),
+            "max_ms": st.column_config.NumberColumn("Máx. (ms)", format="%.1f"),
+        }
+    )
+    
+    for slow_query in reversed(db.get_slow_queries()[-10:]):
+        with st.expander(f"🐢 {slow_query['ms']:,.1f} ms • {slow_query['rows']:,} filas • {slow_query['at']}"):
+            st.code(slow_query['sql'], language="sql")
+            if slow_query['plan']:
+                st.code("\n".join(slow_query['plan']), language="text")
+    
+    diag_actions = st.columns(2)
+    with diag_actions[0]:
+        st.download_button(
+            "⬇️ Exportar JSON",
+            data=db.export_query_stats_json(),
+            file_name=f"finfam_query_stats_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+            use_container_width=True
+        )
+    with diag_actions[1]:
+        if st.button("🧹 Reiniciar estadísticas", use_container_width=True):
+            db.reset_query_stats()
+            st.rerun()
+
+# --- NAVEGACIÓN ---
+# Cada sección declara los datasets que necesita; sólo la sección activa
+# carga sus datos y se renderiza en cada rerun.
+SECTIONS = {
+    "📊 Dashboard": (render_dashboard, []),
+    "💸 Registrar": (render_register, ['categories', 'payment_methods']),
+    "👥 Gastos Compartidos": (render_shared_expenses, ['categories', 'payment_methods', 'pending_splits']),
+    "🎯 Presupuestos": (render_budgets, ['categories', 'payment_methods', 'budgets', 'savings_goals']),
+    "⚙️ Configuración": (render_settings, ['categories', 'payment_methods']),
+}
+
+rerun_profiler.step("navegación")
+section_names = list(SECTIONS)
+active_section = st.radio("Sección", section_names, horizontal=True, key="main_section",
+                          label_visibility="collapsed")
+rerun_profiler.set_label(active_section)
+
+render_section, section_datasets = SECTIONS[active_section]
+rerun_profiler.step("load_data")
+section_data = load_data(section_datasets)
+rerun_profiler.step(f"sección: {active_section}")
+render_section(section_data)
+rerun_profiler.finish_rerun()
+
+# --- PERFIL DE RERUNS ---
+def render_profiler_panel():
+    """Reruns más lentos del historial de la sesión y su desglose por sección."""
+    with st.expander("⏱️ Perfil de reruns", expanded=False):
+        reruns_df = rerun_profiler.reruns_frame()
+        if reruns_df.empty:
+            st.info("Todavía no hay reruns medidos.")
+            return
+        
+        last_rerun = rerun_profiler.history[-1]
+        st.caption(f"Último rerun: {last_rerun['total_ms']:,.0f} ms "
+                   f"({last_rerun['db_ms']:,.0f} ms en {last_rerun['queries']} consultas SQL) • "
+                   f"{len(rerun_profiler.history)} reruns en el historial")
+        
+        st.markdown("**🐢 Reruns más lentos**")
+        st.dataframe(
+            reruns_df.head(20),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "at": st.column_config.DatetimeColumn("Hora", format="HH:mm:ss"),
+                "label": "Sección activa",
+                "total_ms": st.column_config.NumberColumn("Total (ms)", format="%.0f"),
+                "db_ms": st.column_config.NumberColumn("SQL (ms)", format="%.0f"),
+                "queries": "Consultas",
+                "slowest_section": "Paso más lento",
+                "slowest_ms": st.column_config.NumberColumn("Paso (ms)", format="%.0f"),
+                "interrupted": st.column_config.CheckboxColumn("Interrumpido"),
+            }
+        )
+        
+        selected_rerun = st.selectbox(
+            "Desglose del rerun", reruns_df['rerun'],
+            format_func=lambda number: f"#{number} • {reruns_df.set_index('rerun').at[number, 'total_ms']:,.0f} ms"
+        )
+        breakdown = rerun_profiler.sections_frame(selected_rerun)
+        breakdown['section'] = ["\u2003" * depth + name for depth, name in zip(breakdown['depth'], breakdown['section'])]
+        st.dataframe(
+            breakdown.drop(columns='depth'),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "section": "Sección",
+                "ms": st.column_config.NumberColumn("Tiempo (ms)", format="%.1f"),
+                "db_ms": st.column_config.NumberColumn("SQL (ms)", format="%.1f"),
+                "queries": "Consultas",
+                "share": st.column_config.ProgressColumn("% del rerun", min_value=0, max_value=1, format="%.0f%%"),
+            }
+        )
+        
+        st.markdown("**📊 Promedio por sección**")
+        st.dataframe(rerun_profiler.summary_frame(), use_container_width=True, hide_index=True)
+        
+        if st.button("🧹 Limpiar historial"):
+            rerun_profiler.clear()
+            st.rerun()
+
+if rerun_profiler.enabled:
+    render_profiler_panel()
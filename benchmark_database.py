@@ -0,0 +1,331 @@
+"""Benchmarks de database_enhanced sobre datos sintéticos.
+
+Genera una base determinista por cada tamaño (ver synthetic_data.py), mide
+las funciones públicas de database_enhanced y escribe los resultados en JSON
+para comparar entre commits:
+
+    python benchmark_database.py --sizes 1000 10000 100000 --output bench_base.json
+    python benchmark_database.py --sizes 1000 10000 100000 --output bench_nuevo.json
+    python benchmark_database.py --compare bench_base.json bench_nuevo.json
+
+No se miden las funciones públicas que no consultan datos (armado de SQL,
+fechas, montos y diffs de DataFrames), las de infraestructura (pool de
+conexiones, escritor único, copia en memoria, estadísticas de consultas y
+reintentos), las que reciben un cursor dentro de otra escritura
+(get_category_id, add_column_if_missing, initialize_monthly_summary, ...) ni
+las migraciones, que se miden juntas en run_migrations y en la generación
+de cada base.
+
+Esto sólo mide tiempos: la corrección se prueba en tests/ (python -m pytest).
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Umbral por defecto para marcar una regresión en --compare (mediana nueva / base)
+REGRESSION_THRESHOLD = 1.2
+
+def read_benchmarks(ctx):
+    """Funciones de lectura: (nombre, llamada). No modifican la base."""
+    db = ctx['db']
+    user = ctx['user']
+    end = ctx['end_date']
+    year, month = end.year, end.month
+    return [
+        ('get_transactions_with_details', lambda: db.get_transactions_with_details(user)),
+        ('get_transactions_with_details[30d]', lambda: db.get_transactions_with_details(
+            user, date_from=end - timedelta(days=30), date_to=end)),
+        ('get_transactions_with_details[page]', lambda: db.get_transactions_with_details(user, limit=100)),
+        ('get_transactions_with_details[all_users]', lambda: db.get_transactions_with_details()),
+        ('search_transactions', lambda: db.search_transactions(user, 'super')),
+        ('search_transactions[phrase]', lambda: db.search_transactions(user, '"plazo fijo"', min_amount=1000)),
+        ('get_data_as_dataframe[categories]', lambda: db.get_data_as_dataframe('categories', user)),
+        ('get_data_as_dataframe[payment_methods]', lambda: db.get_data_as_dataframe('payment_methods', user)),
+        ('get_data_as_dataframe[budgets]', lambda: db.get_data_as_dataframe('budgets', user)),
+        ('get_name_id_map', lambda: db.get_name_id_map('categories', user)),
+        ('get_years_with_data', lambda: db.get_years_with_data(user)),
+        ('get_monthly_totals', lambda: db.get_monthly_totals(user, year, month)),
+        ('get_category_totals', lambda: db.get_category_totals(user, year, month)),
+        ('get_weekly_trend', lambda: db.get_weekly_trend(user, year, month)),
+        ('get_trend_series[30d]', lambda: db.get_trend_series(user, end - timedelta(days=30), end, 'day')),
+        ('get_trend_series[all]', lambda: db.get_trend_series(user, end - timedelta(days=3650), end)),
+        ('get_monthly_trend', lambda: db.get_monthly_trend(user, year - 9, year, as_of=end)),
+        ('get_monthly_category_totals', lambda: db.get_monthly_category_totals(
+            user, end - timedelta(days=180), end)),
+        ('get_balance', lambda: db.get_balance(user, end)),
+        ('get_budgets_with_details', lambda: db.get_budgets_with_details(user, end)),
+        ('get_outstanding_installments', lambda: db.get_outstanding_installments(user, end)),
+        ('get_installment_schedule', lambda: db.get_installment_schedule(user, as_of=end)),
+        ('get_savings_goals', lambda: db.get_savings_goals(user, end)),
+        ('get_goal_contributions', lambda: db.get_goal_contributions(ctx['goal_id'], user)),
+        ('get_pending_splits_for_user', lambda: db.get_pending_splits_for_user(user)),
+        ('get_pending_splits_watermark', lambda: db.get_pending_splits_watermark(ctx['group_id'])),
+        ('get_pending_balances', lambda: db.get_pending_balances(ctx['group_id'])),
+        ('get_tutorial_progress', lambda: db.get_tutorial_progress(user)),
+        ('get_schema_version', lambda: _with_connection(db, db.get_schema_version)),
+        ('run_migrations[noop]', lambda: db.run_migrations()),
+    ]
+
+def write_benchmarks(ctx):
+    """Funciones de escritura: cada llamada agrega datos nuevos y pequeños."""
+    db = ctx['db']
+    user = ctx['user']
+    other = ctx['other_user']
+    date = ctx['end_date'].isoformat()
+    bulk_rows = [{
+        'category_id': ctx['category_id'], 'payment_method_id': None, 'date': date,
+        'amount': 100 + index, 'type': 'Gasto', 'details': 'bulk benchmark',
+    } for index in range(100)]
+    pending_split_ids = list(db.get_pending_splits_for_user(other)['id'])
+    contribution_ids = []
+    new_users = []
+    categories = db.get_data_as_dataframe('categories', user)
+    categories = categories[categories['user_username'] == user]
+    edited_categories = categories.copy()
+    edited_categories.iloc[0, edited_categories.columns.get_loc('icon')] = '🧪'
+    budgets = db.get_budgets_with_details(user, ctx['end_date'])
+    edited_budgets = budgets.copy()
+    if not edited_budgets.empty:
+        edited_budgets.iloc[0, edited_budgets.columns.get_loc('amount')] += 1
+
+    def add_user():
+        new_users.append(f"bench_{len(new_users)}")
+        db.add_user_if_not_exists(new_users[-1], 'Usuario benchmark')
+
+    return [
+        ('add_user_if_not_exists', add_user),
+        ('create_default_categories_and_methods', lambda: db.create_default_categories_and_methods(
+            new_users.pop() if new_users else user)),
+        ('add_transaction', lambda: db.add_transaction(user, 'Alimentación', 1234.5, 'Gasto', date, 'Efectivo',
+                                                       details='benchmark')),
+        ('add_transaction[12 cuotas]', lambda: db.add_transaction(user, 'Ropa', 120000, 'Gasto', date,
+                                                                  'Tarjeta de Crédito', installments=12)),
+        ('bulk_insert_transactions[100]', lambda: db.bulk_insert_transactions(user, bulk_rows)),
+        ('create_expense_group', lambda: db.create_expense_group('Bench', 'grupo de benchmark', user,
+                                                                 ctx['users'])),
+        ('add_shared_expense', lambda: db.add_shared_expense(
+            user, 'Alimentación', 3000, date, 'benchmark compartido', ctx['group_id'], 'equal',
+            {username: 3000 / len(ctx['users']) for username in ctx['users']}, 'Efectivo')),
+        ('create_savings_goal', lambda: db.create_savings_goal(user, 'Meta benchmark', 500000, date)),
+        ('set_savings_goal_active', lambda: db.set_savings_goal_active(ctx['goal_id'], user, True)),
+        ('add_goal_contribution', lambda: contribution_ids.append(
+            db.add_goal_contribution(ctx['goal_id'], user, 1000, date))),
+        ('delete_goal_contribution', lambda: db.delete_goal_contribution(
+            contribution_ids.pop() if contribution_ids else 0, user)),
+        ('update_tutorial_step', lambda: db.update_tutorial_step(user, 'first_transaction', True)),
+        ('reset_tutorial_progress', lambda: db.reset_tutorial_progress(user)),
+        ('sync_from_dataframe[1 cambio]', lambda: db.sync_from_dataframe(
+            edited_categories, 'categories', categories, user)),
+        ('sync_budgets_from_dataframe[1 cambio]', lambda: db.sync_budgets_from_dataframe(
+            edited_budgets, budgets, user)),
+        ('mark_split_as_paid', lambda: db.mark_split_as_paid(
+            pending_split_ids.pop() if pending_split_ids else 0)),
+        ('update_splits_status[partial]', lambda: db.update_splits_status(
+            'partial', username=other, counterparty=user, partial_amount=10)),
+        ('settle_all_splits', lambda: db.settle_all_splits(ctx['group_id'])),
+        ('rebuild_monthly_summary', lambda: db.rebuild_monthly_summary()),
+        ('rebuild_transaction_search', lambda: db.rebuild_transaction_search()),
+    ]
+
+def _with_connection(db, function):
+    conn = db.get_db_connection()
+    try:
+        return function(conn)
+    finally:
+        conn.close()
+
+def result_rows(result):
+    """Filas de un resultado, si tiene sentido contarlas."""
+    if isinstance(result, tuple):
+        result = result[0]
+    if isinstance(result, (int, float)) or result is None:
+        return None
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+def time_call(function, repeat, warmup=1):
+    """Ejecuta function warmup + repeat veces; retorna (tiempos en ms, último resultado)."""
+    result = None
+    for _ in range(warmup):
+        result = function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, result
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        'min_ms': round(ordered[0], 4),
+        'median_ms': round(statistics.median(ordered), 4),
+        'mean_ms': round(statistics.fmean(ordered), 4),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))], 4),
+        'max_ms': round(ordered[-1], 4),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def build_database(db, synthetic_data, size, args, workdir):
+    """Genera en workdir la base sintética de un tamaño.
+
+    Retorna (segundos de generación, contexto para read/write_benchmarks).
+    """
+    db.DB_FILE = os.path.join(workdir, f"bench_{size}_{args.seed}.db")
+    for path in (db.DB_FILE, db.DB_FILE + '-wal', db.DB_FILE + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    db.initialize_database()
+
+    start = time.perf_counter()
+    dataset = synthetic_data.generate_dataset(
+        users=args.users, transactions=size, years=args.years, seed=args.seed
+    )
+    setup_seconds = time.perf_counter() - start
+
+    user = dataset['users'][0]
+    conn = db.get_db_connection()
+    try:
+        goal_id = conn.execute("SELECT id FROM savings_goals WHERE user_username = ?", (user,)).fetchone()[0]
+    finally:
+        conn.close()
+    ctx = {
+        'db': db,
+        'user': user,
+        'other_user': dataset['users'][-1],
+        'users': dataset['users'],
+        'group_id': dataset['group_id'],
+        'goal_id': goal_id,
+        'category_id': db.get_name_id_map('categories', user)['Alimentación'],
+        'end_date': dataset['end_date'],
+    }
+    return setup_seconds, ctx
+
+def run_size(db, synthetic_data, size, args, workdir):
+    """Genera la base de un tamaño y mide todas las funciones."""
+    setup_seconds, ctx = build_database(db, synthetic_data, size, args, workdir)
+
+    results = []
+    for kind, benchmarks in (('read', read_benchmarks(ctx)), ('write', write_benchmarks(ctx))):
+        for name, function in benchmarks:
+            if args.filter and args.filter not in name:
+                continue
+            timings, result = time_call(function, args.repeat)
+            results.append({
+                'size': size,
+                'function': name,
+                'kind': kind,
+                'repeat': args.repeat,
+                'rows': result_rows(result),
+                **summarize(timings),
+            })
+            print(f"  {name:<45} {results[-1]['median_ms']:>10.3f} ms", file=sys.stderr)
+
+    db.close_all_connections()
+    return setup_seconds, results
+
+def run_benchmarks(args):
+    if args.db_dir:
+        os.makedirs(args.db_dir, exist_ok=True)
+        return run_in_directory(args, args.db_dir)
+    with tempfile.TemporaryDirectory(prefix='finfam-bench-') as workdir:
+        return run_in_directory(args, workdir)
+
+def run_in_directory(args, workdir):
+    # database_enhanced inicializa DB_FILE al importarse: apuntarlo a la carpeta de trabajo
+    os.environ['FINFAM_DB'] = os.path.join(workdir, 'bench_init.db')
+    import database_enhanced as db
+    import synthetic_data
+
+    report = {
+        'metadata': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'schema_version': db.SCHEMA_VERSION,
+            'users': args.users,
+            'years': args.years,
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'setup_seconds': {},
+        'results': [],
+    }
+    for size in args.sizes:
+        print(f"== {size} transacciones", file=sys.stderr)
+        setup_seconds, results = run_size(db, synthetic_data, size, args, workdir)
+        report['setup_seconds'][str(size)] = round(setup_seconds, 3)
+        report['results'].extend(results)
+
+    db.close_all_connections()
+
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2, ensure_ascii=False)
+    print(f"Resultados en {args.output}", file=sys.stderr)
+    return report
+
+def compare_reports(base_path, new_path, threshold=REGRESSION_THRESHOLD):
+    """Compara medianas de dos reportes; retorna la cantidad de regresiones."""
+    with open(base_path, encoding='utf-8') as base_file, open(new_path, encoding='utf-8') as new_file:
+        base = {(r['size'], r['function']): r for r in json.load(base_file)['results']}
+        new = {(r['size'], r['function']): r for r in json.load(new_file)['results']}
+
+    regressions = 0
+    print(f"{'tamaño':>8}  {'función':<45} {'base ms':>10} {'nuevo ms':>10} {'ratio':>7}")
+    for key in sorted(base.keys() & new.keys()):
+        base_ms = base[key]['median_ms']
+        new_ms = new[key]['median_ms']
+        ratio = new_ms / base_ms if base_ms else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  ⚠️ regresión'
+            regressions += 1
+        elif ratio < 1 / threshold:
+            flag = '  ✅ mejora'
+        print(f"{key[0]:>8}  {key[1]:<45} {base_ms:>10.3f} {new_ms:>10.3f} {ratio:>7.2f}{flag}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de database_enhanced con datos sintéticos.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="Cantidades de transacciones a generar (una base por tamaño)")
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5, help="Mediciones por función (más 1 de calentamiento)")
+    parser.add_argument('--filter', help="Sólo las funciones cuyo nombre contiene este texto")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--db-dir', help="Carpeta para las bases generadas (por defecto, una temporal)")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NUEVO'),
+                        help="Compara dos reportes JSON en lugar de medir")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        regressions = compare_reports(*args.compare, threshold=args.threshold)
+        return 1 if regressions else 0
+    run_benchmarks(args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import csv
+import io
+import zipfile
+
+import database_enhanced as db
+
+# Filas leídas de SQLite por bloque; acota la memoria usada por una exportación
+CHUNK_SIZE = 5000
+
+# Tablas incluidas en la exportación completa y la columna que las asocia al usuario
+EXPORT_TABLES = {
+    'users': 'username',
+    'categories': 'user_username',
+    'payment_methods': 'user_username',
+    'expense_groups': 'created_by',
+    'group_members': 'user_username',
+    'transactions': 'user_username',
+    'expense_splits': 'user_username',
+    'budgets': 'user_username',
+    'savings_goals': 'user_username',
+    'savings_contributions': 'user_username',
+    'user_settings': 'user_username',
+    'tutorial_progress': 'user_username',
+}
+
+def iter_query_chunks(query, params=(), chunk_size=CHUNK_SIZE):
+    """Ejecuta una consulta y produce (columnas, filas) por bloques de chunk_size.
+
+    El primer bloque se produce siempre (aunque esté vacío) para conocer las columnas.
+    """
+    conn = db.get_db_connection()
+    try:
+        cursor = conn.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        rows = cursor.fetchmany(chunk_size)
+        yield columns, rows
+        while rows:
+            rows = cursor.fetchmany(chunk_size)
+            if rows:
+                yield columns, rows
+    finally:
+        conn.close()
+
+def write_csv(chunks, output):
+    """Escribe los bloques de iter_query_chunks en un archivo de texto CSV.
+
+    Retorna la cantidad de filas escritas.
+    """
+    writer = csv.writer(output)
+    header_written = False
+    total = 0
+    for columns, rows in chunks:
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        total += len(rows)
+    return total
+
+def write_parquet(chunks, output):
+    """Escribe los bloques en Parquet, un row group por bloque (requiere pyarrow).
+
+    Retorna la cantidad de filas escritas.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("La exportación a Parquet requiere el paquete 'pyarrow'.")
+
+    writer = None
+    total = 0
+    try:
+        for columns, rows in chunks:
+            if not rows:
+                continue
+            table = pa.Table.from_pylist([dict(zip(columns, row)) for row in rows])
+            if writer is None:
+                # Columnas sin valores en el primer bloque se tipan como texto
+                schema = pa.schema([
+                    pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field
+                    for field in table.schema
+                ])
+                writer = pq.ParquetWriter(output, schema)
+            table = table.cast(writer.schema)
+            writer.write_table(table)
+            total += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+def export_transactions(output, username, file_format='csv', date_from=None, date_to=None):
+    """Exporta las transacciones del usuario (opcionalmente por rango de fechas).
+
+    output es un archivo binario; se escribe por bloques sin armar la
+    exportación completa en memoria. Retorna la cantidad de filas.
+    """
+    query, params = db.build_transactions_query(username, date_from=date_from, date_to=date_to)
+    chunks = iter_query_chunks(query, params)
+    if file_format == 'parquet':
+        return write_parquet(chunks, output)
+    text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+    try:
+        return write_csv(chunks, text)
+    finally:
+        text.flush()
+        text.detach()
+
+def export_all_tables(output, username=None, file_format='csv'):
+    """Exporta todas las tablas a un ZIP con un archivo por tabla.
+
+    Con username sólo se incluyen las filas asociadas a ese usuario.
+    Retorna un dict tabla -> cantidad de filas.
+    """
+    extension = 'parquet' if file_format == 'parquet' else 'csv'
+    counts = {}
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for table_name, user_column in EXPORT_TABLES.items():
+            query = f"SELECT * FROM {table_name}"
+            params = ()
+            if username:
+                query += f" WHERE {user_column} = ?"
+                params = (username,)
+            chunks = iter_query_chunks(query, params)
+            with archive.open(f"{table_name}.{extension}", 'w', force_zip64=True) as member:
+                if file_format == 'parquet':
+                    counts[table_name] = write_parquet(chunks, member)
+                else:
+                    text = io.TextIOWrapper(member, encoding='utf-8', newline='')
+                    counts[table_name] = write_csv(chunks, text)
+                    text.flush()
+                    text.detach()
+    return counts
@@ -1,23 +1,761 @@
+import os
 import sqlite3
+import time
+import random
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from functools import lru_cache
 import pandas as pd
+import numpy as np
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import uuid
 import json
+import re
+import itertools
+import queue
+import threading
+from decimal import Decimal, ROUND_HALF_UP
 
-DB_FILE = "database.db"
+# FINFAM_DB permite usar otra base (benchmarks, pruebas) sin tocar el código
+DB_FILE = os.environ.get("FINFAM_DB", "database.db")
+
+# --- Pool de Conexiones ---
+
+# Conexiones ociosas que se mantienen abiertas (con su caché de páginas caliente)
+POOL_SIZE = 8
+# Sentencias preparadas que sqlite3 mantiene compiladas por conexión
+STATEMENT_CACHE_SIZE = 256
+# PRAGMAs aplicados a cada conexión nueva. journal_mode=WAL es persistente en
+# el archivo, el resto es por conexión.
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),      # ~16 MB de caché de páginas
+    ("mmap_size", 134217728),    # 128 MB mapeados en memoria
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),
+)
+
+# --- Instrumentación de Consultas ---
+
+# FINFAM_QUERY_STATS=0 desactiva la instrumentación (por defecto activa)
+QUERY_STATS_ENABLED = os.environ.get("FINFAM_QUERY_STATS", "1") != "0"
+# Consultas que superan este tiempo van al registro de lentas (con su plan)
+SLOW_QUERY_MS = float(os.environ.get("FINFAM_SLOW_QUERY_MS", "100"))
+EXPLAIN_SLOW_QUERIES = True
+# Duraciones recientes guardadas por sentencia para calcular p50/p95
+QUERY_SAMPLE_SIZE = 256
+# Largo de los registros de llamadas recientes y de consultas lentas
+QUERY_LOG_SIZE = 200
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """SQL en una línea, para agrupar las llamadas de una misma sentencia."""
+    return ' '.join(sql.split())
+
+def explain_query_plan(conn, sql, parameters=()):
+    """Plan de ejecución (EXPLAIN QUERY PLAN) de una consulta de lectura, o None."""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    try:
+        cursor = sqlite3.Cursor(conn)
+        rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        cursor.close()
+        return [row[3] for row in rows]
+    except sqlite3.Error:
+        return None
+
+class QueryStats:
+    """Contadores agregados por sentencia y registros de llamadas recientes y lentas.
+
+    Cada llamada cuesta un acceso a un dict y dos appends bajo un lock, por
+    lo que puede quedar activa en producción.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._statements = {}
+            self.calls = 0
+            self.total_ms = 0.0
+            self.recent = deque(maxlen=QUERY_LOG_SIZE)
+            self.slow = deque(maxlen=QUERY_LOG_SIZE)
+            self.started_at = datetime.now()
+
+    def record(self, sql, elapsed_ms, rows, plan=None, example=None):
+        """Registra una llamada; example es (sql original, parámetros) de la primera."""
+        entry = {'at': time.time(), 'sql': sql, 'ms': elapsed_ms, 'rows': rows}
+        with self._lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            stats = self._statements.get(sql)
+            if stats is None:
+                stats = self._statements[sql] = {
+                    'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                    'samples': deque(maxlen=QUERY_SAMPLE_SIZE),
+                    'example': example,
+                }
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['rows'] += rows
+            stats['samples'].append(elapsed_ms)
+            self.recent.append(entry)
+            if elapsed_ms >= SLOW_QUERY_MS:
+                self.slow.append(dict(entry, plan=plan))
+
+    def summary(self):
+        """Una fila por sentencia con calls, tiempos (total, media, p50, p95, máx.) y filas."""
+        with self._lock:
+            statements = [(sql, dict(stats, samples=list(stats['samples'])))
+                          for sql, stats in self._statements.items()]
+        for _, stats in statements:
+            stats.pop('example')
+        rows = []
+        for sql, stats in statements:
+            p50, p95 = np.percentile(stats['samples'], [50, 95])
+            rows.append({
+                'sql': sql,
+                'calls': stats['calls'],
+                'total_ms': round(stats['total_ms'], 3),
+                'mean_ms': round(stats['total_ms'] / stats['calls'], 3),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'max_ms': round(stats['max_ms'], 3),
+                'rows': stats['rows'],
+            })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def examples(self):
+        """{sentencia normalizada: (sql original, parámetros)} de la primera llamada de cada una."""
+        with self._lock:
+            return {sql: stats['example'] for sql, stats in self._statements.items() if stats['example']}
+
+    def to_dict(self):
+        with self._lock:
+            recent, slow = list(self.recent), list(self.slow)
+        recent, slow = ([dict(entry, at=datetime.fromtimestamp(entry['at']).isoformat(timespec='milliseconds'),
+                              ms=round(entry['ms'], 3)) for entry in log] for log in (recent, slow))
+        return {
+            'since': self.started_at.isoformat(timespec='seconds'),
+            'slow_query_ms': SLOW_QUERY_MS,
+            'statements': self.summary(),
+            'slow_queries': slow,
+            'recent_queries': recent,
+        }
+
+query_stats = QueryStats()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor que mide cada consulta: tiempo de execute más el de sus fetch, y filas.
+
+    La medición se registra al agotarse los resultados, al cerrar el cursor
+    o al ejecutar otra consulta con él.
+    """
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._sql, self._parameters = sql, parameters
+        self._elapsed = time.perf_counter() - start
+        self._rows = 0
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        # De un generador ya consumido no queda ejemplo de parámetros
+        example = (sql, seq_of_parameters[0]) if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else None
+        query_stats.record(normalize_sql(sql), (time.perf_counter() - start) * 1000, max(self.rowcount, 0),
+                           example=example)
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows))
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._finish()
+            raise
+        self._fetched(start, 1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish(explain=False)
+        except Exception:
+            pass
+
+    def _fetched(self, start, rows):
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+            self._rows += rows
+
+    def _finish(self, explain=True):
+        if self._sql is None:
+            return
+        sql, parameters = self._sql, self._parameters
+        self._sql = self._parameters = None
+        elapsed_ms = self._elapsed * 1000
+        rows = self._rows if self.description else max(self.rowcount, 0)
+        plan = None
+        if explain and EXPLAIN_SLOW_QUERIES and elapsed_ms >= SLOW_QUERY_MS:
+            plan = explain_query_plan(self.connection, sql, parameters)
+        query_stats.record(normalize_sql(sql), elapsed_ms, rows, plan, example=(sql, parameters))
+
+def get_query_stats():
+    """Estadísticas por sentencia como DataFrame (ordenadas por tiempo total)."""
+    return pd.DataFrame(query_stats.summary(),
+                        columns=['sql', 'calls', 'total_ms', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms', 'rows'])
+
+def get_slow_queries():
+    """Últimas consultas lentas con su duración, filas y plan de ejecución."""
+    return query_stats.to_dict()['slow_queries']
+
+def get_query_examples():
+    """Una llamada de ejemplo (sql, parámetros) por sentencia, p. ej. para EXPLAIN QUERY PLAN."""
+    return query_stats.examples()
+
+def reset_query_stats():
+    query_stats.reset()
+
+def export_query_stats_json():
+    """Estadísticas, consultas lentas y recientes serializadas en JSON."""
+    return json.dumps(query_stats.to_dict(), indent=2, ensure_ascii=False)
+
+class PooledConnection(sqlite3.Connection):
+    """Conexión que al cerrarse vuelve al pool en lugar de destruirse."""
+
+    pool = None
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = InstrumentedCursor if QUERY_STATS_ENABLED else sqlite3.Cursor
+        return super().cursor(factory)
+
+    # Connection.execute no pasa por cursor(): se redirigen para instrumentarlos
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+            return
+        if self.in_transaction:
+            self.rollback()
+        self.pool.release(self)
+
+    def dispose(self):
+        """Cierra la conexión de verdad."""
+        super().close()
+
+class ConnectionPool:
+    """Pool pequeño de conexiones SQLite reutilizables entre hilos."""
+
+    def __init__(self, database, size=POOL_SIZE, uri=False, pragmas=SQLITE_PRAGMAS):
+        self.database = database
+        self.uri = uri
+        self.pragmas = pragmas
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            uri=self.uri,
+            factory=PooledConnection,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma, value in self.pragmas:
+            conn.execute(f"PRAGMA {pragma} = {value}").fetchall()
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        """Entrega una conexión ociosa (la más reciente) o abre una nueva."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("El pool de conexiones está cerrado")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        """Devuelve una conexión al pool; si está lleno o cerrado, la cierra."""
+        if self._closed:
+            conn.dispose()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.dispose()
+
+    def close_all(self):
+        """Cierra todas las conexiones ociosas y deja de aceptar devoluciones."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().dispose()
+            except queue.Empty:
+                break
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_connection_pool():
+    """Retorna el pool de la base actual, recreándolo si cambió DB_FILE."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.database != DB_FILE:
+            if _pool is not None:
+                _pool.close_all()
+            _pool = ConnectionPool(DB_FILE)
+            invalidate_name_id_cache()
+        return _pool
+
+def close_all_connections():
+    """Cierra las conexiones del pool (útil al cambiar de base o en tests)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+    close_read_snapshot()
+    invalidate_name_id_cache()
 
 def get_db_connection():
-    """Crea y retorna una conexión a la base de datos."""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Obtiene una conexión del pool; conn.close() la devuelve al pool."""
+    return get_connection_pool().acquire()
 
-def initialize_database():
-    """Crea las tablas de la base de datos con modelo relacional mejorado."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+# --- Escritor Único ---
+
+# FINFAM_WRITE_QUEUE=0 hace que cada sesión escriba con su propia conexión
+WRITE_QUEUE_ENABLED = os.environ.get("FINFAM_WRITE_QUEUE", "1") != "0"
+# Escrituras en cola que se agrupan como máximo en un mismo commit
+WRITE_BATCH_SIZE = 64
+# Reintentos ante "database is locked" (otro proceso escribiendo) y espera
+# inicial del backoff exponencial, en milisegundos
+WRITE_RETRIES = 6
+WRITE_BACKOFF_MS = 25
+# Tiempo máximo que quien pidió una escritura espera su resultado
+WRITE_TIMEOUT_S = 60
+
+def is_busy_error(error):
+    """True si el error es de base bloqueada u ocupada (se puede reintentar)."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+def retry_on_busy(function, on_retry=None):
+    """Llama a function() reintentando con backoff exponencial (y jitter) si la base está ocupada."""
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            return function()
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == WRITE_RETRIES:
+                raise
+            if on_retry:
+                on_retry()
+            time.sleep(WRITE_BACKOFF_MS / 1000 * 2 ** attempt * random.uniform(0.5, 1.0))
+
+class WriteQueue:
+    """Hilo escritor único: serializa las escrituras de todas las sesiones.
+
+    Cada escritura es una función que recibe un cursor (y sus argumentos)
+    y no hace commit. El hilo toma las escrituras en cola, hasta
+    WRITE_BATCH_SIZE, y las ejecuta en una sola transacción con un
+    SAVEPOINT por escritura y un único commit. Si una escritura falla sólo
+    se deshace su savepoint y el error le llega a quien la pidió; si la base
+    está bloqueada por otro proceso se reintenta el lote entero.
+    """
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._cursor = None
+        self.stats = {'writes': 0, 'batches': 0, 'max_batch': 0, 'retries': 0, 'errors': 0}
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='finfam-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, function, *args, **kwargs):
+        """Encola una escritura y retorna un Future con su resultado."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((function, args, kwargs, future))
+        return future
+
+    def run(self, function, *args, **kwargs):
+        """Encola una escritura y espera su resultado (o re-lanza su error)."""
+        if threading.current_thread() is self._thread:
+            # Escritura pedida desde otra escritura: se suma a la transacción en curso
+            return function(self._cursor, *args, **kwargs)
+        future = self.submit(function, *args, **kwargs)
+        try:
+            return future.result(timeout=WRITE_TIMEOUT_S)
+        except FutureTimeoutError:
+            # Sólo es un fallo si la escritura no llegó a empezar; si no, se espera su resultado
+            if future.cancel():
+                raise
+            return future.result()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _loop(self):
+        while True:
+            # Lo que llegó mientras se escribía el lote anterior va junto en el siguiente
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batch = [job for job in batch if job[3].set_running_or_notify_cancel()]
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        def count_retry():
+            self.stats['retries'] += 1
+        try:
+            results = retry_on_busy(lambda: self._run_batch(batch), on_retry=count_retry)
+            _notify_write()
+        except Exception as e:
+            results = [(future, None, e) for *_, future in batch]
+
+        self.stats['writes'] += len(batch)
+        self.stats['batches'] += 1
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                self.stats['errors'] += 1
+                future.set_exception(error)
+
+    def _run_batch(self, batch):
+        conn = get_db_connection()
+        # Las sentencias de control no pasan por la instrumentación de consultas
+        control = sqlite3.Cursor(conn)
+        try:
+            self._cursor = conn.cursor()
+            control.execute("BEGIN IMMEDIATE")
+            results = []
+            for function, args, kwargs, future in batch:
+                control.execute("SAVEPOINT write_job")
+                try:
+                    result = function(self._cursor, *args, **kwargs)
+                except Exception as e:
+                    if is_busy_error(e):
+                        raise
+                    control.execute("ROLLBACK TO write_job")
+                    control.execute("RELEASE write_job")
+                    results.append((future, None, e))
+                else:
+                    control.execute("RELEASE write_job")
+                    results.append((future, result, None))
+            conn.commit()
+            return results
+        finally:
+            self._cursor = None
+            control.close()
+            conn.close()
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+def get_write_queue():
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue()
+        return _write_queue
+
+def submit_write(function, *args, **kwargs):
+    """Pide la escritura function(cursor, *args, **kwargs) y retorna un Future con su resultado."""
+    if WRITE_QUEUE_ENABLED:
+        return get_write_queue().submit(function, *args, **kwargs)
+    future = Future()
+    try:
+        future.set_result(run_write(function, *args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def run_write(function, *args, **kwargs):
+    """Ejecuta la escritura function(cursor, *args, **kwargs) en su transacción y retorna su resultado.
+
+    Con el escritor único activo pasa por su cola; si no, usa una conexión
+    propia con los mismos reintentos ante base bloqueada.
+    """
+    if WRITE_QUEUE_ENABLED:
+        return get_write_queue().run(function, *args, **kwargs)
+
+    def write():
+        conn = get_db_connection()
+        try:
+            result = function(conn.cursor(), *args, **kwargs)
+            conn.commit()
+            _notify_write()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    return retry_on_busy(write)
+
+def get_write_queue_stats():
+    """Escrituras, lotes (commits), lote más grande, reintentos, errores y escrituras en cola."""
+    if _write_queue is None:
+        return {'writes': 0, 'batches': 0, 'max_batch': 0, 'retries': 0, 'errors': 0, 'pending': 0}
+    return dict(_write_queue.stats, pending=_write_queue.pending())
+
+# --- Copia en Memoria para Lecturas ---
+
+# FINFAM_READ_SNAPSHOT=1 sirve las consultas de sólo lectura desde una copia en memoria
+READ_SNAPSHOT_ENABLED = os.environ.get("FINFAM_READ_SNAPSHOT", "0") == "1"
+# Los cambios de otros procesos se detectan como mucho cada tantos segundos
+READ_SNAPSHOT_INTERVAL_S = float(os.environ.get("FINFAM_READ_SNAPSHOT_INTERVAL", "5"))
+# Después de un commit propio se espera este tiempo antes de copiar, así una
+# ráfaga de escrituras se refleja en una sola copia
+READ_SNAPSHOT_DEBOUNCE_S = float(os.environ.get("FINFAM_READ_SNAPSHOT_DEBOUNCE", "0.2"))
+# Páginas copiadas por paso de la API de backup
+READ_SNAPSHOT_BACKUP_PAGES = 4096
+# Las conexiones a la copia no pueden escribir
+READ_SNAPSHOT_PRAGMAS = (
+    ("query_only", "ON"),
+    ("temp_store", "MEMORY"),
+)
+
+_snapshot_ids = itertools.count()
+
+class ReadSnapshot:
+    """Copia en memoria de la base para lecturas, refrescada con la API de backup.
+
+    Cada refresco copia la base a una base en memoria nueva (shared-cache,
+    con su propio pool) y recién entonces la pone en uso: las lecturas en
+    curso terminan sobre la copia anterior y ninguna ve una copia a medias.
+    PRAGMA data_version indica si la base cambió desde la última copia.
+
+    Las copias sólo se hacen en un hilo aparte, nunca al leer ni en el hilo
+    escritor. Los commits propios marcan la copia como atrasada y la
+    refrescan tras READ_SNAPSHOT_DEBOUNCE_S; mientras tanto las lecturas van
+    a la base, así quien escribe lee luego sus cambios. Los cambios de otros
+    procesos se revisan cada READ_SNAPSHOT_INTERVAL_S: la lectura que lo
+    nota pide el refresco y sigue con la copia vigente.
+
+    Cada refresco copia la base entera: la API de backup no copia sólo las
+    páginas que cambiaron.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._source = sqlite3.connect(database, check_same_thread=False)
+        # _lock protege el cambio de copia; _refresh_lock, que haya una sola copia a la vez
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._pool = None
+        self._keeper = None
+        self._data_version = None
+        self._checked_at = 0.0
+        # Commits propios notificados y hasta cuál está incluido en la copia
+        self._writes = 0
+        self._copied_writes = 0
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+        self.stats = {'refreshes': 0, 'last_refresh_ms': 0.0, 'total_refresh_ms': 0.0, 'refreshed_at': None}
+
+    def _due(self):
+        return self._pool is None or time.monotonic() - self._checked_at >= READ_SNAPSHOT_INTERVAL_S
+
+    def refresh_if_changed(self):
+        """Copia la base de nuevo si cambió desde la última copia."""
+        with self._refresh_lock:
+            if self._closed:
+                return
+            # Se lee antes que data_version: esos commits ya están en la base
+            writes = self._writes
+            self._checked_at = time.monotonic()
+            data_version = self._source.execute("PRAGMA data_version").fetchone()[0]
+            if self._pool is None or data_version != self._data_version:
+                self._refresh(data_version)
+            self._copied_writes = writes
+
+    def expire(self):
+        """Hace que la próxima lectura revise si la base cambió."""
+        self._checked_at = 0.0
+
+    def mark_stale(self):
+        """Después de un commit propio: pide un refresco en el hilo de la copia."""
+        self._writes += 1
+        self.request_refresh()
+
+    def request_refresh(self):
+        """Despierta al hilo de la copia para que revise si la base cambió."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._refresh_loop, name='finfam-snapshot', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _refresh_loop(self):
+        while not self._closed:
+            self._wake.wait()
+            time.sleep(READ_SNAPSHOT_DEBOUNCE_S)
+            self._wake.clear()
+            try:
+                self.refresh_if_changed()
+            except sqlite3.Error:
+                # La próxima lectura reintenta la copia
+                self.expire()
+
+    def acquire(self):
+        """Conexión a la copia vigente, sin esperar nunca un refresco.
+
+        Si todavía no hay copia o no incluye un commit propio la conexión es
+        a la base.
+        """
+        if self._closed:
+            return get_db_connection()
+        if self._due():
+            # La próxima revisión la hace el hilo de la copia; las demás lecturas no lo despiertan
+            self._checked_at = time.monotonic()
+            self.request_refresh()
+        if self._copied_writes != self._writes:
+            return get_db_connection()
+        # El pool se toma y se usa bajo el lock: un refresco no puede cerrarlo en el medio
+        with self._lock:
+            if self._pool is None:
+                return get_db_connection()
+            return self._pool.acquire()
+
+    def _refresh(self, data_version):
+        start = time.perf_counter()
+        uri = f"file:finfam-snapshot-{next(_snapshot_ids)}?mode=memory&cache=shared"
+        keeper = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        # La copia se hace por pasos; si otra conexión escribe en el medio, SQLite la reinicia
+        self._source.backup(keeper, pages=READ_SNAPSHOT_BACKUP_PAGES, sleep=0)
+        with self._lock:
+            old_pool, old_keeper = self._pool, self._keeper
+            self._pool = ConnectionPool(uri, uri=True, pragmas=READ_SNAPSHOT_PRAGMAS)
+            self._keeper = keeper
+        self._data_version = data_version
+        if old_pool is not None:
+            # La base en memoria anterior vive hasta que se cierre su última conexión en uso
+            old_pool.close_all()
+            old_keeper.close()
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats['refreshes'] += 1
+        self.stats['last_refresh_ms'] = elapsed_ms
+        self.stats['total_refresh_ms'] += elapsed_ms
+        self.stats['refreshed_at'] = datetime.now()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        with self._refresh_lock, self._lock:
+            if self._pool is not None:
+                self._pool.close_all()
+                self._keeper.close()
+                self._pool = self._keeper = None
+            self._source.close()
+
+_read_snapshot = None
+_read_snapshot_lock = threading.Lock()
+
+def get_read_snapshot():
+    """Retorna la copia en memoria de la base actual, recreándola si cambió DB_FILE."""
+    global _read_snapshot
+    with _read_snapshot_lock:
+        if _read_snapshot is None or _read_snapshot.database != DB_FILE:
+            if _read_snapshot is not None:
+                _read_snapshot.close()
+            _read_snapshot = ReadSnapshot(DB_FILE)
+        return _read_snapshot
+
+def close_read_snapshot():
+    global _read_snapshot
+    with _read_snapshot_lock:
+        if _read_snapshot is not None:
+            _read_snapshot.close()
+            _read_snapshot = None
+
+def _notify_write():
+    """Después de un commit: marca atrasada la copia en memoria, si está en uso."""
+    snapshot = _read_snapshot
+    if snapshot is None:
+        return
+    snapshot.mark_stale()
+
+def get_read_connection():
+    """Conexión para consultas de sólo lectura: de la copia en memoria si está activa."""
+    if READ_SNAPSHOT_ENABLED:
+        return get_read_snapshot().acquire()
+    return get_db_connection()
+
+def get_read_snapshot_stats():
+    """Refrescos de la copia en memoria, su duración y la hora del último."""
+    if _read_snapshot is None:
+        return {'refreshes': 0, 'last_refresh_ms': 0.0, 'total_refresh_ms': 0.0, 'refreshed_at': None}
+    return dict(_read_snapshot.stats)
+
+# --- Migraciones de Esquema ---
+
+def migration_base_schema(cursor):
+    """Crea las tablas del modelo relacional.
+
+    Es idempotente porque las bases creadas antes del versionado (user_version
+    0) pueden tener ya parte del esquema.
+    """
     # Tabla de Usuarios
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS users (
@@ -84,29 +822,8 @@ def initialize_database():
     )""")
 
     # Tabla de Transacciones Principal
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS transactions (
-        id TEXT PRIMARY KEY,
-        user_username TEXT NOT NULL,
-        category_id INTEGER NOT NULL,
-        payment_method_id INTEGER,
-        date TEXT NOT NULL,
-        amount REAL NOT NULL,
-        type TEXT NOT NULL CHECK(type IN ('Ingreso', 'Gasto')),
-        details TEXT,
-        installments_paid INTEGER DEFAULT 1,
-        installments_total INTEGER DEFAULT 1,
-        purchase_id TEXT,
-        is_shared BOOLEAN DEFAULT 0,
-        group_id TEXT,
-        original_amount REAL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_username) REFERENCES users (username),
-        FOREIGN KEY (category_id) REFERENCES categories (id),
-        FOREIGN KEY (payment_method_id) REFERENCES payment_methods (id),
-        FOREIGN KEY (group_id) REFERENCES expense_groups (id)
-    )""")
+    cursor.execute(TRANSACTIONS_TABLE_SQL.format(table_name='transactions'))
+    migrate_transactions_to_typed_storage(cursor)
 
     # Tabla de Divisiones de Gastos Compartidos
     cursor.execute("""
@@ -181,20 +898,682 @@ def initialize_database():
         UNIQUE(user_username, step_name)
     )""")
 
-    # Crear índices para mejorar performance
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions(user_username, date)")
+def migration_base_indexes(cursor):
+    """Índices de las consultas principales."""
+    # (usuario, fecha, id) sirve los filtros por rango y la paginación por cursor
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_user_date")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date_id ON transactions(user_username, date, id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions(category_id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_expense_splits_transaction ON expense_splits(transaction_id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_expense_splits_user ON expense_splits(user_username)")
 
-    conn.commit()
-    conn.close()
+def migration_import_hash(cursor):
+    """Hash de contenido de transacciones importadas desde extractos."""
+    add_column_if_missing(cursor, 'transactions', 'import_hash', 'TEXT')
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_import_hash
+    ON transactions(import_hash) WHERE import_hash IS NOT NULL
+    """)
+
+def migration_monthly_summary(cursor):
+    """Resumen mensual materializado y sus triggers."""
+    initialize_monthly_summary(cursor)
+
+def migration_split_partial_payments(cursor):
+    """Monto ya pagado de cada división, para registrar pagos parciales."""
+    add_column_if_missing(cursor, 'expense_splits', 'paid_amount', 'REAL NOT NULL DEFAULT 0')
+
+def migration_budget_spend_index(cursor):
+    """Índice para sumar el gasto por usuario, categoría y rango de fechas."""
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_transactions_user_category_date
+    ON transactions(user_username, category_id, date)
+    """)
+
+def migration_savings_contributions(cursor):
+    """Aportes a metas de ahorro; triggers mantienen savings_goals.current_amount."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS savings_contributions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        goal_id INTEGER NOT NULL,
+        user_username TEXT NOT NULL,
+        transaction_id TEXT,
+        amount_cents INTEGER NOT NULL CHECK(amount_cents <> 0),
+        date TEXT NOT NULL CHECK(date IS date(date)),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (goal_id) REFERENCES savings_goals (id),
+        FOREIGN KEY (user_username) REFERENCES users (username),
+        FOREIGN KEY (transaction_id) REFERENCES transactions (id)
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_savings_contributions_goal_date ON savings_contributions(goal_id, date)")
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_savings_contributions_transaction
+    ON savings_contributions(transaction_id) WHERE transaction_id IS NOT NULL
+    """)
+
+    # current_amount se ajusta por el delta de cada aporte: nunca se recalcula sumando el historial
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_savings_contributions_insert
+    AFTER INSERT ON savings_contributions BEGIN
+        UPDATE savings_goals SET current_amount = round(COALESCE(current_amount, 0) + NEW.amount_cents / 100.0, 2)
+        WHERE id = NEW.goal_id;
+    END""")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_savings_contributions_delete
+    AFTER DELETE ON savings_contributions BEGIN
+        UPDATE savings_goals SET current_amount = round(COALESCE(current_amount, 0) - OLD.amount_cents / 100.0, 2)
+        WHERE id = OLD.goal_id;
+    END""")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_savings_contributions_update
+    AFTER UPDATE OF amount_cents, goal_id ON savings_contributions BEGIN
+        UPDATE savings_goals SET current_amount = round(COALESCE(current_amount, 0) - OLD.amount_cents / 100.0, 2)
+        WHERE id = OLD.goal_id;
+        UPDATE savings_goals SET current_amount = round(COALESCE(current_amount, 0) + NEW.amount_cents / 100.0, 2)
+        WHERE id = NEW.goal_id;
+    END""")
+    # Un aporte vinculado sigue a su transacción (monto y borrado)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_contribution_update
+    AFTER UPDATE OF amount_cents ON transactions BEGIN
+        UPDATE savings_contributions SET amount_cents = NEW.amount_cents
+        WHERE transaction_id = NEW.id AND amount_cents <> NEW.amount_cents;
+    END""")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_contribution_delete
+    AFTER DELETE ON transactions BEGIN
+        DELETE FROM savings_contributions WHERE transaction_id = OLD.id;
+    END""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_savings_goals_user ON savings_goals(user_username, is_active)")
+
+# Texto indexado de cada transacción (mismo rowid que en transactions)
+TRANSACTION_SEARCH_ROW_SQL = """
+SELECT t.rowid, t.id, t.details, c.name, p.name, TRIM(COALESCE(eg.name, '') || ' ' || COALESCE(eg.description, ''))
+FROM transactions t
+LEFT JOIN categories c ON c.id = t.category_id
+LEFT JOIN payment_methods p ON p.id = t.payment_method_id
+LEFT JOIN expense_groups eg ON eg.id = t.group_id
+"""
+
+def migration_transaction_search(cursor):
+    """Índice FTS5 de detalle, categoría, método de pago y grupo de cada transacción.
+
+    Los triggers lo mantienen al insertar, editar o borrar transacciones y al
+    renombrar categorías, métodos de pago o grupos.
+    """
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+        transaction_id UNINDEXED, details, category, payment_method, group_text,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""")
+    rebuild_transaction_search(cursor)
+
+    new_row_sql = TRANSACTION_SEARCH_ROW_SQL + " WHERE t.rowid = NEW.rowid"
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert
+    AFTER INSERT ON transactions BEGIN
+        INSERT INTO transactions_fts (rowid, transaction_id, details, category, payment_method, group_text)
+        {new_row_sql};
+    END""")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_delete
+    AFTER DELETE ON transactions BEGIN
+        DELETE FROM transactions_fts WHERE rowid = OLD.rowid;
+    END""")
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update
+    AFTER UPDATE OF details, category_id, payment_method_id, group_id ON transactions BEGIN
+        DELETE FROM transactions_fts WHERE rowid = OLD.rowid;
+        INSERT INTO transactions_fts (rowid, transaction_id, details, category, payment_method, group_text)
+        {new_row_sql};
+    END""")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_categories_fts_rename
+    AFTER UPDATE OF name ON categories BEGIN
+        UPDATE transactions_fts SET category = NEW.name
+        WHERE rowid IN (SELECT rowid FROM transactions WHERE category_id = NEW.id);
+    END""")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_payment_methods_fts_rename
+    AFTER UPDATE OF name ON payment_methods BEGIN
+        UPDATE transactions_fts SET payment_method = NEW.name
+        WHERE rowid IN (SELECT rowid FROM transactions WHERE payment_method_id = NEW.id);
+    END""")
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_expense_groups_fts_rename
+    AFTER UPDATE OF name, description ON expense_groups BEGIN
+        UPDATE transactions_fts
+        SET group_text = TRIM(COALESCE(NEW.name, '') || ' ' || COALESCE(NEW.description, ''))
+        WHERE rowid IN (SELECT rowid FROM transactions WHERE group_id = NEW.id);
+    END""")
+
+def migration_hot_query_indexes(cursor):
+    """Índices que faltaban para las consultas frecuentes (ver index_advisor.py)."""
+    # Categorías y métodos visibles: user_username = ? OR is_default = 1 se
+    # resuelve con un índice por término (MULTI-INDEX OR)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_categories_user ON categories(user_username, name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_categories_default ON categories(is_default) WHERE is_default = 1")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payment_methods_user ON payment_methods(user_username, name)")
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_payment_methods_default
+    ON payment_methods(is_default) WHERE is_default = 1
+    """)
+    # Divisiones pendientes por estado (saldos del grupo) y por estado y usuario
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_expense_splits_status_user ON expense_splits(status, user_username)")
+    # Gastos de un grupo y triggers de renombrado de grupos y métodos de pago
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_group ON transactions(group_id) WHERE group_id IS NOT NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_payment_method ON transactions(payment_method_id)")
+    # Cuotas pendientes: sólo las transacciones de compras en cuotas
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_transactions_installments
+    ON transactions(user_username, date) WHERE purchase_id IS NOT NULL
+    """)
+
+# Migraciones en orden; la versión de cada una es su posición (1, 2, ...).
+# Sólo se agregan al final: nunca se reordenan ni se modifican las ya publicadas.
+MIGRATIONS = [
+    migration_base_schema,
+    migration_base_indexes,
+    migration_import_hash,
+    migration_monthly_summary,
+    migration_split_partial_payments,
+    migration_budget_spend_index,
+    migration_savings_contributions,
+    migration_transaction_search,
+    migration_hot_query_indexes,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations():
+    """Aplica en orden las migraciones pendientes según PRAGMA user_version.
+
+    Cada migración corre en su propia transacción junto con el cambio de
+    user_version, así una falla no deja el esquema a medio migrar. Si la base
+    ya está al día no se ejecuta DDL ni se abre ninguna transacción.
+    Retorna la cantidad de migraciones aplicadas.
+    """
+    conn = get_db_connection()
+    try:
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return 0
+
+        applied = 0
+        cursor = conn.cursor()
+        while True:
+            # BEGIN IMMEDIATE toma el lock de escritura antes de releer la versión,
+            # por si otro proceso migró mientras tanto
+            cursor.execute("BEGIN IMMEDIATE")
+            version = get_schema_version(conn)
+            if version >= SCHEMA_VERSION:
+                conn.rollback()
+                return applied
+            try:
+                MIGRATIONS[version](cursor)
+                cursor.execute(f"PRAGMA user_version = {version + 1}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied += 1
+    finally:
+        conn.close()
+
+def initialize_database():
+    """Deja la base de datos en la última versión del esquema."""
+    run_migrations()
+
+# Fechas ISO validadas ('YYYY-MM-DD') con año y mes generados, montos en centavos
+TRANSACTIONS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {table_name} (
+    id TEXT PRIMARY KEY,
+    user_username TEXT NOT NULL,
+    category_id INTEGER NOT NULL,
+    payment_method_id INTEGER,
+    date TEXT NOT NULL CHECK(date IS date(date)),
+    year INTEGER GENERATED ALWAYS AS (CAST(substr(date, 1, 4) AS INTEGER)) VIRTUAL,
+    month INTEGER GENERATED ALWAYS AS (CAST(substr(date, 6, 2) AS INTEGER)) VIRTUAL,
+    amount_cents INTEGER NOT NULL,
+    type TEXT NOT NULL CHECK(type IN ('Ingreso', 'Gasto')),
+    details TEXT,
+    installments_paid INTEGER DEFAULT 1,
+    installments_total INTEGER DEFAULT 1,
+    purchase_id TEXT,
+    is_shared BOOLEAN DEFAULT 0,
+    group_id TEXT,
+    original_amount_cents INTEGER,
+    import_hash TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_username) REFERENCES users (username),
+    FOREIGN KEY (category_id) REFERENCES categories (id),
+    FOREIGN KEY (payment_method_id) REFERENCES payment_methods (id),
+    FOREIGN KEY (group_id) REFERENCES expense_groups (id)
+)"""
+
+def to_cents(amount):
+    """Convierte un monto (float, str o Decimal) a centavos enteros, redondeando al centavo."""
+    return int(Decimal(str(amount)).scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+# Formatos con que las versiones anteriores pudieron guardar fechas (día
+# primero, como el date_format por defecto de user_settings)
+LEGACY_DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%Y%m%d']
+
+def parse_legacy_date(value):
+    """Fecha guardada por una versión anterior a 'YYYY-MM-DD', o None si no se reconoce."""
+    text = str(value or '').strip()
+    # Timestamps como '2024-03-07 00:00:00' o '2024-03-07T10:30:00'
+    candidates = [text, text.split(' ')[0].split('T')[0]]
+    for candidate in candidates:
+        for date_format in LEGACY_DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, date_format).strftime(ISO_DATE_FORMAT)
+            except ValueError:
+                continue
+    return None
+
+def migrate_transactions_to_typed_storage(cursor):
+    """Reconstruye transactions con el esquema tipado si todavía usa amount REAL.
+
+    Normaliza las fechas a 'YYYY-MM-DD' (ver LEGACY_DATE_FORMATS) y pasa los
+    montos a centavos. Si alguna fecha no se reconoce la migración se aborta
+    listando esas filas: nunca se inventa una fecha. Los índices y triggers
+    de la tabla vieja se eliminan con ella y se vuelven a crear en
+    initialize_database.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(transactions)")}
+    if 'amount_cents' in columns:
+        return
+
+    # Las fechas que no son ISO válidas se interpretan antes de tocar nada
+    normalized = []
+    unparseable = []
+    for transaction_id, date in cursor.execute(
+            "SELECT id, date FROM transactions WHERE date IS NULL OR date IS NOT date(date)").fetchall():
+        iso_date = parse_legacy_date(date)
+        if iso_date is None:
+            unparseable.append((transaction_id, date))
+        else:
+            normalized.append((iso_date, transaction_id))
+    if unparseable:
+        rows = ', '.join(f"{transaction_id}: {date!r}" for transaction_id, date in unparseable[:20])
+        more = f" y {len(unparseable) - 20} más" if len(unparseable) > 20 else ""
+        raise ValueError(f"{len(unparseable)} transacciones con fecha no reconocida ({rows}{more}). "
+                         "Corrígelas en la base y vuelve a iniciar la aplicación.")
+
+    import_hash = "import_hash" if "import_hash" in columns else "NULL"
+    cursor.execute("SAVEPOINT typed_storage")
+    cursor.executemany("UPDATE transactions SET date = ? WHERE id = ?", normalized)
+    cursor.execute(TRANSACTIONS_TABLE_SQL.format(table_name='transactions_typed'))
+    cursor.execute(f"""
+    INSERT INTO transactions_typed (
+        id, user_username, category_id, payment_method_id, date, amount_cents, type, details,
+        installments_paid, installments_total, purchase_id, is_shared, group_id,
+        original_amount_cents, import_hash, created_at, updated_at)
+    SELECT
+        id, user_username, category_id, payment_method_id, date,
+        CAST(ROUND(amount * 100) AS INTEGER), type, details,
+        installments_paid, installments_total, purchase_id, is_shared, group_id,
+        CAST(ROUND(original_amount * 100) AS INTEGER), {import_hash}, created_at, updated_at
+    FROM transactions
+    """)
+    cursor.execute("DROP TABLE transactions")
+    cursor.execute("ALTER TABLE transactions_typed RENAME TO transactions")
+    cursor.execute("RELEASE typed_storage")
+
+def add_column_if_missing(cursor, table_name, column_name, column_definition):
+    """Agrega una columna a una tabla existente si todavía no la tiene."""
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table_name})")}
+    if column_name not in columns:
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition}")
+
+# --- Resumen Mensual Materializado ---
+
+# Semana ISO de una fecha: el jueves de su semana determina año y número
+ISO_WEEK_SQL = "((CAST(strftime('%j', date({d}, '-3 days', 'weekday 4')) AS INTEGER) - 1) / 7 + 1)"
+
+SUMMARY_KEY_COLUMNS = "user_username, year, month, week, type, category_id, is_shared"
+
+def _summary_key_values(row):
+    """Expresiones SQL de la clave del resumen para NEW/OLD en un trigger."""
+    return (
+        f"{row}.user_username, {row}.year, {row}.month, {ISO_WEEK_SQL.format(d=row + '.date')}, "
+        f"{row}.type, {row}.category_id, COALESCE({row}.is_shared, 0)"
+    )
+
+def _summary_add_sql(row):
+    return f"""
+    INSERT INTO monthly_summary ({SUMMARY_KEY_COLUMNS}, total_cents, count)
+    VALUES ({_summary_key_values(row)}, {row}.amount_cents, 1)
+    ON CONFLICT ({SUMMARY_KEY_COLUMNS}) DO UPDATE SET
+        total_cents = total_cents + excluded.total_cents,
+        count = count + 1;
+    """
+
+def _summary_remove_sql(row):
+    key_match = f"({SUMMARY_KEY_COLUMNS}) = ({_summary_key_values(row)})"
+    return f"""
+    UPDATE monthly_summary SET total_cents = total_cents - {row}.amount_cents, count = count - 1
+    WHERE {key_match};
+    DELETE FROM monthly_summary WHERE {key_match} AND count <= 0;
+    """
+
+def initialize_monthly_summary(cursor):
+    """Crea la tabla monthly_summary y los triggers que la mantienen al día.
+
+    Si los triggers no existían todavía, reconstruye el resumen desde las
+    transacciones existentes dentro de la misma transacción.
+    """
+    # Resúmenes creados antes de guardar los montos en centavos se regeneran
+    summary_columns = {row[1] for row in cursor.execute("PRAGMA table_info(monthly_summary)")}
+    if 'total' in summary_columns:
+        cursor.execute("DROP TABLE monthly_summary")
+        for action in ('insert', 'delete', 'update'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_transactions_summary_{action}")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS monthly_summary (
+        user_username TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        week INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        category_id INTEGER NOT NULL,
+        is_shared BOOLEAN NOT NULL,
+        total_cents INTEGER NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_username, year, month, week, type, category_id, is_shared)
+    ) WITHOUT ROWID""")
+
+    has_triggers = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_transactions_summary_insert'"
+    ).fetchone()
+    if has_triggers:
+        return
+
+    cursor.execute(f"""
+    CREATE TRIGGER trg_transactions_summary_insert AFTER INSERT ON transactions
+    BEGIN {_summary_add_sql('NEW')} END""")
+    cursor.execute(f"""
+    CREATE TRIGGER trg_transactions_summary_delete AFTER DELETE ON transactions
+    BEGIN {_summary_remove_sql('OLD')} END""")
+    cursor.execute(f"""
+    CREATE TRIGGER trg_transactions_summary_update
+    AFTER UPDATE OF user_username, date, amount_cents, type, category_id, is_shared ON transactions
+    BEGIN {_summary_remove_sql('OLD')} {_summary_add_sql('NEW')} END""")
+    rebuild_monthly_summary(cursor)
+
+def rebuild_monthly_summary(cursor=None):
+    """Recalcula monthly_summary completo a partir de transactions."""
+    if cursor is None:
+        run_write(rebuild_monthly_summary)
+        return
+    cursor.execute("DELETE FROM monthly_summary")
+    cursor.execute(f"""
+    INSERT INTO monthly_summary ({SUMMARY_KEY_COLUMNS}, total_cents, count)
+    SELECT user_username, year, month,
+           {ISO_WEEK_SQL.format(d='date')}, type, category_id, COALESCE(is_shared, 0),
+           SUM(amount_cents), COUNT(*)
+    FROM transactions
+    GROUP BY 1, 2, 3, 4, 5, 6, 7
+    """)
+
+def _summary_filter(username, year, month, include_shared):
+    where = "ms.user_username = ? AND ms.year = ? AND ms.month = ?"
+    params = [username, int(year), int(month)]
+    if not include_shared:
+        where += " AND ms.is_shared = 0"
+    return where, params
+
+def get_years_with_data(username):
+    """Años en los que el usuario tiene transacciones."""
+    conn = get_read_connection()
+    try:
+        rows = conn.execute(
+            "SELECT DISTINCT year FROM monthly_summary WHERE user_username = ? ORDER BY year DESC",
+            (username,)
+        ).fetchall()
+        return [row[0] for row in rows]
+    finally:
+        conn.close()
+
+def get_monthly_totals(username, year, month, include_shared=True):
+    """Totales de ingresos y gastos del mes para los KPIs del Dashboard."""
+    where, params = _summary_filter(username, year, month, include_shared)
+    conn = get_read_connection()
+    try:
+        rows = conn.execute(
+            f"SELECT ms.type, SUM(ms.total_cents), SUM(ms.count) FROM monthly_summary ms WHERE {where} GROUP BY ms.type",
+            params
+        ).fetchall()
+        totals = {'Ingreso': 0.0, 'Gasto': 0.0, 'count': 0}
+        for type_, total_cents, count in rows:
+            totals[type_] = total_cents / 100
+            totals['count'] += count
+        return totals
+    finally:
+        conn.close()
+
+def get_category_totals(username, year, month, trans_type='Gasto', include_shared=True):
+    """Totales del mes por categoría (para el gráfico de dona)."""
+    where, params = _summary_filter(username, year, month, include_shared)
+    query = f"""
+    SELECT c.name as category, SUM(ms.total_cents) / 100.0 as amount
+    FROM monthly_summary ms
+    JOIN categories c ON ms.category_id = c.id
+    WHERE {where} AND ms.type = ?
+    GROUP BY c.name
+    ORDER BY amount DESC
+    """
+    conn = get_read_connection()
+    try:
+        return pd.read_sql_query(query, conn, params=params + [trans_type])
+    finally:
+        conn.close()
+
+def get_weekly_trend(username, year, month, include_shared=True):
+    """Totales del mes por semana ISO y tipo (para el gráfico de tendencia)."""
+    where, params = _summary_filter(username, year, month, include_shared)
+    query = f"""
+    SELECT ms.week, ms.type, SUM(ms.total_cents) / 100.0 as amount
+    FROM monthly_summary ms
+    WHERE {where}
+    GROUP BY ms.week, ms.type
+    ORDER BY ms.week
+    """
+    conn = get_read_connection()
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+# --- Datos para Gráficos ---
+
+# Máximo de puntos por serie que se envían al navegador en un gráfico
+CHART_MAX_POINTS = 400
+
+CHART_TYPES = ('Ingreso', 'Gasto')
+
+def _chart_date(value):
+    return datetime.strptime(_to_iso_date(value), ISO_DATE_FORMAT).date()
+
+def _week_start(day):
+    return day - relativedelta(days=day.weekday())
+
+# Por granularidad, de la más fina a la más gruesa: inicio del período de una
+# fecha (Python y SQL), paso del período en SQLite y cantidad de períodos de un
+# rango. Las semanas empiezan el lunes.
+CHART_GRANULARITIES = {
+    'day': {
+        'start': lambda day: day,
+        'sql': "{d}",
+        'step': '+1 day',
+        'count': lambda start, end: (end - start).days + 1,
+    },
+    'week': {
+        'start': _week_start,
+        'sql': "date({d}, '-6 days', 'weekday 1')",
+        'step': '+7 days',
+        'count': lambda start, end: (_week_start(end) - _week_start(start)).days // 7 + 1,
+    },
+    'month': {
+        'start': lambda day: day.replace(day=1),
+        'sql': "printf('%04d-%02d-01', {year}, {month})",
+        'step': '+1 month',
+        'count': lambda start, end: (end.year - start.year) * 12 + end.month - start.month + 1,
+    },
+    'year': {
+        'start': lambda day: day.replace(month=1, day=1),
+        'sql': "printf('%04d-01-01', {year})",
+        'step': '+1 year',
+        'count': lambda start, end: end.year - start.year + 1,
+    },
+}
+
+def chart_granularity(date_from, date_to, granularity=None, max_points=CHART_MAX_POINTS):
+    """Granularidad con la que se grafica un rango sin superar max_points por serie.
+
+    Sin granularity se usa la más fina que entra en el límite; una
+    granularidad pedida que lo excede se reemplaza por la siguiente más gruesa.
+    """
+    start, end = _chart_date(date_from), _chart_date(date_to)
+    names = list(CHART_GRANULARITIES)
+    for name in names[names.index(granularity) if granularity else 0:]:
+        if CHART_GRANULARITIES[name]['count'](start, end) <= max_points:
+            return name
+    return names[-1]
+
+def get_trend_series(username, date_from, date_to, granularity=None, include_shared=True,
+                     max_points=CHART_MAX_POINTS):
+    """Ingresos y gastos por período, agregados en SQL a la granularidad del gráfico.
+
+    Retorna una fila por (período, tipo) con period (inicio del período),
+    type, amount y count; los períodos sin movimientos valen 0 para que las
+    líneas no unan huecos. Día y semana se agregan desde transactions dentro
+    del rango; mes y año desde monthly_summary, con los meses completos de
+    los extremos. Ver chart_granularity para el límite de puntos.
+    """
+    granularity = chart_granularity(date_from, date_to, granularity, max_points)
+    spec = CHART_GRANULARITIES[granularity]
+    start, end = _chart_date(date_from), _chart_date(date_to)
+
+    if granularity in ('day', 'week'):
+        totals = f"""
+        SELECT {spec['sql'].format(d='t.date')} AS period, t.type,
+               SUM(t.amount_cents) AS total_cents, COUNT(*) AS count
+        FROM transactions t
+        WHERE t.user_username = ? AND t.date >= ? AND t.date <= ?
+        """
+        params = [username, start.isoformat(), end.isoformat()]
+        if not include_shared:
+            totals += " AND COALESCE(t.is_shared, 0) = 0"
+    else:
+        totals = f"""
+        SELECT {spec['sql'].format(year='ms.year', month='ms.month')} AS period, ms.type,
+               SUM(ms.total_cents) AS total_cents, SUM(ms.count) AS count
+        FROM monthly_summary ms
+        WHERE ms.user_username = ? AND ms.year * 100 + ms.month BETWEEN ? AND ?
+        """
+        params = [username, start.year * 100 + start.month, end.year * 100 + end.month]
+        if not include_shared:
+            totals += " AND ms.is_shared = 0"
+    totals += " GROUP BY 1, 2"
+
+    query = f"""
+    WITH RECURSIVE periods(period) AS (
+        SELECT ?
+        UNION ALL
+        SELECT date(period, '{spec['step']}') FROM periods WHERE period < ?
+    ),
+    totals AS ({totals})
+    SELECT p.period, k.type, COALESCE(totals.total_cents, 0) / 100.0 AS amount,
+           COALESCE(totals.count, 0) AS count
+    FROM periods p
+    CROSS JOIN (SELECT ? AS type UNION ALL SELECT ?) k
+    LEFT JOIN totals ON totals.period = p.period AND totals.type = k.type
+    ORDER BY p.period, k.type
+    """
+    bounds = [spec['start'](start).isoformat(), spec['start'](end).isoformat()]
+    conn = get_read_connection()
+    try:
+        return pd.read_sql_query(query, conn, params=bounds + params + list(CHART_TYPES),
+                                 parse_dates=['period'])
+    finally:
+        conn.close()
+
+def get_monthly_trend(username, year_from, year_to, include_shared=True, as_of=None,
+                      max_points=CHART_MAX_POINTS):
+    """Tendencia mensual de varios años con comparación interanual.
+
+    Una fila por (mes, tipo) desde enero de year_from hasta el mes de as_of
+    (o diciembre de year_to si es anterior), con amount, previous_year_amount
+    (mismo mes del año anterior, LAG de 12 meses), yoy_change (variación
+    relativa, NULL sin base) y rolling_12m (promedio móvil de 12 meses). El
+    año previo se lee sólo como base de las funciones de ventana. El rango
+    se acorta a los últimos max_points meses.
+    """
+    as_of = _chart_date(as_of or datetime.today())
+    end = min(datetime(int(year_to), 12, 1).date(), as_of.replace(day=1))
+    year_from = max(int(year_from), end.year - max_points // 12 + 1)
+    start = datetime(year_from, 1, 1).date()
+
+    where = "ms.user_username = ? AND ms.year BETWEEN ? AND ?"
+    params = [username, year_from - 1, end.year]
+    if not include_shared:
+        where += " AND ms.is_shared = 0"
+    query = f"""
+    WITH RECURSIVE months(period) AS (
+        SELECT ?
+        UNION ALL
+        SELECT date(period, '+1 month') FROM months WHERE period < ?
+    ),
+    totals AS (
+        SELECT printf('%04d-%02d-01', ms.year, ms.month) AS period, ms.type,
+               SUM(ms.total_cents) AS total_cents
+        FROM monthly_summary ms
+        WHERE {where}
+        GROUP BY ms.year, ms.month, ms.type
+    ),
+    series AS (
+        SELECT m.period, k.type, COALESCE(totals.total_cents, 0) AS total_cents
+        FROM months m
+        CROSS JOIN (SELECT ? AS type UNION ALL SELECT ?) k
+        LEFT JOIN totals ON totals.period = m.period AND totals.type = k.type
+    ),
+    windowed AS (
+        SELECT period, type, total_cents,
+               LAG(total_cents, 12) OVER by_type AS previous_cents,
+               AVG(total_cents) OVER (by_type ROWS BETWEEN 11 PRECEDING AND CURRENT ROW) AS rolling_cents
+        FROM series
+        WINDOW by_type AS (PARTITION BY type ORDER BY period)
+    )
+    SELECT period, type, total_cents / 100.0 AS amount,
+           previous_cents / 100.0 AS previous_year_amount,
+           (total_cents - previous_cents) * 1.0 / NULLIF(previous_cents, 0) AS yoy_change,
+           rolling_cents / 100.0 AS rolling_12m
+    FROM windowed
+    WHERE period >= ?
+    ORDER BY period, type
+    """
+    bounds = [start.replace(year=year_from - 1).isoformat(), end.isoformat()]
+    conn = get_read_connection()
+    try:
+        df = pd.read_sql_query(query, conn, params=bounds + params + list(CHART_TYPES) + [start.isoformat()],
+                               parse_dates=['period'])
+    finally:
+        conn.close()
+    df['year'] = df['period'].dt.year
+    df['month'] = df['period'].dt.month
+    return df
 
 # --- Funciones para Tutorial ---
 
 def get_tutorial_progress(username):
     """Obtiene el progreso del tutorial para un usuario."""
-    conn = get_db_connection()
+    conn = get_read_connection()
     query = "SELECT step_name, completed FROM tutorial_progress WHERE user_username = ?"
     try:
         df = pd.read_sql_query(query, conn, params=(username,))
@@ -204,82 +1583,74 @@ def get_tutorial_progress(username):
 
 def update_tutorial_step(username, step_name, completed=True):
     """Actualiza el progreso de un paso del tutorial."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-    INSERT OR REPLACE INTO tutorial_progress (user_username, step_name, completed, completed_at)
-    VALUES (?, ?, ?, ?)
-    """, (username, step_name, completed, datetime.now() if completed else None))
-    
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute("""
+        INSERT OR REPLACE INTO tutorial_progress (user_username, step_name, completed, completed_at)
+        VALUES (?, ?, ?, ?)
+        """, (username, step_name, completed, datetime.now() if completed else None))
+    run_write(write)
+
+def reset_tutorial_progress(username):
+    """Borra el progreso del tutorial para que vuelva a empezar."""
+    def write(cursor):
+        cursor.execute("DELETE FROM tutorial_progress WHERE user_username = ?", (username,))
+    run_write(write)
 
 # --- Funciones para Gastos Compartidos ---
 
 def create_expense_group(name, description, created_by, members):
     """Crea un grupo para gastos compartidos."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     group_id = str(uuid.uuid4())
-    
-    # Crear el grupo
-    cursor.execute("""
-    INSERT INTO expense_groups (id, name, description, created_by)
-    VALUES (?, ?, ?, ?)
-    """, (group_id, name, description, created_by))
-    
-    # Agregar miembros
-    for member in members:
+
+    def write(cursor):
+        # Crear el grupo
         cursor.execute("""
+        INSERT INTO expense_groups (id, name, description, created_by)
+        VALUES (?, ?, ?, ?)
+        """, (group_id, name, description, created_by))
+
+        # Agregar miembros
+        cursor.executemany("""
         INSERT INTO group_members (group_id, user_username)
         VALUES (?, ?)
-        """, (group_id, member))
-    
-    conn.commit()
-    conn.close()
+        """, [(group_id, member) for member in members])
+
+    run_write(write)
     return group_id
 
 def add_shared_expense(payer_username, category_name, amount, date, details, 
                       group_id, split_method, split_data, payment_method_name=None):
     """Añade un gasto compartido con sus divisiones."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Obtener IDs necesarios
-    category_id = cursor.execute("SELECT id FROM categories WHERE name = ?", (category_name,)).fetchone()[0]
-    payment_method_id = None
-    if payment_method_name:
-        payment_method_id = cursor.execute("SELECT id FROM payment_methods WHERE name = ?", (payment_method_name,)).fetchone()
-        if payment_method_id:
-            payment_method_id = payment_method_id[0]
-    
-    # Crear la transacción principal
     transaction_id = str(uuid.uuid4())
-    cursor.execute("""
-    INSERT INTO transactions (id, user_username, category_id, payment_method_id, date, amount, type, details, is_shared, group_id, original_amount)
-    VALUES (?, ?, ?, ?, ?, ?, 'Gasto', ?, 1, ?, ?)
-    """, (transaction_id, payer_username, category_id, payment_method_id, date, amount, details, group_id, amount))
-    
-    # Crear las divisiones
-    for username, split_amount in split_data.items():
-        if username != payer_username:  # El pagador no se debe a sí mismo
-            cursor.execute("""
-            INSERT INTO expense_splits (transaction_id, user_username, amount, percentage, status)
-            VALUES (?, ?, ?, ?, 'pending')
-            """, (transaction_id, username, split_amount, (split_amount/amount)*100))
-    
-    conn.commit()
-    conn.close()
+
+    def write(cursor):
+        # Obtener IDs necesarios (del pagador, desde la caché de búsquedas)
+        category_id = get_category_id(cursor, category_name, payer_username)
+        payment_method_id = get_payment_method_id(cursor, payment_method_name, payer_username)
+
+        # Crear la transacción principal
+        cursor.execute("""
+        INSERT INTO transactions (id, user_username, category_id, payment_method_id, date, amount_cents, type, details, is_shared, group_id, original_amount_cents)
+        VALUES (?, ?, ?, ?, ?, ?, 'Gasto', ?, 1, ?, ?)
+        """, (transaction_id, payer_username, category_id, payment_method_id, date, to_cents(amount), details, group_id, to_cents(amount)))
+
+        # Crear las divisiones (el pagador no se debe a sí mismo)
+        cursor.executemany("""
+        INSERT INTO expense_splits (transaction_id, user_username, amount, percentage, status)
+        VALUES (?, ?, ?, ?, 'pending')
+        """, [(transaction_id, username, split_amount, (split_amount/amount)*100)
+              for username, split_amount in split_data.items() if username != payer_username])
+
+    run_write(write)
     return transaction_id
 
 def get_pending_splits_for_user(username):
     """Obtiene las divisiones pendientes de pago para un usuario."""
-    conn = get_db_connection()
+    conn = get_read_connection()
     query = """
-    SELECT es.id, es.amount, es.percentage, t.details, t.date, 
-           u.name as payer_name, c.name as category, eg.name as group_name
+    SELECT es.id, es.amount, es.paid_amount, es.amount - es.paid_amount as outstanding,
+           es.percentage, t.details, t.date, t.group_id,
+           t.user_username as payer_username, u.name as payer_name, c.name as category, eg.name as group_name
     FROM expense_splits es
     JOIN transactions t ON es.transaction_id = t.id
     JOIN users u ON t.user_username = u.username
@@ -295,44 +1666,820 @@ def get_pending_splits_for_user(username):
 
 def mark_split_as_paid(split_id):
     """Marca una división como pagada."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-    UPDATE expense_splits 
-    SET status = 'paid', paid_at = ?
-    WHERE id = ?
-    """, (datetime.now(), split_id))
-    
-    conn.commit()
-    conn.close()
+    update_splits_status('paid', split_ids=[split_id])
+
+SPLIT_ACTIONS = ('paid', 'cancelled', 'partial')
+
+def update_splits_status(action, split_ids=None, username=None, counterparty=None, group_id=None,
+                         partial_amount=None):
+    """Actualiza en lote divisiones pendientes, en una sola transacción.
+
+    Las divisiones se eligen por lista de ids, por deudor (username) y/o
+    acreedor (counterparty), o por grupo; los criterios se combinan.
+    action es 'paid', 'cancelled' o 'partial'. Un pago parcial reparte
+    partial_amount entre las divisiones elegidas empezando por la más
+    antigua; las que quedan cubiertas pasan a 'paid'.
+
+    Retorna (divisiones actualizadas, usuarios afectados).
+    """
+    if action not in SPLIT_ACTIONS:
+        raise ValueError(f"Acción de división inválida: '{action}'")
+    if not (split_ids or username or counterparty or group_id):
+        raise ValueError("Se requiere al menos un criterio para elegir las divisiones.")
+
+    conditions = ["es.status = 'pending'"]
+    params = []
+    if split_ids:
+        conditions.append(f"es.id IN ({', '.join('?' * len(split_ids))})")
+        params.extend(int(split_id) for split_id in split_ids)
+    if username:
+        conditions.append("es.user_username = ?")
+        params.append(username)
+    if counterparty:
+        conditions.append("t.user_username = ?")
+        params.append(counterparty)
+    if group_id:
+        conditions.append("t.group_id = ?")
+        params.append(group_id)
+
+    def write(cursor):
+        # Se leen dentro de la escritura para que nadie las modifique entre medio
+        splits = cursor.execute(f"""
+        SELECT es.id, es.amount - es.paid_amount as outstanding, es.user_username, t.user_username
+        FROM expense_splits es
+        JOIN transactions t ON es.transaction_id = t.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY t.date, es.id
+        """, params).fetchall()
+
+        now = datetime.now()
+        if action == 'paid':
+            updates = [(now, split[0]) for split in splits]
+            cursor.executemany("""
+            UPDATE expense_splits SET status = 'paid', paid_amount = amount, paid_at = ? WHERE id = ?
+            """, updates)
+        elif action == 'cancelled':
+            updates = [(split[0],) for split in splits]
+            cursor.executemany("UPDATE expense_splits SET status = 'cancelled' WHERE id = ?", updates)
+        else:
+            remaining = to_cents(partial_amount or 0)
+            updates = []
+            for split_id, outstanding, _, _ in splits:
+                if remaining <= 0:
+                    break
+                payment = min(remaining, to_cents(outstanding))
+                remaining -= payment
+                updates.append((payment / 100, now, split_id))
+            cursor.executemany("""
+            UPDATE expense_splits
+            SET paid_amount = paid_amount + ?,
+                status = CASE WHEN amount - paid_amount - ? <= 0.005 THEN 'paid' ELSE status END,
+                paid_at = ?
+            WHERE id = ?
+            """, [(payment, payment, paid_at, split_id) for payment, paid_at, split_id in updates])
+        return splits, updates
+
+    splits, updates = run_write(write)
+    affected_ids = {update[-1] for update in updates}
+    affected_users = {user for split in splits if split[0] in affected_ids for user in split[2:]}
+    return len(updates), affected_users
+
+def _pending_splits_scope(group_id=None, usernames=None, max_split_id=None):
+    """Condiciones SQL para las divisiones pendientes de un grupo y/o conjunto de usuarios.
+
+    Con max_split_id sólo entran las divisiones creadas hasta esa (los ids
+    son crecientes), sin importar cuántas sean.
+    """
+    conditions = ["es.status = 'pending'"]
+    params = []
+    if group_id:
+        conditions.append("t.group_id = ?")
+        params.append(group_id)
+    if usernames:
+        placeholders = ", ".join("?" * len(usernames))
+        conditions.append(f"es.user_username IN ({placeholders}) AND t.user_username IN ({placeholders})")
+        params.extend(usernames)
+        params.extend(usernames)
+    if max_split_id is not None:
+        conditions.append("es.id <= ?")
+        params.append(int(max_split_id))
+    return " AND ".join(conditions), params
+
+def get_pending_splits_watermark(group_id=None, usernames=None):
+    """Id de la última división pendiente del alcance (0 si no hay ninguna)."""
+    where, params = _pending_splits_scope(group_id, usernames)
+    conn = get_read_connection()
+    try:
+        return conn.execute(f"""
+        SELECT COALESCE(MAX(es.id), 0)
+        FROM expense_splits es
+        JOIN transactions t ON es.transaction_id = t.id
+        WHERE {where}
+        """, params).fetchone()[0]
+    finally:
+        conn.close()
+
+def get_pending_balances(group_id=None, usernames=None, max_split_id=None):
+    """Deuda pendiente agregada por par (deudor -> acreedor) en una sola consulta.
+
+    Con max_split_id sólo se suman las divisiones creadas hasta esa.
+    Retorna una lista de tuplas (deudor, acreedor, monto, cantidad de divisiones).
+    """
+    where, params = _pending_splits_scope(group_id, usernames, max_split_id)
+    conn = get_read_connection()
+    try:
+        return [tuple(row) for row in conn.execute(f"""
+        SELECT es.user_username as debtor, t.user_username as creditor,
+               SUM(es.amount - es.paid_amount) as amount, COUNT(*) as splits
+        FROM expense_splits es
+        JOIN transactions t ON es.transaction_id = t.id
+        WHERE {where} AND es.user_username <> t.user_username
+        GROUP BY es.user_username, t.user_username
+        """, params)]
+    finally:
+        conn.close()
+
+def settle_all_splits(group_id=None, usernames=None, max_split_id=None):
+    """Marca como pagadas todas las divisiones pendientes del alcance en una transacción.
+
+    Con max_split_id sólo se saldan las divisiones creadas hasta esa: las
+    del plan que vio quien confirma, no las que se agregaron después.
+    Retorna el conjunto de usuarios afectados (deudores y acreedores).
+    """
+    where, params = _pending_splits_scope(group_id, usernames, max_split_id)
+
+    def write(cursor):
+        affected = cursor.execute(f"""
+        SELECT DISTINCT es.user_username, t.user_username
+        FROM expense_splits es
+        JOIN transactions t ON es.transaction_id = t.id
+        WHERE {where}
+        """, params).fetchall()
+        cursor.execute(f"""
+        UPDATE expense_splits SET status = 'paid', paid_amount = amount, paid_at = ?
+        WHERE id IN (
+            SELECT es.id FROM expense_splits es
+            JOIN transactions t ON es.transaction_id = t.id
+            WHERE {where}
+        )
+        """, [datetime.now()] + params)
+        return affected
+
+    affected = run_write(write)
+    return {username for pair in affected for username in pair}
+
+# --- Funciones para Transacciones y Cuotas ---
+
+# Caché (tabla, usuario) -> {nombre: id} de categorías y métodos de pago.
+# Las escrituras sobre esas tablas deben llamar a invalidate_name_id_cache().
+_name_id_cache = {}
+_name_id_cache_lock = threading.Lock()
+
+def invalidate_name_id_cache():
+    """Descarta los mapas nombre -> id cacheados (de todos los usuarios).
+
+    Se vacía completo porque las categorías por defecto de un usuario son
+    visibles para los demás.
+    """
+    with _name_id_cache_lock:
+        _name_id_cache.clear()
+
+def _load_name_id_map(cursor, table_name, username):
+    """Lee el mapa nombre -> id del usuario y lo guarda en la caché."""
+    rows = cursor.execute(f"""
+    SELECT name, id FROM {table_name}
+    WHERE user_username = ? OR is_default = 1
+    ORDER BY user_username = ? ASC
+    """, (username, username)).fetchall()
+    name_ids = {name: id_ for name, id_ in rows}
+    with _name_id_cache_lock:
+        _name_id_cache[(table_name, username)] = name_ids
+    return name_ids
+
+def _lookup_id(cursor, table_name, name, username):
+    """Id de name para el usuario desde la caché; ante un faltante se relee una vez."""
+    name_ids = _name_id_cache.get((table_name, username))
+    if name_ids is None or name not in name_ids:
+        name_ids = _load_name_id_map(cursor, table_name, username)
+    return name_ids.get(name)
+
+def get_category_id(cursor, category_name, username):
+    """Resuelve el id de una categoría del usuario (o por defecto) por su nombre."""
+    category_id = _lookup_id(cursor, 'categories', category_name, username)
+    if category_id is None:
+        raise ValueError(f"La categoría '{category_name}' no existe.")
+    return category_id
+
+def get_payment_method_id(cursor, payment_method_name, username):
+    """Resuelve el id de un método de pago del usuario por su nombre (o None)."""
+    if not payment_method_name:
+        return None
+    return _lookup_id(cursor, 'payment_methods', payment_method_name, username)
+
+def get_name_id_map(table_name, username):
+    """Mapa nombre -> id de categorías o métodos de pago visibles para el usuario.
+
+    Si un nombre existe como propio y como categoría por defecto de otro
+    usuario, gana el propio. Se sirve desde la caché de búsquedas.
+    """
+    name_ids = _name_id_cache.get((table_name, username))
+    if name_ids is None:
+        conn = get_db_connection()
+        try:
+            name_ids = _load_name_id_map(conn.cursor(), table_name, username)
+        finally:
+            conn.close()
+    return dict(name_ids)
+
+def bulk_insert_transactions(user_username, rows):
+    """Inserta transacciones ya resueltas en una sola transacción con executemany.
+
+    Cada fila es un dict con category_id, date, amount, type y opcionalmente
+    payment_method_id, details e import_hash. Las filas cuyo import_hash ya
+    existe se ignoran. Retorna la cantidad de filas insertadas.
+    """
+    params = [
+        (str(uuid.uuid4()), user_username, row['category_id'], row.get('payment_method_id'),
+         row['date'], to_cents(row['amount']), row['type'], row.get('details'), row.get('import_hash'))
+        for row in rows
+    ]
+    def write(cursor):
+        cursor.executemany("""
+        INSERT OR IGNORE INTO transactions (id, user_username, category_id, payment_method_id, date, amount_cents, type,
+                                            details, import_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, params)
+        # rowcount suma sólo las filas insertadas (no las ignoradas ni las de triggers)
+        return cursor.rowcount
+
+    return run_write(write)
+
+def split_into_installments(total_cents, installments):
+    """Divide un monto en centavos en cuotas exactas.
+
+    Los centavos sobrantes se reparten en las primeras cuotas, de modo que
+    la suma de las cuotas es exactamente el total.
+    """
+    installments = max(int(installments), 1)
+    base, remainder = divmod(int(total_cents), installments)
+    return [base + (1 if i < remainder else 0) for i in range(installments)]
+
+def add_transaction(user_username, category_name, amount, trans_type, date, payment_method_name=None,
+                    details=None, installments=1, total_amount=None):
+    """Añade una transacción; en cuotas genera una fila por mes con un purchase_id común.
+
+    Todas las filas se escriben con un solo executemany y un solo commit.
+    Retorna el purchase_id en compras en cuotas o el id de la transacción.
+    """
+    installments = max(int(installments or 1), 1)
+    total_amount = amount if total_amount is None else total_amount
+    first_date = datetime.strptime(date, '%Y-%m-%d') if isinstance(date, str) else date
+
+    purchase_id = str(uuid.uuid4()) if installments > 1 else None
+    total_cents = to_cents(total_amount)
+    amounts = split_into_installments(total_cents, installments) if installments > 1 else [to_cents(amount)]
+    ids = [str(uuid.uuid4()) for _ in amounts]
+
+    def write(cursor):
+        category_id = get_category_id(cursor, category_name, user_username)
+        payment_method_id = get_payment_method_id(cursor, payment_method_name, user_username)
+        rows = [
+            (ids[number], user_username, category_id, payment_method_id,
+             (first_date + relativedelta(months=number)).strftime('%Y-%m-%d'),
+             installment_amount, trans_type, details, number + 1, installments,
+             purchase_id, total_cents)
+            for number, installment_amount in enumerate(amounts)
+        ]
+        cursor.executemany("""
+        INSERT INTO transactions (id, user_username, category_id, payment_method_id, date, amount_cents, type, details,
+                                  installments_paid, installments_total, purchase_id, original_amount_cents)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+    run_write(write)
+    return purchase_id or ids[0]
+
+def get_outstanding_installments(username, as_of=None):
+    """Compras en cuotas con cuotas pendientes, agrupadas por compra y tarjeta."""
+    as_of = _to_iso_date(as_of or datetime.today())
+    query = """
+    SELECT 
+        t.purchase_id,
+        p.name as payment_method,
+        c.name as category,
+        MAX(t.details) as details,
+        MAX(t.original_amount_cents) / 100.0 as original_amount,
+        MAX(t.installments_total) as installments_total,
+        COUNT(*) as installments_remaining,
+        SUM(t.amount_cents) / 100.0 as amount_remaining,
+        MIN(t.date) as next_date,
+        MAX(t.date) as last_date
+    FROM transactions t
+    JOIN categories c ON t.category_id = c.id
+    LEFT JOIN payment_methods p ON t.payment_method_id = p.id
+    WHERE t.user_username = ? AND t.purchase_id IS NOT NULL AND t.date > ?
+    GROUP BY t.purchase_id
+    ORDER BY payment_method, next_date
+    """
+    conn = get_read_connection()
+    try:
+        return pd.read_sql_query(query, conn, params=(username, as_of))
+    finally:
+        conn.close()
+
+def get_installment_schedule(username, payment_method_name=None, as_of=None):
+    """Calendario mensual de cuotas futuras por tarjeta (monto y cantidad por mes)."""
+    as_of = _to_iso_date(as_of or datetime.today())
+    query = """
+    SELECT 
+        p.name as payment_method,
+        strftime('%Y-%m', t.date) as month,
+        SUM(t.amount_cents) / 100.0 as amount,
+        COUNT(*) as installments
+    FROM transactions t
+    LEFT JOIN payment_methods p ON t.payment_method_id = p.id
+    WHERE t.user_username = ? AND t.purchase_id IS NOT NULL AND t.date > ?
+    """
+    params = [username, as_of]
+    if payment_method_name:
+        query += " AND p.name = ?"
+        params.append(payment_method_name)
+    query += " GROUP BY p.name, month ORDER BY month, payment_method"
+    conn = get_read_connection()
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+def get_monthly_category_totals(username, date_from, date_to, exclude_installments=True):
+    """Totales por mes ('YYYY-MM'), categoría y tipo en centavos, agregados en SQL.
+
+    Con exclude_installments se omiten las cuotas, que se proyectan aparte.
+    """
+    query = """
+    SELECT strftime('%Y-%m', t.date) as month, c.name as category, t.type,
+           SUM(t.amount_cents) as amount_cents, COUNT(*) as count
+    FROM transactions t
+    JOIN categories c ON t.category_id = c.id
+    WHERE t.user_username = ? AND t.date >= ? AND t.date <= ?
+    """
+    if exclude_installments:
+        query += " AND t.purchase_id IS NULL"
+    query += " GROUP BY month, c.name, t.type"
+    conn = get_read_connection()
+    try:
+        return pd.read_sql_query(query, conn, params=(username, _to_iso_date(date_from), _to_iso_date(date_to)))
+    finally:
+        conn.close()
+
+def get_balance(username, as_of=None):
+    """Saldo acumulado (ingresos - gastos) en centavos hasta as_of inclusive."""
+    conn = get_read_connection()
+    try:
+        row = conn.execute("""
+        SELECT COALESCE(SUM(CASE WHEN type = 'Ingreso' THEN amount_cents ELSE -amount_cents END), 0)
+        FROM transactions
+        WHERE user_username = ? AND date <= ?
+        """, (username, _to_iso_date(as_of or datetime.today()))).fetchone()
+        return row[0]
+    finally:
+        conn.close()
+
+# --- Funciones para Presupuestos ---
+
+def get_budget_periods(as_of=None):
+    """Rango vigente (inicio, fin, días transcurridos, días totales) de cada período."""
+    as_of = datetime.strptime(_to_iso_date(as_of or datetime.today()), ISO_DATE_FORMAT)
+    week_start = as_of - relativedelta(days=as_of.weekday())
+    month_start = as_of.replace(day=1)
+    year_start = as_of.replace(month=1, day=1)
+    starts_and_ends = {
+        'weekly': (week_start, week_start + relativedelta(days=6)),
+        'monthly': (month_start, month_start + relativedelta(months=1, days=-1)),
+        'yearly': (year_start, year_start + relativedelta(years=1, days=-1)),
+    }
+    return {
+        period: (start.strftime(ISO_DATE_FORMAT), end.strftime(ISO_DATE_FORMAT),
+                 (as_of - start).days + 1, (end - start).days + 1)
+        for period, (start, end) in starts_and_ends.items()
+    }
+
+def get_budgets_with_details(username, as_of=None):
+    """Presupuesto vs. gasto real de cada categoría en su período vigente.
+
+    Una sola consulta agregada calcula, por presupuesto activo, el gasto del
+    período (semana, mes o año según budgets.period), lo que resta, el
+    porcentaje usado y la proyección al cierre según el ritmo de gasto.
+    """
+    periods = get_budget_periods(as_of)
+    period_values = ", ".join("(?, ?, ?, ?, ?)" for _ in periods)
+    query = f"""
+    WITH periods(period, start_date, end_date, elapsed_days, total_days) AS (VALUES {period_values})
+    SELECT 
+        b.id,
+        c.name as category,
+        b.amount,
+        b.period,
+        p.start_date,
+        p.end_date,
+        COALESCE(SUM(t.amount_cents), 0) / 100.0 as spent,
+        b.amount - COALESCE(SUM(t.amount_cents), 0) / 100.0 as remaining,
+        CASE WHEN b.amount > 0 THEN COALESCE(SUM(t.amount_cents), 0) / 100.0 / b.amount END as used_ratio,
+        COALESCE(SUM(t.amount_cents), 0) / 100.0 / p.elapsed_days * p.total_days as projected
+    FROM budgets b
+    JOIN periods p ON p.period = b.period
+    JOIN categories c ON b.category_id = c.id
+    LEFT JOIN transactions t ON t.user_username = b.user_username
+        AND t.category_id = b.category_id
+        AND t.type = 'Gasto'
+        AND t.date BETWEEN p.start_date AND p.end_date
+    WHERE b.user_username = ? AND b.is_active = 1
+    GROUP BY b.id
+    ORDER BY c.name
+    """
+    params = [value for period, values in periods.items() for value in (period, *values)]
+    conn = get_read_connection()
+    try:
+        return pd.read_sql_query(query, conn, params=params + [username])
+    finally:
+        conn.close()
+
+# --- Funciones para Metas de Ahorro ---
+
+# Días de aportes recientes usados para estimar el ritmo de ahorro
+CONTRIBUTION_RATE_DAYS = 90
+
+def create_savings_goal(username, name, target_amount, target_date=None, description=None):
+    """Crea una meta de ahorro y retorna su id."""
+    def write(cursor):
+        cursor.execute("""
+        INSERT INTO savings_goals (user_username, name, target_amount, current_amount, target_date, description)
+        VALUES (?, ?, ?, 0, ?, ?)
+        """, (username, name, target_amount, _to_iso_date(target_date) if target_date else None, description))
+        return cursor.lastrowid
+
+    return run_write(write)
+
+def set_savings_goal_active(goal_id, username, is_active):
+    """Archiva o reactiva una meta del usuario."""
+    def write(cursor):
+        cursor.execute("UPDATE savings_goals SET is_active = ? WHERE id = ? AND user_username = ?",
+                       (1 if is_active else 0, goal_id, username))
+    run_write(write)
+
+def add_goal_contribution(goal_id, username, amount, date=None, transaction_id=None,
+                          category_name=None, payment_method_name=None, details=None):
+    """Registra un aporte (o retiro, si amount es negativo) a una meta.
+
+    El aporte puede vincularse a una transacción existente (transaction_id)
+    o, si se indica category_name, se registra también como gasto en la
+    misma operación. current_amount de la meta lo actualizan los triggers.
+    Retorna el id del aporte.
+    """
+    amount_cents = to_cents(amount)
+    if amount_cents == 0:
+        raise ValueError("El aporte debe ser distinto de cero.")
+    date = _to_iso_date(date or datetime.today())
+
+    def write(cursor):
+        goal = cursor.execute("SELECT name FROM savings_goals WHERE id = ? AND user_username = ?",
+                              (goal_id, username)).fetchone()
+        if goal is None:
+            raise ValueError(f"Meta de ahorro {goal_id} no encontrada.")
+
+        linked_transaction_id = transaction_id
+        if linked_transaction_id is None and category_name:
+            category_id = get_category_id(cursor, category_name, username)
+            payment_method_id = get_payment_method_id(cursor, payment_method_name, username) if payment_method_name else None
+            linked_transaction_id = str(uuid.uuid4())
+            cursor.execute("""
+            INSERT INTO transactions (id, user_username, category_id, payment_method_id, date, amount_cents, type, details)
+            VALUES (?, ?, ?, ?, ?, ?, 'Gasto', ?)
+            """, (linked_transaction_id, username, category_id, payment_method_id, date, abs(amount_cents),
+                  details or f"Aporte a meta: {goal[0]}"))
+
+        cursor.execute("""
+        INSERT INTO savings_contributions (goal_id, user_username, transaction_id, amount_cents, date)
+        VALUES (?, ?, ?, ?, ?)
+        """, (goal_id, username, linked_transaction_id, amount_cents, date))
+        return cursor.lastrowid
+
+    return run_write(write)
+
+def delete_goal_contribution(contribution_id, username):
+    """Elimina un aporte; la transacción vinculada (si la hay) se conserva."""
+    def write(cursor):
+        cursor.execute("DELETE FROM savings_contributions WHERE id = ? AND user_username = ?",
+                       (contribution_id, username))
+    run_write(write)
+
+def get_goal_contributions(goal_id, username, limit=50):
+    """Últimos aportes de una meta."""
+    conn = get_read_connection()
+    try:
+        return pd.read_sql_query("""
+        SELECT id, date, amount_cents / 100.0 as amount, transaction_id
+        FROM savings_contributions
+        WHERE goal_id = ? AND user_username = ?
+        ORDER BY date DESC, id DESC
+        LIMIT ?
+        """, conn, params=(goal_id, username, limit), parse_dates={"date": ISO_DATE_FORMAT})
+    finally:
+        conn.close()
+
+def get_savings_goals(username, as_of=None, include_inactive=False):
+    """Metas del usuario con avance y fecha estimada de cumplimiento.
+
+    El avance sale de current_amount (mantenido por triggers) y el ritmo
+    de los aportes de los últimos CONTRIBUTION_RATE_DAYS días, que se leen
+    por índice (goal_id, date): el costo depende de las metas y no del
+    historial de transacciones. La proyección se calcula vectorizada.
+    """
+    as_of = pd.Timestamp(as_of or datetime.today()).normalize()
+    window_start = as_of - pd.Timedelta(days=CONTRIBUTION_RATE_DAYS)
+    query = """
+    SELECT
+        g.id, g.name, g.target_amount, COALESCE(g.current_amount, 0) as current_amount,
+        g.target_date, g.description, g.is_active, date(g.created_at) as created_date,
+        COALESCE(SUM(c.amount_cents), 0) / 100.0 as recent_contributions,
+        MIN(c.date) as first_contribution
+    FROM savings_goals g
+    LEFT JOIN savings_contributions c ON c.goal_id = g.id AND c.date > ? AND c.date <= ?
+    WHERE g.user_username = ?
+    """
+    params = [_to_iso_date(window_start), _to_iso_date(as_of), username]
+    if not include_inactive:
+        query += " AND g.is_active = 1"
+    query += " GROUP BY g.id ORDER BY g.target_date IS NULL, g.target_date, g.name"
+
+    conn = get_read_connection()
+    try:
+        goals = pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+    target_date = pd.to_datetime(goals['target_date'], format=ISO_DATE_FORMAT)
+    # Las metas nuevas miden el ritmo sólo desde su creación (o su primer aporte, si es anterior)
+    started = pd.concat([
+        pd.to_datetime(goals['created_date'], format=ISO_DATE_FORMAT),
+        pd.to_datetime(goals['first_contribution'], format=ISO_DATE_FORMAT),
+    ], axis=1).min(axis=1)
+    remaining = (goals['target_amount'] - goals['current_amount']).clip(lower=0)
+
+    window_days = (as_of - started).dt.days.clip(lower=1, upper=CONTRIBUTION_RATE_DAYS)
+    daily_rate = (goals['recent_contributions'] / window_days).where(lambda rate: rate > 0)
+    days_needed = np.ceil(remaining / daily_rate)
+    months_left = ((target_date - as_of).dt.days / 30.4375).where(lambda months: months > 0)
+
+    goals['target_date'] = target_date
+    goals['progress'] = (goals['current_amount'] / goals['target_amount']).where(goals['target_amount'] > 0).clip(0, 1)
+    goals['remaining'] = remaining
+    goals['monthly_rate'] = (daily_rate * 30.4375).fillna(0).round(2)
+    goals['projected_date'] = (as_of + pd.to_timedelta(days_needed, unit='D')).where(remaining > 0, as_of)
+    goals['required_monthly'] = (remaining / months_left).round(2)
+    goals['on_track'] = (goals['projected_date'] <= target_date) | (remaining == 0)
+    return goals.drop(columns=['created_date', 'first_contribution'])
 
 # --- Funciones mejoradas existentes ---
 
 def get_data_as_dataframe(table_name, user_username=None):
     """Obtiene datos filtrados por usuario cuando corresponde."""
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
-        if user_username and table_name in ['categories', 'payment_methods', 'budgets']:
+        if user_username and table_name in ['categories', 'payment_methods']:
             query = f"SELECT * FROM {table_name} WHERE user_username = ? OR is_default = 1"
             df = pd.read_sql_query(query, conn, params=(user_username,))
+        elif user_username and table_name == 'budgets':
+            df = pd.read_sql_query("SELECT * FROM budgets WHERE user_username = ?", conn, params=(user_username,))
         else:
             df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
         
         if "date" in df.columns:
-            df["date"] = pd.to_datetime(df["date"])
+            # Las fechas se guardan validadas como 'YYYY-MM-DD': formato fijo, sin inferencia
+            df["date"] = pd.to_datetime(df["date"], format=ISO_DATE_FORMAT)
         return df
     finally:
         conn.close()
 
-def get_transactions_with_details(user_username=None):
-    """Obtiene transacciones con detalles, opcionalmente filtradas por usuario."""
+# --- Sincronización de Tablas Editadas (st.data_editor) ---
+
+# Por tabla: columnas editables, obligatorias, valores permitidos y mínimos
+# (CHECK), combinaciones únicas por usuario, valores al insertar y tablas que la
+# referencian (una fila referenciada no se puede borrar).
+SYNC_TABLES = {
+    'categories': {
+        'columns': ['name', 'type', 'icon', 'color'],
+        'required': ['name', 'type'],
+        'choices': {'type': ('Ingreso', 'Gasto')},
+        'unique': [('name',)],
+        'insert_values': {'is_default': 0},
+        'references': [('transactions', 'category_id'), ('budgets', 'category_id')],
+    },
+    'payment_methods': {
+        'columns': ['name', 'type'],
+        'required': ['name'],
+        'choices': {'type': ('Efectivo', 'Tarjeta Débito', 'Tarjeta Crédito', 'Transferencia', 'Billetera Digital')},
+        'unique': [('name',)],
+        'insert_values': {'is_default': 0},
+        'references': [('transactions', 'payment_method_id')],
+    },
+    'budgets': {
+        'columns': ['category_id', 'amount', 'period'],
+        'required': ['category_id', 'amount', 'period'],
+        'choices': {'period': ('weekly', 'monthly', 'yearly')},
+        'minimum': {'amount': 0},
+        'unique': [('category_id', 'period')],
+        'insert_values': {'is_active': 1},
+        'references': [],
+    },
+}
+
+def _sync_value(value):
+    """Valor de una celda listo para SQLite (NaN/NaT/'' -> None, tipos numpy -> Python)."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value.item() if hasattr(value, 'item') else value
+
+def _sync_rows(df, columns):
+    """{id: tupla de columnas} de las filas con id y lista de filas nuevas (sin id)."""
+    existing, new = {}, []
+    if df is None or df.empty:
+        return existing, new
+    has_id = 'id' in df.columns
+    for record in df.to_dict('records'):
+        values = tuple(_sync_value(record.get(column)) for column in columns)
+        row_id = _sync_value(record.get('id')) if has_id else None
+        if row_id is None:
+            # Filas vacías agregadas en el editor y descartadas sin completar
+            if any(value is not None for value in values):
+                new.append(values)
+        else:
+            existing[int(row_id)] = values
+    return existing, new
+
+def diff_dataframes(edited, original, columns):
+    """Compara por id la tabla editada con la original.
+
+    Retorna (inserts, updates, deletes): filas nuevas, (id, valores) de las
+    filas con algún cambio en columns e ids que ya no están.
+    """
+    original_rows, _ = _sync_rows(original, columns)
+    edited_rows, inserts = _sync_rows(edited, columns)
+    updates = [(row_id, values) for row_id, values in edited_rows.items()
+               if row_id in original_rows and original_rows[row_id] != values]
+    # Una fila con id que no estaba en la original se trata como nueva
+    inserts += [values for row_id, values in edited_rows.items() if row_id not in original_rows]
+    deletes = [row_id for row_id in original_rows if row_id not in edited_rows]
+    return inserts, updates, deletes
+
+def _validate_sync(cursor, table_name, spec, username, inserts, updates, deletes):
+    """Valida obligatorios, CHECK, UNIQUE, propiedad y referencias antes de escribir."""
+    columns = spec['columns']
+    errors = []
+    for values in inserts + [values for _, values in updates]:
+        row = dict(zip(columns, values))
+        missing = [column for column in spec['required'] if row[column] is None]
+        if missing:
+            errors.append(f"Faltan valores en {', '.join(missing)}.")
+        for column, choices in spec['choices'].items():
+            if row[column] is not None and row[column] not in choices:
+                errors.append(f"'{row[column]}' no es un valor válido para {column}.")
+        for column, minimum in spec.get('minimum', {}).items():
+            if row[column] is not None and row[column] < minimum:
+                errors.append(f"{column} no puede ser menor que {minimum}.")
+
+    owned = {row_id: tuple(values) for row_id, *values in cursor.execute(
+        f"SELECT id, {', '.join(columns)} FROM {table_name} WHERE user_username = ?", (username,)
+    )}
+    foreign = [row_id for row_id, _ in updates if row_id not in owned] + [row_id for row_id in deletes if row_id not in owned]
+    if foreign:
+        errors.append("Sólo puedes modificar o eliminar tus propios registros.")
+
+    # Estado final de las filas del usuario, para verificar las restricciones UNIQUE
+    final_rows = dict(owned)
+    final_rows.update(updates)
+    for row_id in deletes:
+        final_rows.pop(row_id, None)
+    final_rows = list(final_rows.values()) + inserts
+    for unique_columns in spec['unique']:
+        positions = [columns.index(column) for column in unique_columns]
+        keys = [tuple(row[position] for position in positions) for row in final_rows]
+        duplicated = {key for key in keys if keys.count(key) > 1}
+        if duplicated:
+            errors.append(f"Valores repetidos en {', '.join(unique_columns)}: "
+                          + ', '.join(' / '.join(str(value) for value in key) for key in sorted(duplicated, key=str)))
+
+    if deletes:
+        placeholders = ', '.join('?' for _ in deletes)
+        for reference_table, reference_column in spec['references']:
+            referenced = cursor.execute(f"""
+            SELECT DISTINCT {reference_column} FROM {reference_table}
+            WHERE {reference_column} IN ({placeholders})
+            """, deletes).fetchall()
+            if referenced:
+                names = ', '.join(str(owned.get(row[0], (row[0],))[0]) for row in referenced)
+                errors.append(f"No se puede eliminar {names}: tiene registros en {reference_table}.")
+
+    if errors:
+        raise ValueError(' '.join(dict.fromkeys(errors)))
+
+def sync_from_dataframe(edited, table_name, original=None, username=None):
+    """Aplica a la tabla sólo las filas insertadas, modificadas y eliminadas en el editor.
+
+    original es el DataFrame que se le pasó a st.data_editor (si falta se
+    leen las filas del usuario). Todo se valida antes de escribir y se
+    aplica con executemany en una sola transacción. Retorna un dict con
+    inserted, updated y deleted.
+    """
+    spec = SYNC_TABLES[table_name]
+    columns = spec['columns']
+    if username is None:
+        raise ValueError("Se requiere el usuario para sincronizar la tabla.")
+
+    if original is None:
+        conn = get_db_connection()
+        try:
+            original = pd.read_sql_query(f"SELECT * FROM {table_name} WHERE user_username = ?", conn,
+                                         params=(username,))
+        finally:
+            conn.close()
+    inserts, updates, deletes = diff_dataframes(edited, original, columns)
+    result = {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes)}
+    if not (inserts or updates or deletes):
+        return result
+
+    insert_columns = columns + ['user_username'] + list(spec['insert_values'])
+
+    def write(cursor):
+        # Validación y escritura dentro de la misma transacción
+        _validate_sync(cursor, table_name, spec, username, inserts, updates, deletes)
+        if inserts:
+            cursor.executemany(f"""
+            INSERT INTO {table_name} ({', '.join(insert_columns)})
+            VALUES ({', '.join('?' for _ in insert_columns)})
+            """, [values + (username,) + tuple(spec['insert_values'].values()) for values in inserts])
+        if updates:
+            cursor.executemany(f"""
+            UPDATE {table_name} SET {', '.join(f'{column} = ?' for column in columns)}
+            WHERE id = ? AND user_username = ?
+            """, [values + (row_id, username) for row_id, values in updates])
+        if deletes:
+            cursor.executemany(f"DELETE FROM {table_name} WHERE id = ? AND user_username = ?",
+                               [(row_id, username) for row_id in deletes])
+
+    try:
+        run_write(write)
+    except sqlite3.IntegrityError as e:
+        raise ValueError(f"No se pudieron guardar los cambios: {e}")
+
+    if table_name in ('categories', 'payment_methods'):
+        invalidate_name_id_cache()
+    return result
+
+def sync_budgets_from_dataframe(edited, original=None, username=None):
+    """Sincroniza el editor de presupuestos (con columna category por nombre)."""
+    if username is None:
+        raise ValueError("Se requiere el usuario para sincronizar los presupuestos.")
+
     conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        def with_category_ids(df):
+            if df is None:
+                return None
+            df = df.copy()
+            unknown = sorted({name for name in df['category'].dropna()
+                              if _lookup_id(cursor, 'categories', name, username) is None})
+            if unknown:
+                raise ValueError(f"Categorías inexistentes: {', '.join(unknown)}.")
+            df['category_id'] = df['category'].map(
+                lambda name: None if pd.isna(name) else _lookup_id(cursor, 'categories', name, username))
+            return df
+        edited, original = with_category_ids(edited), with_category_ids(original)
+    finally:
+        conn.close()
+    return sync_from_dataframe(edited, 'budgets', original, username)
+
+ISO_DATE_FORMAT = '%Y-%m-%d'
+
+def _to_iso_date(value):
+    """Normaliza fechas (date, datetime, Timestamp o texto) a 'YYYY-MM-DD'."""
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+def build_transactions_query(user_username=None, date_from=None, date_to=None, trans_type=None,
+                             category=None, payment_method=None, is_shared=None,
+                             limit=None, cursor=None):
+    """Arma la consulta de transacciones con detalles y sus parámetros."""
     query = """
     SELECT 
-        t.id, t.date, t.amount, t.type, t.details, 
+        t.id, t.date, t.amount_cents / 100.0 as amount, t.amount_cents, t.type, t.details, 
         t.installments_paid, t.installments_total, t.purchase_id,
-        t.is_shared, t.original_amount,
+        t.is_shared, t.original_amount_cents / 100.0 as original_amount,
         u.name as user, 
         c.name as category, 
         p.name as payment_method,
@@ -344,38 +2491,165 @@ def get_transactions_with_details(user_username=None):
     LEFT JOIN expense_groups eg ON t.group_id = eg.id
     """
     
-    params = ()
+    conditions = []
+    params = []
     if user_username:
-        query += " WHERE t.user_username = ?"
-        params = (user_username,)
-    
-    query += " ORDER BY t.date DESC"
+        conditions.append("t.user_username = ?")
+        params.append(user_username)
+    if date_from is not None:
+        conditions.append("t.date >= ?")
+        params.append(_to_iso_date(date_from))
+    if date_to is not None:
+        conditions.append("t.date < date(?, '+1 day')")
+        params.append(_to_iso_date(date_to))
+    if trans_type:
+        conditions.append("t.type = ?")
+        params.append(trans_type)
+    if category:
+        conditions.append("c.name = ?")
+        params.append(category)
+    if payment_method:
+        conditions.append("p.name = ?")
+        params.append(payment_method)
+    if is_shared is not None:
+        conditions.append("t.is_shared = ?")
+        params.append(1 if is_shared else 0)
+    if cursor is not None:
+        cursor_date, cursor_id = cursor
+        conditions.append("(t.date, t.id) < (?, ?)")
+        params.extend([_to_iso_date(cursor_date), cursor_id])
     
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY t.date DESC, t.id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(int(limit))
+    return query, params
+
+def get_transactions_with_details(user_username=None, date_from=None, date_to=None, trans_type=None,
+                                  category=None, payment_method=None, is_shared=None,
+                                  limit=None, cursor=None):
+    """Obtiene transacciones con detalles, filtradas en SQL.
+
+    Los filtros son opcionales; date_to es inclusivo. Con limit se obtiene una
+    página ordenada por (date, id) descendente, y cursor=(date, id) de la
+    última fila vista retorna la página siguiente (ver next_transactions_cursor).
+    """
+    query, params = build_transactions_query(
+        user_username, date_from, date_to, trans_type, category, payment_method, is_shared, limit, cursor
+    )
+    conn = get_read_connection()
     try:
-        df = pd.read_sql_query(query, conn, params=params)
-        df["date"] = pd.to_datetime(df["date"])
-        return df
+        return pd.read_sql_query(query, conn, params=params, parse_dates={"date": ISO_DATE_FORMAT})
+    finally:
+        conn.close()
+
+def next_transactions_cursor(df):
+    """Cursor (date, id) de la última fila de una página, o None si está vacía."""
+    if df.empty:
+        return None
+    last = df.iloc[-1]
+    return (_to_iso_date(last['date']), last['id'])
+
+# Peso de cada columna de transactions_fts en el ranking bm25
+SEARCH_COLUMN_WEIGHTS = (0.0, 10.0, 4.0, 2.0, 2.0)
+
+def build_search_query(text):
+    """Convierte lo que escribe el usuario en una consulta FTS5 segura.
+
+    Los textos entre comillas se buscan como frase exacta y cada palabra
+    suelta como prefijo ("super" encuentra "supermercado"). Todos los
+    términos deben aparecer. Retorna None si no queda ningún término.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', str(text or '')):
+        tokens = re.findall(r'\w+', phrase or word)
+        if not tokens:
+            continue
+        if phrase:
+            terms.append('"' + ' '.join(tokens) + '"')
+        else:
+            terms.extend(f'"{token}"*' for token in tokens)
+    return ' '.join(terms) or None
+
+def search_transactions(user_username, text, date_from=None, date_to=None, trans_type=None,
+                        min_amount=None, max_amount=None, limit=100):
+    """Busca transacciones por texto (detalle, categoría, método de pago o grupo).
+
+    Retorna las columnas de get_transactions_with_details más rank,
+    ordenadas por relevancia (bm25); vacío si el texto no tiene términos.
+    Los filtros son opcionales.
+    """
+    match = build_search_query(text)
+
+    weights = ', '.join(str(weight) for weight in SEARCH_COLUMN_WEIGHTS)
+    query = f"""
+    SELECT 
+        t.id, t.date, t.amount_cents / 100.0 as amount, t.amount_cents, t.type, t.details, 
+        t.installments_paid, t.installments_total, t.purchase_id,
+        t.is_shared, t.original_amount_cents / 100.0 as original_amount,
+        u.name as user, 
+        c.name as category, 
+        p.name as payment_method,
+        eg.name as group_name,
+        bm25(transactions_fts, {weights}) as rank
+    FROM transactions_fts f
+    JOIN transactions t ON t.id = f.transaction_id
+    JOIN users u ON t.user_username = u.username
+    JOIN categories c ON t.category_id = c.id
+    LEFT JOIN payment_methods p ON t.payment_method_id = p.id
+    LEFT JOIN expense_groups eg ON t.group_id = eg.id
+    WHERE {"transactions_fts MATCH ?" if match else "0"} AND t.user_username = ?
+    """
+    # Sin términos no hay resultados, pero con las mismas columnas (rank incluido)
+    params = [match, user_username] if match else [user_username]
+    if date_from is not None:
+        query += " AND t.date >= ?"
+        params.append(_to_iso_date(date_from))
+    if date_to is not None:
+        query += " AND t.date < date(?, '+1 day')"
+        params.append(_to_iso_date(date_to))
+    if trans_type:
+        query += " AND t.type = ?"
+        params.append(trans_type)
+    if min_amount is not None:
+        query += " AND t.amount_cents >= ?"
+        params.append(to_cents(min_amount))
+    if max_amount is not None:
+        query += " AND t.amount_cents <= ?"
+        params.append(to_cents(max_amount))
+    query += " ORDER BY rank, t.date DESC LIMIT ?"
+    params.append(int(limit))
+
+    conn = get_read_connection()
+    try:
+        return pd.read_sql_query(query, conn, params=params, parse_dates={"date": ISO_DATE_FORMAT})
     finally:
         conn.close()
 
+def rebuild_transaction_search(cursor=None):
+    """Recalcula transactions_fts completo (p. ej. después de un VACUUM, que puede renumerar rowids)."""
+    if cursor is None:
+        run_write(rebuild_transaction_search)
+        return
+    cursor.execute("DELETE FROM transactions_fts")
+    cursor.execute(f"""
+    INSERT INTO transactions_fts (rowid, transaction_id, details, category, payment_method, group_text)
+    {TRANSACTION_SEARCH_ROW_SQL}
+    """)
+
 def add_user_if_not_exists(username, name, email=None):
     """Añade un usuario si no existe."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-    INSERT OR IGNORE INTO users (username, name, email)
-    VALUES (?, ?, ?)
-    """, (username, name, email))
-    
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute("""
+        INSERT OR IGNORE INTO users (username, name, email)
+        VALUES (?, ?, ?)
+        """, (username, name, email))
+    run_write(write)
 
 def create_default_categories_and_methods(username):
     """Crea categorías y métodos de pago por defecto para un nuevo usuario."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     # Categorías por defecto
     default_categories = [
         ('Alimentación', 'Gasto', '🍽️', '#FF6B6B'),
@@ -390,12 +2664,6 @@ def create_default_categories_and_methods(username):
         ('Inversiones', 'Ingreso', '📈', '#FD79A8')
     ]
     
-    for name, type_, icon, color in default_categories:
-        cursor.execute("""
-        INSERT OR IGNORE INTO categories (name, type, icon, color, user_username, is_default)
-        VALUES (?, ?, ?, ?, ?, 1)
-        """, (name, type_, icon, color, username))
-    
     # Métodos de pago por defecto
     default_methods = [
         ('Efectivo', 'Efectivo'),
@@ -405,14 +2673,18 @@ def create_default_categories_and_methods(username):
         ('MercadoPago', 'Billetera Digital')
     ]
     
-    for name, type_ in default_methods:
-        cursor.execute("""
+    def write(cursor):
+        cursor.executemany("""
+        INSERT OR IGNORE INTO categories (name, type, icon, color, user_username, is_default)
+        VALUES (?, ?, ?, ?, ?, 1)
+        """, [(name, type_, icon, color, username) for name, type_, icon, color in default_categories])
+        cursor.executemany("""
         INSERT OR IGNORE INTO payment_methods (name, type, user_username, is_default)
         VALUES (?, ?, ?, 1)
-        """, (name, type_, username))
-    
-    conn.commit()
-    conn.close()
+        """, [(name, type_, username) for name, type_ in default_methods])
+
+    run_write(write)
+    invalidate_name_id_cache()
 
 # Inicializar la base de datos
 initialize_database()
\ No newline at end of file
@@ -0,0 +1,120 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import database_enhanced as db
+
+# Meses completos analizados para detectar movimientos recurrentes
+LOOKBACK_MONTHS = 6
+# Meses (de LOOKBACK_MONTHS) en que debe aparecer una categoría para ser recurrente
+MIN_RECURRING_MONTHS = 4
+# Factor para llevar un presupuesto de su período a un monto mensual
+MONTHLY_FACTOR = {'weekly': 52 / 12, 'monthly': 1.0, 'yearly': 1 / 12}
+
+def detect_recurring(monthly_totals, months, min_months=MIN_RECURRING_MONTHS):
+    """Detecta categorías recurrentes a partir de totales mensuales.
+
+    monthly_totals viene de db.get_monthly_category_totals. Se arma una
+    matriz (categoría, tipo) x mes y, de forma vectorizada, se cuentan los
+    meses con movimientos y se toma la mediana de esos meses como monto
+    mensual esperado (robusta a un mes atípico).
+    """
+    columns = ['category', 'type', 'months_present', 'monthly_cents']
+    if monthly_totals.empty:
+        return pd.DataFrame(columns=columns)
+
+    matrix = monthly_totals.pivot_table(
+        index=['category', 'type'], columns='month', values='amount_cents', aggfunc='sum'
+    ).reindex(columns=months).fillna(0)
+    present = (matrix > 0).sum(axis=1)
+    typical = matrix.where(matrix > 0).median(axis=1)
+    recurring = pd.DataFrame({'months_present': present, 'monthly_cents': typical.round()})
+    return recurring[present >= min_months].reset_index()[columns]
+
+def project_cash_flow(recurring, budgets, installment_schedule, starting_balance_cents, start_month, horizon_months):
+    """Proyecta ingresos, gastos y saldo mes a mes con operaciones vectorizadas.
+
+    - Ingresos: suma de ingresos recurrentes.
+    - Gastos: gastos recurrentes más los presupuestos (llevados a monto
+      mensual) de categorías sin gasto recurrente detectado.
+    - Cuotas: calendario de cuotas futuras; las del mes en curso se suman
+      al primer mes proyectado.
+    """
+    months = pd.period_range(start=start_month, periods=horizon_months, freq='M')
+
+    is_income = recurring['type'] == 'Ingreso'
+    income_cents = recurring.loc[is_income, 'monthly_cents'].sum()
+    recurring_expense_cents = recurring.loc[~is_income, 'monthly_cents'].sum()
+
+    budget_cents = 0
+    if not budgets.empty:
+        uncovered = budgets[~budgets['category'].isin(recurring.loc[~is_income, 'category'])]
+        budget_cents = (uncovered['amount'] * uncovered['period'].map(MONTHLY_FACTOR) * 100).sum()
+
+    installment_cents = np.zeros(horizon_months)
+    if not installment_schedule.empty:
+        by_month = installment_schedule.groupby('month')['amount'].sum()
+        month_index = (pd.PeriodIndex(by_month.index, freq='M') - months[0]).map(lambda offset: offset.n)
+        month_index = np.clip(np.asarray(month_index), 0, None)
+        in_horizon = month_index < horizon_months
+        np.add.at(installment_cents, month_index[in_horizon], (by_month.to_numpy() * 100).round()[in_horizon])
+
+    income = np.full(horizon_months, float(income_cents))
+    expenses = np.full(horizon_months, float(recurring_expense_cents + budget_cents))
+    net = income - expenses - installment_cents
+    balance = starting_balance_cents + np.cumsum(net)
+
+    return pd.DataFrame({
+        'month': months.to_timestamp(),
+        'income': income / 100,
+        'expenses': expenses / 100,
+        'installments': installment_cents / 100,
+        'net': net / 100,
+        'balance': balance / 100,
+    })
+
+def get_cash_flow_forecast(username, horizon_months=12, as_of=None):
+    """Proyección de flujo de caja para los próximos horizon_months meses.
+
+    Retorna un dict con projection (DataFrame mensual), recurring
+    (categorías recurrentes detectadas) y starting_balance.
+    """
+    as_of = as_of or datetime.today()
+    current_month = pd.Period(as_of, freq='M')
+    lookback = pd.period_range(end=current_month - 1, periods=LOOKBACK_MONTHS, freq='M')
+
+    monthly_totals = db.get_monthly_category_totals(
+        username, lookback[0].start_time, lookback[-1].end_time, exclude_installments=True
+    )
+    recurring = detect_recurring(monthly_totals, lookback.strftime('%Y-%m'))
+    budgets = db.get_budgets_with_details(username, as_of)
+    schedule = db.get_installment_schedule(username, as_of=as_of)
+    starting_balance_cents = db.get_balance(username, as_of)
+
+    projection = project_cash_flow(
+        recurring, budgets, schedule, starting_balance_cents, current_month + 1, horizon_months
+    )
+    return {
+        'projection': projection,
+        'recurring': recurring.assign(monthly_amount=recurring['monthly_cents'] / 100).drop(columns='monthly_cents'),
+        'starting_balance': starting_balance_cents / 100,
+    }
+
+def simulate_purchase(projection, amount, installments):
+    """Agrega una compra hipotética en cuotas a una proyección.
+
+    Retorna (proyección con columna purchase, saldo mínimo, si es pagable),
+    donde pagable significa que el saldo nunca queda negativo.
+    """
+    horizon_months = len(projection)
+    parts = np.array(db.split_into_installments(db.to_cents(amount), installments), dtype=float)
+    purchase_cents = np.zeros(horizon_months)
+    purchase_cents[:min(len(parts), horizon_months)] = parts[:horizon_months]
+
+    simulated = projection.copy()
+    simulated['purchase'] = purchase_cents / 100
+    simulated['net'] = simulated['net'] - simulated['purchase']
+    simulated['balance'] = simulated['balance'] - np.cumsum(purchase_cents) / 100
+    min_balance = simulated['balance'].min() if horizon_months else 0.0
+    return simulated, min_balance, min_balance >= 0
@@ -0,0 +1,334 @@
+"""Asesor de índices para las consultas de database_enhanced.
+
+Genera una base sintética (ver synthetic_data.py), ejecuta una vez las
+funciones de benchmark_database.py registrando cada sentencia con sus
+parámetros y corre EXPLAIN QUERY PLAN sobre cada una. Marca las lecturas
+completas de tablas o índices (SCAN), los índices automáticos y los B-trees
+temporales de ORDER BY/GROUP BY/DISTINCT, y propone un índice para cada caso:
+
+    python index_advisor.py --size 100000
+    python index_advisor.py --size 100000 --apply    # crea las propuestas y vuelve a analizar
+    python index_advisor.py --check                  # sale con 1 si queda alguna lectura completa
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import benchmark_database
+
+# EXPLAIN QUERY PLAN no muestra el plan de los triggers: consultas equivalentes
+# a las búsquedas que hacen sus cuerpos, con los parámetros tomados del contexto
+TRIGGER_QUERIES = [
+    ('trg_categories_fts_rename', "SELECT rowid FROM transactions WHERE category_id = ?",
+     lambda ctx: (ctx['category_id'],)),
+    ('trg_payment_methods_fts_rename', "SELECT rowid FROM transactions WHERE payment_method_id = ?",
+     lambda ctx: (ctx['payment_method_id'],)),
+    ('trg_expense_groups_fts_rename', "SELECT rowid FROM transactions WHERE group_id = ?",
+     lambda ctx: (ctx['group_id'],)),
+    ('trg_transactions_contribution_delete', "SELECT id FROM savings_contributions WHERE transaction_id = ?",
+     lambda ctx: ('',)),
+]
+
+# Consultas cuya lectura completa es esperada: se informan pero no proponen índices
+ACCEPTED_SCANS = {
+    'get_transactions_with_details[all_users]': "listado de todos los usuarios, sin filtro que indexar",
+}
+
+# Palabras que pueden seguir al nombre de una tabla y no son un alias
+SQL_KEYWORDS = {
+    'WHERE', 'JOIN', 'LEFT', 'INNER', 'CROSS', 'ON', 'USING', 'GROUP', 'ORDER', 'LIMIT', 'SET',
+    'WINDOW', 'UNION', 'EXCEPT', 'INTERSECT', 'NATURAL', 'INDEXED', 'NOT', 'VALUES', 'AS',
+}
+
+SCAN_RE = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?$')
+AUTOMATIC_INDEX_RE = re.compile(r'^SEARCH (\w+) USING AUTOMATIC (?:COVERING |PARTIAL )*INDEX')
+TEMP_BTREE_RE = re.compile(r'^USE TEMP B-TREE FOR (.+)$')
+
+def is_explainable(sql):
+    return sql.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT'))
+
+def table_aliases(sql, tables):
+    """{nombre usado en el plan: tabla} para las tablas reales de la consulta."""
+    aliases = {}
+    for match in re.finditer(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.IGNORECASE):
+        table, alias = match.group(1), match.group(2)
+        if table not in tables:
+            continue
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            aliases[alias] = table
+        else:
+            aliases[table] = table
+    return aliases
+
+def plan_findings(plan, aliases):
+    """Hallazgos de un plan: lecturas completas, índices automáticos y B-trees temporales."""
+    findings = []
+    for detail in plan:
+        scan = SCAN_RE.match(detail)
+        if scan and scan.group(1) in aliases:
+            findings.append({'kind': 'index_scan' if scan.group(2) else 'scan', 'alias': scan.group(1),
+                             'table': aliases[scan.group(1)], 'detail': detail})
+            continue
+        automatic = AUTOMATIC_INDEX_RE.match(detail)
+        if automatic and automatic.group(1) in aliases:
+            findings.append({'kind': 'automatic_index', 'alias': automatic.group(1),
+                             'table': aliases[automatic.group(1)], 'detail': detail})
+            continue
+        temp_btree = TEMP_BTREE_RE.match(detail)
+        if temp_btree:
+            findings.append({'kind': 'temp_btree', 'alias': None, 'table': None, 'detail': detail})
+    return findings
+
+# Lado derecho constante de un predicado: parámetro, número, texto o NULL
+CONSTANT = r"(?:\?|-?\d+(?:\.\d+)?|'[^']*'|NULL\b)"
+
+def referenced_columns(sql, alias, columns, single_table, include_joins=False):
+    """Columnas de la tabla usadas en predicados.
+
+    Retorna (igualdades, rangos, IS NOT NULL, términos OR). Sólo cuentan las
+    comparaciones con constantes; las de join (a.x = b.y) únicamente si
+    include_joins, porque sirven cuando la tabla es la interna del join.
+    """
+    prefix = rf'\b{alias}\.' if not single_table else rf'(?:\b{alias}\.)?\b'
+    column_re = rf'{prefix}(\w+)'
+    equalities, ranges, not_null = [], [], []
+    predicates = [
+        (rf'{column_re}\s*(?:==?|\bIS\b)\s*{CONSTANT}', equalities),
+        (rf'{column_re}\s+IN\s*\(', equalities),
+        (rf'{column_re}\s*(?:<=?|>=?)\s*{CONSTANT}', ranges),
+        (rf'{column_re}\s+BETWEEN\b', ranges),
+        (rf'{column_re}\s+IS NOT NULL\b', not_null),
+    ]
+    if include_joins:
+        predicates += [
+            (rf'{column_re}\s*=\s*\w+\.\w+', equalities),
+            (rf'\w+\.\w+\s*=\s*\b{alias}\.(\w+)', equalities),
+        ]
+    for pattern, target in predicates:
+        for match in re.finditer(pattern, sql, re.IGNORECASE):
+            if match.group(1) in columns:
+                target.append(match.group(1))
+    # Términos "columna = constante" unidos por OR: (columna, constante)
+    or_terms = []
+    for match in re.finditer(rf'{column_re}\s*=\s*({CONSTANT})\s+OR\s+{column_re}\s*=\s*({CONSTANT})',
+                             sql, re.IGNORECASE):
+        first, first_value, second, second_value = match.groups()
+        if first in columns and second in columns:
+            or_terms += [(first, first_value), (second, second_value)]
+    return list(dict.fromkeys(equalities)), list(dict.fromkeys(ranges)), not_null, or_terms
+
+def order_columns(sql, alias, columns, single_table):
+    """Columnas de la tabla en el ORDER BY (o GROUP BY) principal."""
+    match = re.search(r'\b(?:ORDER|GROUP) BY\s+(.+?)(?:\bLIMIT\b|\bHAVING\b|\)|$)', sql, re.IGNORECASE | re.DOTALL)
+    if not match:
+        return []
+    ordered = []
+    for term in match.group(1).split(','):
+        column = term.strip().split()[0] if term.strip() else ''
+        if '.' in column:
+            term_alias, column = column.split('.', 1)
+            if term_alias != alias:
+                continue
+        elif not single_table:
+            continue
+        if column in columns:
+            ordered.append(column)
+    return ordered
+
+def propose_indexes(sql, finding, table_columns, primary_keys, single_table):
+    """Índices (CREATE INDEX) que convertirían el hallazgo en una búsqueda por índice."""
+    table, alias = finding['table'], finding['alias']
+    columns = set(table_columns[table])
+    equalities, ranges, not_null, or_terms = referenced_columns(
+        sql, alias, columns, single_table, include_joins=finding['kind'] == 'automatic_index'
+    )
+    equalities = [column for column in equalities if column not in primary_keys[table]]
+    ranges = [column for column in ranges if column not in equalities and column not in primary_keys[table]]
+
+    if or_terms:
+        # Un OR entre columnas sólo se resuelve con un índice por término; si se
+        # compara con un literal alcanza un índice parcial sobre ese valor
+        return [index_statement(table, [column], '' if value == '?' else f'{column} = {value}')
+                for column, value in or_terms if column not in primary_keys[table]]
+
+    index_columns = equalities + ranges[:1]
+    if finding['kind'] == 'index_scan' or not index_columns:
+        index_columns += [column for column in order_columns(sql, alias, columns, single_table)
+                          if column not in index_columns]
+    if not index_columns:
+        return []
+    where = ' AND '.join(f'{column} IS NOT NULL' for column in not_null if column in index_columns)
+    return [index_statement(table, index_columns, where)]
+
+def index_statement(table, columns, where=''):
+    name = f"idx_{table}_{'_'.join(columns)}" + ('_partial' if where else '')
+    statement = f"CREATE INDEX IF NOT EXISTS {name} ON {table}({', '.join(columns)})"
+    return statement + (f" WHERE {where}" if where else '')
+
+def index_signature(statement):
+    """(tabla, columnas, WHERE) de un CREATE INDEX, para comparar sin importar el nombre."""
+    match = re.search(r'\bON\s+(\w+)\s*\(([^)]*)\)(?:\s+WHERE\s+(.+))?', statement, re.IGNORECASE | re.DOTALL)
+    if not match:
+        return None
+    table, columns, where = match.groups()
+    return (table, tuple(column.strip().split()[0] for column in columns.split(',')),
+            ' '.join((where or '').split()))
+
+def existing_indexes(conn):
+    return {name: sql for name, sql in conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+    )}
+
+def schema_info(conn):
+    """Columnas y clave primaria de cada tabla real (sin tablas virtuales ni sombra de FTS)."""
+    table_columns, primary_keys = {}, {}
+    for (table,) in conn.execute("""
+    SELECT name FROM sqlite_master
+    WHERE type = 'table' AND sql NOT LIKE 'CREATE VIRTUAL%' AND name NOT LIKE 'sqlite_%'
+      AND name NOT LIKE '%_fts_%'
+    """):
+        info = conn.execute(f"PRAGMA table_info({table})").fetchall()
+        table_columns[table] = [row[1] for row in info]
+        primary_keys[table] = {row[1] for row in info if row[5]}
+    return table_columns, primary_keys
+
+def explain(conn, sql, parameters):
+    cursor = conn.cursor()
+    try:
+        return [row[3] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()]
+    finally:
+        cursor.close()
+
+def analyze_queries(conn, queries):
+    """EXPLAIN QUERY PLAN de cada (origen, sql, parámetros); una fila por consulta con hallazgos."""
+    table_columns, primary_keys = schema_info(conn)
+    existing = {index_signature(sql) for sql in existing_indexes(conn).values()}
+    report = []
+    for source, sql, parameters in queries:
+        try:
+            plan = explain(conn, sql, parameters)
+        except Exception as e:
+            report.append({'source': source, 'sql': ' '.join(sql.split()), 'error': str(e),
+                           'plan': [], 'findings': [], 'proposals': []})
+            continue
+        aliases = table_aliases(sql, table_columns)
+        single_table = len(set(aliases.values())) == 1
+        findings = plan_findings(plan, aliases)
+        proposals = []
+        for finding in findings:
+            if finding['table'] and source not in ACCEPTED_SCANS:
+                proposals += propose_indexes(sql, finding, table_columns, primary_keys, single_table)
+        # Si el índice ya existe la lectura completa es propia de la consulta (p. ej. listar todo)
+        proposals = [proposal for proposal in proposals if index_signature(proposal) not in existing]
+        report.append({
+            'source': source,
+            'sql': ' '.join(sql.split()),
+            'plan': plan,
+            'findings': findings,
+            'proposals': list(dict.fromkeys(proposals)),
+            'accepted': ACCEPTED_SCANS.get(source),
+        })
+    return report
+
+def capture_queries(db, ctx):
+    """Ejecuta una vez cada función de benchmark y retorna sus sentencias con parámetros."""
+    db.invalidate_name_id_cache()
+    queries, seen = [], set()
+    for benchmarks in (benchmark_database.read_benchmarks(ctx), benchmark_database.write_benchmarks(ctx)):
+        for name, function in benchmarks:
+            db.reset_query_stats()
+            function()
+            # Cada sentencia se atribuye a la primera función que la ejecutó
+            for statement, (sql, parameters) in db.get_query_examples().items():
+                if statement not in seen and is_explainable(sql):
+                    seen.add(statement)
+                    queries.append((name, sql, parameters))
+    db.reset_query_stats()
+    queries += [(name, sql, parameters(ctx)) for name, sql, parameters in TRIGGER_QUERIES]
+    return queries
+
+def print_report(report, title):
+    flagged = [entry for entry in report if entry['findings'] or entry.get('error')]
+    print(f"== {title}: {len(report)} consultas, {len(flagged)} con hallazgos")
+    for entry in flagged:
+        print(f"\n[{entry['source']}] {entry['sql'][:160]}")
+        if entry.get('error'):
+            print(f"    error: {entry['error']}")
+        if entry.get('accepted'):
+            print(f"    (aceptado: {entry['accepted']})")
+        for finding in entry['findings']:
+            print(f"    {finding['kind']:<16} {finding['detail']}")
+        for proposal in entry['proposals']:
+            print(f"    -> {proposal}")
+    proposals = all_proposals(report)
+    if proposals:
+        print("\nÍndices propuestos:")
+        for proposal in proposals:
+            print(f"  {proposal};")
+    print()
+
+def all_proposals(report):
+    return list(dict.fromkeys(proposal for entry in report for proposal in entry['proposals']))
+
+def run_advisor(args):
+    with tempfile.TemporaryDirectory(prefix='finfam-index-') as workdir:
+        # Igual que en benchmark_database: DB_FILE se fija al importar database_enhanced
+        os.environ['FINFAM_DB'] = os.path.join(workdir, 'advisor_init.db')
+        import database_enhanced as db
+        import synthetic_data
+
+        settings = SimpleNamespace(users=args.users, years=args.years, seed=args.seed)
+        _, ctx = benchmark_database.build_database(db, synthetic_data, args.size, settings, workdir)
+        ctx['payment_method_id'] = next(iter(db.get_name_id_map('payment_methods', ctx['user']).values()))
+        queries = capture_queries(db, ctx)
+
+        conn = db.get_db_connection()
+        try:
+            # Sin ANALYZE, igual que la app: el planificador decide sin estadísticas
+            report = analyze_queries(conn, queries)
+            print_report(report, f"{args.size} transacciones")
+            result = {'size': args.size, 'indexes': existing_indexes(conn), 'report': report}
+
+            proposals = all_proposals(report)
+            if args.apply and proposals:
+                for proposal in proposals:
+                    conn.execute(proposal)
+                conn.commit()
+                report = analyze_queries(conn, queries)
+                print_report(report, "con los índices propuestos")
+                result['applied'] = proposals
+                result['report_after'] = report
+        finally:
+            conn.close()
+            db.close_all_connections()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(result, output, indent=2, ensure_ascii=False)
+    final_report = result.get('report_after', result['report'])
+    # Los B-trees temporales se informan pero no cuentan: ordenar un resultado agregado es inevitable
+    return sum(1 for entry in final_report
+               if not entry['accepted'] and any(finding['table'] for finding in entry['findings']))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analiza los planes de las consultas y propone índices.")
+    parser.add_argument('--size', type=int, default=20000, help="Transacciones de la base sintética")
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--apply', action='store_true', help="Crea los índices propuestos y vuelve a analizar")
+    parser.add_argument('--check', action='store_true', help="Sale con 1 si alguna consulta lee una tabla completa")
+    parser.add_argument('--output', help="Guarda el reporte completo en JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    flagged = run_advisor(args)
+    return 1 if args.check and flagged else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
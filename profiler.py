@@ -0,0 +1,169 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Reruns guardados en el historial de cada sesión
+HISTORY_SIZE = 100
+
+class RerunProfiler:
+    """Mide el tiempo de pared de cada sección de un rerun de Streamlit.
+
+    Las secciones de nivel superior se marcan con step(nombre), que cierra
+    la anterior, y las anidadas (pestañas, gráficos) con el context manager
+    section(nombre). counters es un dict nombre -> función que retorna un
+    acumulado (p. ej. milisegundos de SQL); de cada sección se guarda cuánto
+    aumentó. Con enabled=False todas las marcas son no-ops.
+    """
+
+    def __init__(self, counters=None, history_size=HISTORY_SIZE):
+        self.counters = counters or {}
+        self.history = deque(maxlen=history_size)
+        self.enabled = False
+        self.reruns = 0
+        self._current = None
+        self._last = None
+        self._stack = []
+        self._step = None
+
+    def _snapshot(self):
+        return time.perf_counter(), {name: counter() for name, counter in self.counters.items()}
+
+    def _open(self):
+        """Reserva el lugar de una sección (en orden de inicio) y toma la medición inicial."""
+        self._current['sections'].append(None)
+        return len(self._current['sections']) - 1, self._snapshot()
+
+    def _record(self, name, depth, opened):
+        index, started = opened
+        end, counters = self._snapshot()
+        section = {'section': name, 'depth': depth, 'ms': (end - started[0]) * 1000}
+        for counter_name, value in counters.items():
+            section[counter_name] = value - started[1][counter_name]
+        self._current['sections'][index] = section
+        self._last = end, counters
+
+    def start_rerun(self):
+        """Comienza a medir un rerun; uno anterior sin terminar (st.stop, st.rerun) se cierra."""
+        if self._current is not None:
+            self.finish_rerun(interrupted=True)
+        if not self.enabled:
+            return
+        self.reruns += 1
+        self._current = {
+            'rerun': self.reruns,
+            'at': datetime.now(),
+            'label': None,
+            'interrupted': False,
+            'sections': [],
+            'started': self._snapshot(),
+        }
+        self._last = self._current['started']
+        self._stack = []
+        self._step = None
+
+    def set_label(self, label):
+        """Etiqueta del rerun (p. ej. la sección activa de la app)."""
+        if self._current is not None:
+            self._current['label'] = label
+
+    def step(self, name):
+        """Cierra el paso de nivel superior en curso y abre uno nuevo."""
+        if self._current is None:
+            return
+        self._close_step()
+        self._step = (name, self._open())
+
+    def _close_step(self):
+        if self._step is not None:
+            name, opened = self._step
+            self._step = None
+            self._record(name, 0, opened)
+
+    @contextmanager
+    def section(self, name):
+        """Mide un bloque anidado dentro del paso o sección en curso."""
+        if self._current is None:
+            yield
+            return
+        self._stack.append(name)
+        path = ' / '.join(([self._step[0]] if self._step else []) + self._stack)
+        depth = len(self._stack) if self._step else len(self._stack) - 1
+        opened = self._open()
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            if self._current is not None:
+                self._record(path, depth, opened)
+
+    def finish_rerun(self, interrupted=False):
+        """Cierra el rerun en curso y lo agrega al historial.
+
+        Un rerun interrumpido termina en la última sección cerrada: el paso
+        abierto se descarta porque su fin real (st.stop/st.rerun) no se midió.
+        """
+        if self._current is None:
+            return
+        if interrupted:
+            end, counters = self._last
+        else:
+            self._close_step()
+            end, counters = self._snapshot()
+        rerun = self._current
+        self._current = None
+        self._step = None
+        started = rerun.pop('started')
+        rerun['total_ms'] = (end - started[0]) * 1000
+        for counter_name, value in counters.items():
+            rerun[counter_name] = value - started[1][counter_name]
+        rerun['interrupted'] = interrupted
+        # Secciones que no llegaron a cerrarse
+        rerun['sections'] = [section for section in rerun['sections'] if section is not None]
+        self.history.append(rerun)
+
+    def reruns_frame(self):
+        """Un rerun por fila, del más lento al más rápido."""
+        rows = []
+        for rerun in self.history:
+            top_level = [section for section in rerun['sections'] if section['depth'] == 0]
+            slowest = max(top_level or rerun['sections'], key=lambda section: section['ms'], default=None)
+            row = {key: value for key, value in rerun.items() if key != 'sections'}
+            row['slowest_section'] = slowest['section'] if slowest else None
+            row['slowest_ms'] = slowest['ms'] if slowest else None
+            rows.append(row)
+        columns = ['rerun', 'at', 'label', 'total_ms', *self.counters, 'slowest_section', 'slowest_ms', 'interrupted']
+        frame = pd.DataFrame(rows, columns=columns)
+        return frame.sort_values('total_ms', ascending=False, ignore_index=True)
+
+    def sections_frame(self, rerun_number):
+        """Desglose por sección de un rerun del historial."""
+        for rerun in self.history:
+            if rerun['rerun'] == rerun_number:
+                frame = pd.DataFrame(rerun['sections'], columns=['section', 'depth', 'ms', *self.counters])
+                frame['share'] = frame['ms'] / rerun['total_ms'] if rerun['total_ms'] else 0.0
+                return frame
+        return pd.DataFrame(columns=['section', 'depth', 'ms', *self.counters, 'share'])
+
+    def summary_frame(self):
+        """Tiempos agregados por sección en todo el historial (media, p95, máximo)."""
+        rows = [section for rerun in self.history for section in rerun['sections']]
+        if not rows:
+            return pd.DataFrame(columns=['section', 'calls', 'mean_ms', 'p95_ms', 'max_ms', 'total_ms'])
+        grouped = pd.DataFrame(rows).groupby('section')
+        summary = grouped['ms'].agg(
+            calls='count',
+            mean_ms='mean',
+            p95_ms=lambda values: np.percentile(values, 95),
+            max_ms='max',
+            total_ms='sum',
+        )
+        for counter_name in self.counters:
+            summary[f'mean_{counter_name}'] = grouped[counter_name].mean()
+        return summary.sort_values('total_ms', ascending=False).reset_index()
+
+    def clear(self):
+        self.history.clear()
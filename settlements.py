@@ -0,0 +1,86 @@
+import heapq
+
+import pandas as pd
+
+import database_enhanced as db
+
+def net_pair_balances(pair_balances):
+    """Compensa las deudas cruzadas de cada par (A debe a B y B debe a A).
+
+    Recibe las tuplas de db.get_pending_balances y retorna un dict
+    (deudor, acreedor) -> centavos, con un único sentido por par.
+    """
+    pairs = {}
+    for debtor, creditor, amount, _ in pair_balances:
+        key = tuple(sorted((debtor, creditor)))
+        # Positivo: key[0] le debe a key[1]
+        sign = 1 if debtor == key[0] else -1
+        pairs[key] = pairs.get(key, 0) + sign * db.to_cents(amount)
+    return {
+        (a, b) if cents > 0 else (b, a): abs(cents)
+        for (a, b), cents in pairs.items() if cents
+    }
+
+def net_balances(pair_balances):
+    """Saldo neto por persona en centavos (positivo: le deben; negativo: debe)."""
+    net = {}
+    for debtor, creditor, amount, _ in pair_balances:
+        cents = db.to_cents(amount)
+        net[debtor] = net.get(debtor, 0) - cents
+        net[creditor] = net.get(creditor, 0) + cents
+    return net
+
+def simplify_debts(net):
+    """Transferencias mínimas que saldan los saldos netos (min-cash-flow greedy).
+
+    En cada paso el mayor deudor le paga al mayor acreedor, así cada
+    transferencia salda al menos a una persona. Retorna una lista de
+    (pagador, receptor, centavos).
+    """
+    creditors = [(-cents, user) for user, cents in net.items() if cents > 0]
+    debtors = [(cents, user) for user, cents in net.items() if cents < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor, creditor, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor))
+    return transfers
+
+def get_settlement_plan(group_id=None, usernames=None):
+    """Saldos y transferencias mínimas para un grupo o para todo el hogar.
+
+    Retorna un dict con tres DataFrames (montos en pesos):
+    - pairs: deuda neta por par (debtor, creditor, amount)
+    - net: saldo neto por persona (username, balance)
+    - transfers: transferencias sugeridas (payer, receiver, amount)
+    y max_split_id, la última división pendiente que entró en el plan (para
+    saldar sólo esas con db.settle_all_splits).
+    """
+    max_split_id = db.get_pending_splits_watermark(group_id, usernames)
+    pair_balances = db.get_pending_balances(group_id, usernames, max_split_id)
+    pairs = net_pair_balances(pair_balances)
+    net = net_balances(pair_balances)
+    transfers = simplify_debts(net)
+    return {
+        'pairs': pd.DataFrame(
+            [(debtor, creditor, cents / 100) for (debtor, creditor), cents in pairs.items()],
+            columns=['debtor', 'creditor', 'amount']
+        ).sort_values('amount', ascending=False, ignore_index=True),
+        'net': pd.DataFrame(
+            [(username, cents / 100) for username, cents in net.items() if cents],
+            columns=['username', 'balance']
+        ).sort_values('balance', ignore_index=True),
+        'transfers': pd.DataFrame(
+            [(payer, receiver, cents / 100) for payer, receiver, cents in transfers],
+            columns=['payer', 'receiver', 'amount']
+        ),
+        'max_split_id': max_split_id,
+    }
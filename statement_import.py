@@ -0,0 +1,279 @@
+import csv
+import hashlib
+import io
+import itertools
+import re
+import unicodedata
+from datetime import datetime
+
+import database_enhanced as db
+
+# Filas por lote de executemany/commit
+CHUNK_SIZE = 500
+
+# Encabezados habituales en extractos, normalizados (minúsculas y sin acentos)
+COLUMN_ALIASES = {
+    'date': ['fecha', 'date', 'fecha operacion', 'fecha de operacion', 'fecha movimiento', 'fecha valor',
+             'posted date', 'transaction date'],
+    'amount': ['monto', 'importe', 'amount', 'valor', 'importe en pesos', 'monto ars', 'pesos'],
+    'debit': ['debito', 'debitos', 'debe', 'debit', 'egreso', 'egresos'],
+    'credit': ['credito', 'creditos', 'haber', 'credit', 'ingreso', 'ingresos'],
+    'details': ['descripcion', 'detalle', 'concepto', 'description', 'details', 'referencia', 'memo',
+                'establecimiento', 'comercio'],
+    'category': ['categoria', 'category', 'rubro'],
+}
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%Y%m%d', '%m/%d/%Y']
+# Filas del comienzo de cada archivo con las que se detecta su formato de fecha
+DATE_SAMPLE_ROWS = 200
+
+OFX_TRANSACTION = re.compile(r'<STMTTRN>(.*?)</STMTTRN>', re.IGNORECASE | re.DOTALL)
+OFX_FIELD = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+def normalize_text(value):
+    """Minúsculas, sin acentos ni espacios repetidos (para comparar textos)."""
+    value = unicodedata.normalize('NFKD', str(value or ''))
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return ' '.join(value.lower().split())
+
+def parse_amount(text):
+    """Convierte montos como '1.234,56', '-1,234.56', '$ 500' o '(45,10)' a float."""
+    text = str(text or '').strip()
+    if not text:
+        return None
+    negative = text.startswith('(') and text.endswith(')') or '-' in text
+    text = re.sub(r'[^\d,.]', '', text)
+    if not re.search(r'\d', text):
+        return None
+    if ',' in text and '.' in text:
+        decimal_sep = ',' if text.rfind(',') > text.rfind('.') else '.'
+    elif ',' in text:
+        decimal_sep = ',' if re.search(r',\d{1,2}$', text) else None
+    elif text.count('.') == 1:
+        decimal_sep = '.' if re.search(r'\.\d{1,2}$', text) else None
+    else:
+        decimal_sep = None
+    thousands_sep = {',': '.', '.': ','}.get(decimal_sep, None)
+    if decimal_sep is None:
+        text = text.replace(',', '').replace('.', '')
+    else:
+        text = text.replace(thousands_sep, '').replace(decimal_sep, '.')
+    value = float(text)
+    return -value if negative else value
+
+def parse_date(text, date_formats=DATE_FORMATS):
+    """Convierte una fecha en alguno de date_formats (en ese orden) a 'YYYY-MM-DD'."""
+    text = str(text or '').strip()[:10]
+    for date_format in date_formats:
+        try:
+            return datetime.strptime(text, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha no reconocida: '{text}'")
+
+def detect_date_formats(samples):
+    """Ordena DATE_FORMATS según cuántas fechas de muestra reconoce cada uno.
+
+    Un mismo extracto usa siempre el mismo formato, así que las primeras
+    filas deciden las ambiguas ('05/03/2024'). Ante un empate se respeta
+    el orden de DATE_FORMATS.
+    """
+    samples = [str(text or '').strip()[:10] for text in samples]
+
+    def matches(date_format):
+        count = 0
+        for text in samples:
+            try:
+                datetime.strptime(text, date_format)
+                count += 1
+            except ValueError:
+                pass
+        return count
+    return sorted(DATE_FORMATS, key=matches, reverse=True)
+
+def detect_columns(headers):
+    """Asocia los encabezados del CSV a los campos conocidos (date, amount, ...)."""
+    normalized = {normalize_text(header): header for header in headers if header}
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                mapping[field] = normalized[alias]
+                break
+    if 'date' not in mapping or not ('amount' in mapping or 'debit' in mapping or 'credit' in mapping):
+        raise ValueError("No se encontraron columnas de fecha y monto en el archivo.")
+    return mapping
+
+def iter_csv_records(binary_file, encoding='utf-8-sig'):
+    """Lee un CSV fila por fila y produce registros normalizados.
+
+    Cada registro es un dict con line, date, amount (o debit y credit, si el
+    archivo no tiene columna de monto), details, category y reference, con
+    los textos tal como vienen: los montos se interpretan con
+    record_amount. El delimitador se detecta con una muestra inicial.
+    """
+    text = io.TextIOWrapper(binary_file, encoding=encoding, errors='replace', newline='')
+    sample = text.read(8192)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(text, dialect=dialect)
+    mapping = detect_columns(reader.fieldnames or [])
+
+    def cell(row, field):
+        # Filas cortas traen None; sin columna, row.get(None) serían los campos sobrantes
+        column = mapping.get(field)
+        return (row.get(column) or '') if column else ''
+
+    try:
+        for line, row in enumerate(reader, start=2):
+            yield {
+                'line': line,
+                'date': cell(row, 'date'),
+                'amount': cell(row, 'amount') if 'amount' in mapping else None,
+                'debit': cell(row, 'debit'),
+                'credit': cell(row, 'credit'),
+                'details': cell(row, 'details').strip(),
+                'category': cell(row, 'category').strip(),
+                'reference': None,
+            }
+    finally:
+        # Soltar el archivo binario sin cerrarlo (el llamador consulta su posición)
+        text.detach()
+
+def iter_ofx_records(binary_file, encoding='latin-1', read_size=65536):
+    """Lee un OFX (SGML o XML) por bloques y produce un registro por <STMTTRN>."""
+    text = io.TextIOWrapper(binary_file, encoding=encoding, errors='replace')
+    buffer = ''
+    line = 0
+    try:
+        while True:
+            block = text.read(read_size)
+            buffer += block
+            last_end = 0
+            for match in OFX_TRANSACTION.finditer(buffer):
+                last_end = match.end()
+                line += 1
+                fields = {tag.upper(): value.strip() for tag, value in OFX_FIELD.findall(match.group(1))}
+                details = fields.get('NAME') or ''
+                if fields.get('MEMO') and fields.get('MEMO') != details:
+                    details = f"{details} {fields['MEMO']}".strip()
+                yield {
+                    'line': line,
+                    'date': fields.get('DTPOSTED', '')[:8],
+                    'amount': fields.get('TRNAMT') or '',
+                    'details': details,
+                    'category': '',
+                    'reference': fields.get('FITID'),
+                }
+            buffer = buffer[last_end:]
+            if not block:
+                break
+    finally:
+        text.detach()
+
+def record_amount(record):
+    """Monto con signo de un registro: su columna de monto o crédito menos débito."""
+    if record['amount'] is not None:
+        return parse_amount(record['amount'])
+    debit = parse_amount(record.get('debit')) or 0
+    credit = parse_amount(record.get('credit')) or 0
+    return abs(credit) - abs(debit)
+
+def content_hash(username, date, amount, details, discriminator):
+    """Hash estable de una fila importada para detectar duplicados entre importaciones."""
+    key = f"{username}|{date}|{int(round(amount * 100))}|{normalize_text(details)}|{discriminator}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+def import_statement(binary_file, filename, username, payment_method_name=None,
+                     default_expense_category=None, default_income_category=None,
+                     category_rules=None, negative_is_expense=True,
+                     progress_callback=None, chunk_size=CHUNK_SIZE):
+    """Importa un extracto bancario o de tarjeta (CSV u OFX) por lotes.
+
+    Las categorías se resuelven por la columna de categoría del archivo, luego
+    por category_rules (palabra clave -> categoría) sobre el detalle y por
+    último con la categoría por defecto del tipo. Si negative_is_expense es
+    False (extractos de tarjeta) los montos positivos son gastos.
+
+    progress_callback(fraction, rows_read) se llama después de cada lote.
+    Retorna un dict con read, inserted, duplicates y errors [(línea, mensaje)].
+    """
+    is_ofx = filename.lower().endswith(('.ofx', '.qfx'))
+    records = iter_ofx_records(binary_file) if is_ofx else iter_csv_records(binary_file)
+    total_bytes = getattr(binary_file, 'size', None)
+
+    categories = {normalize_text(name): id_ for name, id_ in db.get_name_id_map('categories', username).items()}
+    payment_method_id = db.get_name_id_map('payment_methods', username).get(payment_method_name)
+    default_category_ids = {
+        'Gasto': categories.get(normalize_text(default_expense_category)),
+        'Ingreso': categories.get(normalize_text(default_income_category)),
+    }
+    rules = [(normalize_text(keyword), categories.get(normalize_text(category)))
+             for keyword, category in (category_rules or {}).items()]
+
+    result = {'read': 0, 'inserted': 0, 'duplicates': 0, 'errors': []}
+    occurrences = {}
+    batch = []
+
+    def flush():
+        inserted = db.bulk_insert_transactions(username, batch)
+        result['inserted'] += inserted
+        result['duplicates'] += len(batch) - inserted
+        batch.clear()
+        if progress_callback:
+            fraction = min(binary_file.tell() / total_bytes, 1.0) if total_bytes else 0.0
+            progress_callback(fraction, result['read'])
+
+    head = list(itertools.islice(records, DATE_SAMPLE_ROWS))
+    date_formats = detect_date_formats(record['date'] for record in head)
+
+    for record in itertools.chain(head, records):
+        result['read'] += 1
+        try:
+            amount = record_amount(record)
+            if amount is None:
+                raise ValueError("Monto vacío")
+            date = parse_date(record['date'], date_formats)
+            amount = amount if negative_is_expense else -amount
+            trans_type = 'Gasto' if amount < 0 else 'Ingreso'
+            details = record['details']
+
+            category_id = categories.get(normalize_text(record['category']))
+            if category_id is None:
+                normalized_details = normalize_text(details)
+                category_id = next((id_ for keyword, id_ in rules if id_ and keyword in normalized_details), None)
+            if category_id is None:
+                category_id = default_category_ids[trans_type]
+            if category_id is None:
+                raise ValueError(f"Sin categoría de {trans_type.lower()} para '{details}'")
+
+            discriminator = record['reference']
+            if discriminator is None:
+                # Filas idénticas dentro del mismo archivo son movimientos distintos
+                key = (date, amount, normalize_text(details))
+                occurrences[key] = occurrences.get(key, 0) + 1
+                discriminator = occurrences[key]
+
+            batch.append({
+                'category_id': category_id,
+                'payment_method_id': payment_method_id,
+                'date': date,
+                'amount': abs(amount),
+                'type': trans_type,
+                'details': details,
+                'import_hash': content_hash(username, date, amount, details, discriminator),
+            })
+        except ValueError as e:
+            result['errors'].append((record['line'], str(e)))
+
+        if len(batch) >= chunk_size:
+            flush()
+
+    if batch:
+        flush()
+    if progress_callback:
+        progress_callback(1.0, result['read'])
+    return result
@@ -0,0 +1,149 @@
+import random
+from datetime import date, timedelta
+
+import database_enhanced as db
+
+# Fecha fija de fin de los datos: el mismo seed produce siempre la misma base
+END_DATE = date(2025, 12, 31)
+
+DETAIL_WORDS = {
+    'Alimentación': ['supermercado', 'verdulería', 'carnicería', 'almacén', 'panadería', 'delivery'],
+    'Transporte': ['nafta', 'peaje', 'subte', 'colectivo', 'taxi', 'estacionamiento'],
+    'Entretenimiento': ['cine', 'streaming', 'teatro', 'recital', 'restaurante', 'bar'],
+    'Salud': ['farmacia', 'consulta', 'prepaga', 'dentista', 'análisis'],
+    'Educación': ['cuota colegio', 'libros', 'curso', 'materiales'],
+    'Hogar': ['alquiler', 'expensas', 'luz', 'gas', 'internet', 'ferretería'],
+    'Ropa': ['zapatillas', 'campera', 'remera', 'pantalón'],
+    'Sueldo': ['sueldo', 'aguinaldo'],
+    'Freelance': ['proyecto', 'consultoría', 'diseño'],
+    'Inversiones': ['plazo fijo', 'dividendos', 'intereses'],
+}
+
+# Rango de montos (en pesos) por categoría
+AMOUNT_RANGES = {
+    'Alimentación': (500, 60000),
+    'Transporte': (300, 40000),
+    'Entretenimiento': (1000, 50000),
+    'Salud': (1000, 80000),
+    'Educación': (5000, 150000),
+    'Hogar': (5000, 400000),
+    'Ropa': (5000, 120000),
+    'Sueldo': (800000, 2500000),
+    'Freelance': (50000, 600000),
+    'Inversiones': (5000, 200000),
+}
+
+INCOME_CATEGORIES = ('Sueldo', 'Freelance', 'Inversiones')
+
+def usernames_for(users):
+    return [f"user{index:03d}" for index in range(users)]
+
+def generate_transactions(rng, username, categories, payment_methods, count, years, end_date=END_DATE):
+    """Filas para db.bulk_insert_transactions: ~10% ingresos y el resto gastos."""
+    days = years * 365
+    income_names = [name for name in categories if name in INCOME_CATEGORIES]
+    expense_names = [name for name in categories if name not in INCOME_CATEGORIES]
+    method_ids = list(payment_methods.values())
+
+    rows = []
+    for _ in range(count):
+        category = rng.choice(income_names if rng.random() < 0.1 else expense_names)
+        low, high = AMOUNT_RANGES.get(category, (100, 10000))
+        words = DETAIL_WORDS.get(category, ['varios'])
+        rows.append({
+            'category_id': categories[category],
+            'payment_method_id': rng.choice(method_ids),
+            'date': (end_date - timedelta(days=rng.randrange(days))).isoformat(),
+            'amount': round(rng.uniform(low, high), 2),
+            'type': 'Ingreso' if category in income_names else 'Gasto',
+            'details': ' '.join(rng.sample(words, min(2, len(words)))),
+        })
+    return rows
+
+def generate_dataset(users=3, transactions=10000, years=3, shared_ratio=0.05, seed=42,
+                     end_date=END_DATE, batch_size=5000):
+    """Llena la base actual (db.DB_FILE) con datos sintéticos deterministas.
+
+    Crea users usuarios con las categorías y métodos por defecto, reparte
+    transactions transacciones entre ellos a lo largo de years años, un
+    grupo del hogar con todos los usuarios y shared_ratio * transactions
+    gastos compartidos con sus divisiones (algunas ya pagadas), además de
+    presupuestos, metas de ahorro y compras en cuotas.
+
+    Retorna un dict con lo creado (usuarios, group_id, cantidades).
+    """
+    rng = random.Random(seed)
+    usernames = usernames_for(users)
+    for username in usernames:
+        db.add_user_if_not_exists(username, username.capitalize())
+        db.create_default_categories_and_methods(username)
+
+    per_user = transactions // users
+    for index, username in enumerate(usernames):
+        categories = db.get_name_id_map('categories', username)
+        payment_methods = db.get_name_id_map('payment_methods', username)
+        count = per_user + (1 if index < transactions % users else 0)
+        rows = generate_transactions(rng, username, categories, payment_methods, count, years, end_date)
+        for start in range(0, len(rows), batch_size):
+            db.bulk_insert_transactions(username, rows[start:start + batch_size])
+
+        # Compras en cuotas con tarjeta, que siguen pendientes al final del período
+        for months_ago in range(6):
+            purchase_date = end_date - timedelta(days=30 * months_ago + rng.randrange(28))
+            db.add_transaction(username, 'Ropa', round(rng.uniform(30000, 300000), 2), 'Gasto',
+                               purchase_date.isoformat(), 'Tarjeta de Crédito',
+                               details='compra en cuotas', installments=rng.choice([3, 6, 12]))
+
+    group_id = db.create_expense_group('Hogar', 'Gastos comunes del hogar', usernames[0], usernames)
+    shared_count = int(transactions * shared_ratio)
+    for _ in range(shared_count):
+        payer = rng.choice(usernames)
+        category = rng.choice(['Alimentación', 'Hogar', 'Entretenimiento'])
+        low, high = AMOUNT_RANGES[category]
+        amount = round(rng.uniform(low, high), 2)
+        share = round(amount / users, 2)
+        db.add_shared_expense(
+            payer, category, amount,
+            (end_date - timedelta(days=rng.randrange(years * 365))).isoformat(),
+            ' '.join(rng.sample(DETAIL_WORDS[category], 2)), group_id, 'equal',
+            {username: share for username in usernames}, 'Efectivo'
+        )
+
+    # La mitad de las divisiones más antiguas ya están pagadas
+    conn = db.get_db_connection()
+    try:
+        split_ids = [row[0] for row in conn.execute("SELECT id FROM expense_splits ORDER BY id")]
+    finally:
+        conn.close()
+    paid_ids = split_ids[:len(split_ids) // 2]
+    if paid_ids:
+        db.update_splits_status('paid', split_ids=paid_ids)
+
+    conn = db.get_db_connection()
+    try:
+        for username in usernames:
+            categories = db.get_name_id_map('categories', username)
+            conn.executemany("""
+            INSERT INTO budgets (user_username, category_id, amount, period) VALUES (?, ?, ?, ?)
+            """, [(username, categories[name], amount, period) for name, amount, period in (
+                ('Alimentación', 400000, 'monthly'),
+                ('Transporte', 60000, 'weekly'),
+                ('Educación', 1500000, 'yearly'),
+            )])
+        conn.commit()
+    finally:
+        conn.close()
+
+    for username in usernames:
+        goal_id = db.create_savings_goal(username, 'Vacaciones', 3000000, end_date + timedelta(days=365))
+        for months_ago in range(12):
+            db.add_goal_contribution(goal_id, username, round(rng.uniform(50000, 200000), 2),
+                                     end_date - timedelta(days=30 * months_ago))
+
+    return {
+        'users': usernames,
+        'group_id': group_id,
+        'transactions': transactions,
+        'shared_expenses': shared_count,
+        'end_date': end_date,
+    }
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database_enhanced inicializa DB_FILE al importarse: que no toque la base real
+os.environ['FINFAM_DB'] = os.path.join(tempfile.mkdtemp(prefix='finfam-test-'), 'import.db')
+
+import database_enhanced as db
+
+@pytest.fixture
+def fresh_db(tmp_path):
+    """Base vacía con el esquema al día, en una carpeta temporal."""
+    db.close_all_connections()
+    db.DB_FILE = str(tmp_path / 'finfam.db')
+    db.initialize_database()
+    yield db
+    db.close_all_connections()
+
+@pytest.fixture
+def user(fresh_db):
+    """Usuario con las categorías y métodos de pago por defecto."""
+    fresh_db.add_user_if_not_exists('ana', 'Ana')
+    fresh_db.create_default_categories_and_methods('ana')
+    return 'ana'
@@ -0,0 +1,135 @@
+import sqlite3
+
+import pytest
+
+import database_enhanced as db
+
+# Esquema de las bases creadas antes del versionado (user_version 0), con los
+# montos en REAL y las fechas como texto libre
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    username TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT UNIQUE,
+    phone TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_active BOOLEAN DEFAULT 1,
+    tutorial_completed BOOLEAN DEFAULT 0
+);
+CREATE TABLE categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL CHECK(type IN ('Ingreso', 'Gasto')),
+    icon TEXT,
+    color TEXT,
+    user_username TEXT,
+    is_default BOOLEAN DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(name, user_username)
+);
+CREATE TABLE transactions (
+    id TEXT PRIMARY KEY,
+    user_username TEXT NOT NULL,
+    category_id INTEGER NOT NULL,
+    payment_method_id INTEGER,
+    date TEXT NOT NULL,
+    amount REAL NOT NULL,
+    type TEXT NOT NULL CHECK(type IN ('Ingreso', 'Gasto')),
+    details TEXT,
+    installments_paid INTEGER DEFAULT 1,
+    installments_total INTEGER DEFAULT 1,
+    purchase_id TEXT,
+    is_shared BOOLEAN DEFAULT 0,
+    group_id TEXT,
+    original_amount REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE expense_splits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_id TEXT NOT NULL,
+    user_username TEXT NOT NULL,
+    amount REAL NOT NULL,
+    percentage REAL,
+    status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'paid', 'cancelled')),
+    paid_at TIMESTAMP,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_transactions_user_date ON transactions(user_username, date);
+INSERT INTO users (username, name) VALUES ('ana', 'Ana'), ('beto', 'Beto');
+INSERT INTO categories (name, type, user_username, is_default) VALUES ('Alimentación', 'Gasto', 'ana', 1);
+"""
+
+def create_baseline(path, transactions):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany("""
+    INSERT INTO transactions (id, user_username, category_id, date, amount, type, details, created_at)
+    VALUES (?, 'ana', 1, ?, ?, 'Gasto', ?, '2026-01-01 12:00:00')
+    """, transactions)
+    conn.commit()
+    conn.close()
+
+@pytest.fixture
+def baseline_path(tmp_path):
+    db.close_all_connections()
+    db.DB_FILE = str(tmp_path / 'baseline.db')
+    yield db.DB_FILE
+    db.close_all_connections()
+
+def test_baseline_migrates_to_latest_version(baseline_path):
+    create_baseline(baseline_path, [
+        ('t1', '2024-03-07', 10.1, 'super iso'),
+        ('t2', '08/03/2024', 20.25, 'super dia primero'),
+        ('t3', '2024-03-09 00:00:00', 0.3, 'super timestamp'),
+        ('t4', '2023-12-31T18:45:00', 5, 'super fin de año'),
+    ])
+    conn = sqlite3.connect(baseline_path)
+    conn.execute("INSERT INTO expense_splits (transaction_id, user_username, amount) VALUES ('t2', 'beto', 10)")
+    conn.commit()
+    conn.close()
+
+    assert db.run_migrations() == db.SCHEMA_VERSION
+
+    conn = db.get_db_connection()
+    try:
+        assert db.get_schema_version(conn) == db.SCHEMA_VERSION
+        rows = {row['id']: (row['date'], row['amount_cents'], row['year'], row['month'])
+                for row in conn.execute("SELECT id, date, amount_cents, year, month FROM transactions")}
+        split = conn.execute("SELECT status, paid_amount FROM expense_splits").fetchone()
+    finally:
+        conn.close()
+    assert rows == {
+        't1': ('2024-03-07', 1010, 2024, 3),
+        't2': ('2024-03-08', 2025, 2024, 3),
+        't3': ('2024-03-09', 30, 2024, 3),
+        't4': ('2023-12-31', 500, 2023, 12),
+    }
+    assert tuple(split) == ('pending', 0)
+    assert db.get_monthly_totals('ana', 2024, 3)['Gasto'] == pytest.approx(30.65)
+    assert db.get_monthly_totals('ana', 2023, 12)['Gasto'] == pytest.approx(5)
+    assert set(db.search_transactions('ana', 'super')['id']) == {'t1', 't2', 't3', 't4'}
+    assert db.run_migrations() == 0
+
+def test_unparseable_dates_abort_the_migration(baseline_path):
+    create_baseline(baseline_path, [
+        ('t1', '2024-03-07', 10, 'bien'),
+        ('t2', 'marzo 2024', 20, 'mal'),
+        ('t3', '', 30, 'vacía'),
+    ])
+
+    with pytest.raises(ValueError) as error:
+        db.run_migrations()
+    assert "t2: 'marzo 2024'" in str(error.value)
+    assert "t3: ''" in str(error.value)
+
+    # Nada cambió: la base sigue en la versión 0 con los datos originales
+    db.close_all_connections()
+    conn = sqlite3.connect(baseline_path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+        assert dict(conn.execute("SELECT id, date FROM transactions")) == {
+            't1': '2024-03-07', 't2': 'marzo 2024', 't3': ''}
+    finally:
+        conn.close()
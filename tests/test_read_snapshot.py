@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+import database_enhanced as db
+
+@pytest.fixture
+def snapshot_db(fresh_db, user, monkeypatch):
+    monkeypatch.setattr(db, 'READ_SNAPSHOT_ENABLED', True)
+    monkeypatch.setattr(db, 'READ_SNAPSHOT_DEBOUNCE_S', 0.01)
+    return db
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timeout esperando al hilo de la copia"
+        time.sleep(0.01)
+
+def is_snapshot_connection(conn):
+    return conn.pool.uri
+
+def reads_from_snapshot():
+    conn = db.get_read_connection()
+    try:
+        return is_snapshot_connection(conn)
+    finally:
+        conn.close()
+
+def test_reads_use_the_file_until_the_first_copy(snapshot_db):
+    conn = db.get_read_connection()
+    assert not is_snapshot_connection(conn)
+    conn.close()
+
+    wait_for(lambda: db.get_read_snapshot_stats()['refreshes'] >= 1)
+    conn = db.get_read_connection()
+    try:
+        assert is_snapshot_connection(conn)
+        assert conn.execute("SELECT COUNT(*) FROM categories").fetchone()[0] > 0
+    finally:
+        conn.close()
+
+def test_reads_never_wait_for_a_refresh(snapshot_db):
+    db.get_read_connection().close()
+    snapshot = db.get_read_snapshot()
+    wait_for(lambda: snapshot.stats['refreshes'] >= 1)
+    snapshot.expire()
+
+    acquired = []
+    # Con una copia en curso (lock tomado) la lectura sigue con la copia vigente
+    with snapshot._refresh_lock:
+        reader = threading.Thread(target=lambda: acquired.append(db.get_read_connection()))
+        reader.start()
+        reader.join(timeout=2)
+        assert not reader.is_alive()
+    assert is_snapshot_connection(acquired[0])
+    acquired[0].close()
+
+def test_writer_reads_its_own_writes(snapshot_db, user):
+    db.get_read_connection().close()
+    wait_for(lambda: db.get_read_snapshot_stats()['refreshes'] >= 1)
+
+    for expected in range(1, 4):
+        db.add_transaction(user, 'Alimentación', 10, 'Gasto', '2024-03-01')
+        assert len(db.get_transactions_with_details(user)) == expected
+
+    wait_for(reads_from_snapshot)
+    assert len(db.get_transactions_with_details(user)) == 3
@@ -0,0 +1,35 @@
+import pytest
+
+import database_enhanced as db
+
+@pytest.fixture
+def transactions(user):
+    db.add_transaction(user, 'Alimentación', 1500, 'Gasto', '2024-03-01', 'Efectivo', details='Supermercado Día')
+    db.add_transaction(user, 'Sueldo', 90000, 'Ingreso', '2024-03-05', 'Transferencia', details='Plazo fijo')
+    return user
+
+def test_search_matches_prefixes_and_categories(transactions):
+    assert list(db.search_transactions(transactions, 'super')['details']) == ['Supermercado Día']
+    assert list(db.search_transactions(transactions, 'sueldo')['details']) == ['Plazo fijo']
+    assert list(db.search_transactions(transactions, '"plazo fijo"', min_amount=1000)['details']) == ['Plazo fijo']
+
+@pytest.mark.parametrize('text', ['', '   ', '?!', '""', None])
+def test_search_without_terms_keeps_the_ranked_columns(transactions, text):
+    ranked = db.search_transactions(transactions, 'super')
+    empty = db.search_transactions(transactions, text)
+    assert empty.empty
+    assert list(empty.columns) == list(ranked.columns)
+    assert 'rank' in empty.columns
+    assert empty['date'].dtype.kind == ranked['date'].dtype.kind == 'M'
+
+def test_search_index_follows_updates_and_deletes(transactions):
+    conn = db.get_db_connection()
+    try:
+        conn.execute("UPDATE transactions SET details = 'Verdulería' WHERE details = 'Supermercado Día'")
+        conn.execute("DELETE FROM transactions WHERE details = 'Plazo fijo'")
+        conn.commit()
+    finally:
+        conn.close()
+    assert db.search_transactions(transactions, 'super').empty
+    assert list(db.search_transactions(transactions, 'verdu')['details']) == ['Verdulería']
+    assert db.search_transactions(transactions, 'plazo').empty
@@ -0,0 +1,58 @@
+import pytest
+
+import database_enhanced as db
+import settlements
+
+HOUSEHOLD = ['ana', 'beto', 'caro']
+
+@pytest.fixture
+def household(user):
+    for username in HOUSEHOLD[1:]:
+        db.add_user_if_not_exists(username, username.title())
+    return db.create_expense_group('Casa', '', 'ana', HOUSEHOLD)
+
+def share(payer, amount, group_id, details):
+    db.add_shared_expense(payer, 'Alimentación', amount, '2024-03-01', details, group_id, 'equal',
+                          {username: amount / len(HOUSEHOLD) for username in HOUSEHOLD})
+
+def test_simplify_debts_settles_everyone():
+    net = {'ana': 9000, 'beto': -3000, 'caro': -5000, 'dani': -1000}
+    transfers = settlements.simplify_debts(net)
+    assert len(transfers) == 3
+    for payer, receiver, cents in transfers:
+        net[payer] += cents
+        net[receiver] -= cents
+    assert set(net.values()) == {0}
+
+def test_net_pair_balances_offsets_cross_debts():
+    pairs = settlements.net_pair_balances([('ana', 'beto', 30.0, 1), ('beto', 'ana', 10.0, 1)])
+    assert pairs == {('ana', 'beto'): 2000}
+
+def test_plan_for_the_household(household):
+    share('ana', 300, household, 'super')
+    share('beto', 150, household, 'verdulería')
+    plan = settlements.get_settlement_plan(usernames=HOUSEHOLD)
+    assert plan['net'].set_index('username')['balance'].to_dict() == {'caro': -150.0, 'ana': 150.0}
+    assert plan['transfers'].values.tolist() == [['caro', 'ana', 150.0]]
+
+def test_settle_only_the_confirmed_plan(household):
+    share('ana', 300, household, 'super')
+    plan = settlements.get_settlement_plan(usernames=HOUSEHOLD)
+    # Gasto agregado después de que el usuario vio el plan
+    share('beto', 90, household, 'farmacia')
+
+    affected = db.settle_all_splits(usernames=HOUSEHOLD, max_split_id=plan['max_split_id'])
+
+    assert affected == {'ana', 'beto', 'caro'}
+    assert db.get_pending_balances(usernames=HOUSEHOLD) == [('ana', 'beto', 30.0, 1), ('caro', 'beto', 30.0, 1)]
+
+def test_partial_payment_covers_oldest_splits_first(household):
+    share('ana', 30, household, 'primero')
+    share('ana', 60, household, 'segundo')
+
+    updated, affected = db.update_splits_status('partial', username='beto', counterparty='ana', partial_amount=15)
+
+    assert (updated, affected) == (2, {'ana', 'beto'})
+    pending = db.get_pending_splits_for_user('beto').set_index('details')
+    assert 'primero' not in pending.index
+    assert pending.loc['segundo', 'outstanding'] == pytest.approx(15)
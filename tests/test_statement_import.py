@@ -0,0 +1,48 @@
+import io
+
+import statement_import
+
+def run_import(content, username, **kwargs):
+    kwargs.setdefault('default_expense_category', 'Alimentación')
+    kwargs.setdefault('default_income_category', 'Sueldo')
+    return statement_import.import_statement(io.BytesIO(content.encode('utf-8')), 'extracto.csv', username,
+                                             **kwargs)
+
+def test_parse_amount_without_digits_is_none():
+    assert statement_import.parse_amount('.') is None
+    assert statement_import.parse_amount(',') is None
+    assert statement_import.parse_amount('$ -') is None
+    assert statement_import.parse_amount('1.234,56') == 1234.56
+
+def test_amount_without_digits_is_reported_per_row(user):
+    result = run_import("fecha,monto,detalle\n2024-03-01,-100,super\n2024-03-02,.,roto\n2024-03-03,\",\",roto\n",
+                        user)
+    assert result['inserted'] == 1
+    assert [line for line, _ in result['errors']] == [3, 4]
+
+def test_extra_fields_without_details_column(user):
+    result = run_import("fecha,monto\n2024-03-01,-100,sobrante,otro\n2024-03-02,-50\n", user)
+    assert result['errors'] == []
+    assert result['inserted'] == 2
+
+def test_debit_and_credit_columns(user, fresh_db):
+    result = run_import("fecha;debito;credito;detalle\n01/03/2024;150,50;;super\n02/03/2024;;1000;sueldo\n", user)
+    assert result['inserted'] == 2
+    transactions = fresh_db.get_transactions_with_details(user).set_index('details')
+    assert transactions.loc['super', 'type'] == 'Gasto'
+    assert transactions.loc['super', 'amount'] == 150.5
+    assert transactions.loc['sueldo', 'type'] == 'Ingreso'
+
+def test_reimport_skips_duplicates(user):
+    content = "fecha,monto,detalle\n2024-03-01,-100,super\n2024-03-01,-100,super\n"
+    assert run_import(content, user)['inserted'] == 2
+    result = run_import(content, user)
+    assert result['inserted'] == 0
+    assert result['duplicates'] == 2
+
+def test_date_format_is_detected_per_file(user, fresh_db):
+    run_import("fecha,monto,detalle\n12/25/2024,-10,a\n05/03/2024,-5,b\n", user)
+    run_import("fecha,monto,detalle\n05/03/2024,-7,c\n", user)
+    dates = fresh_db.get_transactions_with_details(user).set_index('details')['date'].dt.strftime('%Y-%m-%d')
+    assert dates['b'] == '2024-05-03'
+    assert dates['c'] == '2024-03-05'
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+import database_enhanced as db
+
+def own_categories(username):
+    categories = db.get_data_as_dataframe('categories', username)
+    return categories[categories['user_username'] == username].reset_index(drop=True)
+
+def test_diff_dataframes_reports_only_changes():
+    original = pd.DataFrame({'id': [1, 2, 3], 'name': ['a', 'b', 'c'], 'type': ['Gasto'] * 3})
+    edited = pd.DataFrame({'id': [1, 2, None], 'name': ['a', 'B', 'd'], 'type': ['Gasto'] * 3})
+
+    inserts, updates, deletes = db.diff_dataframes(edited, original, ['name', 'type'])
+
+    assert inserts == [('d', 'Gasto')]
+    assert updates == [(2, ('B', 'Gasto'))]
+    assert deletes == [3]
+
+def test_sync_applies_inserts_updates_and_deletes(user):
+    original = own_categories(user)
+    edited = original.copy()
+    edited.loc[edited['name'] == 'Ropa', 'icon'] = '👗'
+    edited = edited[edited['name'] != 'Hogar']
+    edited = pd.concat([edited, pd.DataFrame([{'name': 'Mascotas', 'type': 'Gasto'}])], ignore_index=True)
+
+    assert db.sync_from_dataframe(edited, 'categories', original, user) == {
+        'inserted': 1, 'updated': 1, 'deleted': 1}
+
+    names = own_categories(user).set_index('name')
+    assert 'Hogar' not in names.index
+    assert names.loc['Ropa', 'icon'] == '👗'
+    assert db.get_name_id_map('categories', user)['Mascotas'] == names.loc['Mascotas', 'id']
+
+def test_sync_without_changes_does_not_write(user):
+    original = own_categories(user)
+    assert db.sync_from_dataframe(original.copy(), 'categories', original, user) == {
+        'inserted': 0, 'updated': 0, 'deleted': 0}
+
+def test_sync_rejects_deleting_a_category_in_use(user):
+    db.add_transaction(user, 'Hogar', 100, 'Gasto', '2024-03-01')
+    original = own_categories(user)
+
+    with pytest.raises(ValueError):
+        db.sync_from_dataframe(original[original['name'] != 'Hogar'], 'categories', original, user)
+    assert 'Hogar' in set(own_categories(user)['name'])
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+import database_enhanced as db
+
+@pytest.fixture
+def write_queue(fresh_db, monkeypatch):
+    queue = db.WriteQueue()
+    monkeypatch.setattr(db, 'WRITE_TIMEOUT_S', 0.2)
+    return queue
+
+def block_writer(queue):
+    """Ocupa el hilo escritor hasta que se libere el evento que retorna."""
+    started, release = threading.Event(), threading.Event()
+
+    def blocking_write(cursor):
+        started.set()
+        release.wait(5)
+    queue.submit(blocking_write)
+    assert started.wait(5)
+    return release
+
+def create_table(cursor, name):
+    cursor.execute(f"CREATE TABLE {name} (value INTEGER)")
+    return name
+
+def table_exists(name):
+    conn = db.get_db_connection()
+    try:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+    finally:
+        conn.close()
+
+def test_timed_out_write_is_cancelled(write_queue):
+    release = block_writer(write_queue)
+    with pytest.raises(TimeoutError):
+        write_queue.run(create_table, 'never_written')
+    release.set()
+
+    # El lote siguiente ya no la incluye
+    assert write_queue.run(create_table, 'written_after') == 'written_after'
+    assert not table_exists('never_written')
+    assert table_exists('written_after')
+
+def test_started_write_is_awaited_past_the_timeout(write_queue):
+    release = threading.Event()
+
+    def slow_write(cursor):
+        release.wait(5)
+        return create_table(cursor, 'slow')
+    threading.Timer(0.4, release.set).start()
+
+    assert write_queue.run(slow_write) == 'slow'
+    assert table_exists('slow')
+
+def test_failed_write_only_rolls_back_itself(write_queue):
+    release = block_writer(write_queue)
+    # Las tres quedan en el mismo lote; la del medio falla
+    futures = [write_queue.submit(create_table, name) for name in ('first', 'first', 'third')]
+    release.set()
+
+    assert futures[0].result(5) == 'first'
+    with pytest.raises(Exception):
+        futures[1].result(5)
+    assert futures[2].result(5) == 'third'
+    assert table_exists('first') and table_exists('third')
+    assert write_queue.stats['errors'] == 1